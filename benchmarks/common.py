@@ -0,0 +1,149 @@
+import glob
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Callable, List
+
+DIRECTORY_MIGRATIONS = "db/migrations"
+
+WORDS = [
+    "chicken",
+    "beef",
+    "pork",
+    "tofu",
+    "salmon",
+    "prawn",
+    "garlic",
+    "onion",
+    "ginger",
+    "lemon",
+    "lime",
+    "butter",
+    "cream",
+    "cheese",
+    "parmesan",
+    "basil",
+    "parsley",
+    "thyme",
+    "rosemary",
+    "chilli",
+    "paprika",
+    "cumin",
+    "rice",
+    "pasta",
+    "noodle",
+    "potato",
+    "carrot",
+    "mushroom",
+    "spinach",
+    "tomato",
+    "pepper",
+    "bean",
+    "lentil",
+    "chickpea",
+    "coconut",
+    "yogurt",
+    "honey",
+    "mustard",
+    "vinegar",
+    "flour",
+    "sugar",
+    "egg",
+    "milk",
+    "stock",
+    "roast",
+    "stew",
+    "curry",
+    "salad",
+    "soup",
+    "pie",
+    "bake",
+    "grill",
+    "fry",
+    "braise",
+]
+
+
+def create_database(path: str) -> sqlite3.Connection:
+    # apply the dbmate "up" sections so benchmarks see the real schema
+    connection = sqlite3.connect(path)
+    for migration in sorted(glob.glob(os.path.join(DIRECTORY_MIGRATIONS, "*.sql"))):
+        with open(migration, "r") as reader:
+            up = reader.read().split("-- migrate:up", 1)[1].split("-- migrate:down", 1)[0]
+        connection.executescript(up)
+    connection.commit()
+    return connection
+
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "zi", "ba", "de", "fu", "gi", "ho"]
+
+
+def vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = set(WORDS)
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def populate(connection: sqlite3.Connection, count: int, seed: int = 42):
+    rng = random.Random(seed)
+    words = vocabulary(rng, 5000)
+    # zipf-like weights so a few words are common and most are rare, like real recipes
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    rng.shuffle(words)
+
+    def sentence(n: int) -> str:
+        return " ".join(rng.choices(words, cum_weights=weights, k=n))
+
+    rows = [
+        (
+            sentence(3).capitalize(),
+            sentence(20),
+            "\n".join(sentence(12) for _ in range(6)),
+            "\n".join(f"{rng.randint(1, 500)}g {sentence(2)}" for _ in range(10)),
+            f"https://example.com/recipes/{i}",
+            "",
+        )
+        for i in range(count)
+    ]
+    connection.executemany(
+        """
+        INSERT INTO
+            recipes (name, description, directions, ingredients, source, image)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    connection.commit()
+
+
+def temporary_database(count: int) -> str:
+    directory = tempfile.mkdtemp(prefix="hngr-bench-")
+    path = os.path.join(directory, f"recipes-{count}.db")
+    connection = create_database(path)
+    populate(connection, count)
+    connection.close()
+    return path
+
+
+def remove_database(path: str):
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
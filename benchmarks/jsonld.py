@@ -0,0 +1,49 @@
+import argparse
+import glob
+import time
+import tracemalloc
+from typing import Callable
+
+from bs4 import BeautifulSoup
+
+from hngr.jsonld import extract_json_ld
+
+from .common import percentile
+
+
+def full_tree(data: str):
+    # what the parsers did before: build the whole document to read a few script tags
+    soup = BeautifulSoup(data, "html.parser")
+    return [s.text for s in soup.find_all("script", {"type": "application/ld+json"})]
+
+
+def profile(fn: Callable[[str], object], data: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return percentile(timings, 50), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare json-ld extraction with a full parse")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    for path in sorted(glob.glob("mocks/*.html")):
+        with open(path, "r") as reader:
+            data = reader.read()
+        for label, fn in [("full tree", full_tree), ("json-ld scan", extract_json_ld)]:
+            median, peak = profile(fn, data, args.repeat)
+            print(
+                f"{path:<24} {label:<13} "
+                f"p50={median * 1000:9.3f}ms peak={peak / 1024 / 1024:7.2f}MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
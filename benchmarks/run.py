@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from typing import Callable, Dict, List
+
+from .common import percentile, remove_database, temporary_database
+
+Results = Dict[str, Dict[str, float]]
+
+PARSERS = [
+    ("DelishParser", "mocks/delish.html"),
+    ("BbcgoodfoodParser", "mocks/bbcgoodfood.html"),
+    ("KruokaParser", "mocks/kruoka.html"),
+    ("SchemaParser", "mocks/bbcgoodfood.html"),
+    ("SchemaParser", "mocks/kruoka.html"),
+]
+SEARCH_TERMS = ["chicken", "garl", "lemon butter", "coconut curry", "par"]
+PARSE_BATCH = 32
+
+
+def profile(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    # memory is traced in a separate call, tracing slows the timed ones down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops_per_second": len(timings) / sum(timings),
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def bench_parsers(repeat: int) -> Results:
+    from hngr import parsers
+    from hngr.loaders import FileLoader
+
+    results = {}
+    for name, path in PARSERS:
+        parser = getattr(parsers, name)(url=path, loader=FileLoader)
+        results[f"parsers/{name}/{os.path.basename(path)}"] = profile(parser.parse, repeat)
+    return results
+
+
+def bench_parse_pool(repeat: int) -> Results:
+    # the same batch of pages parsed by threads and by worker processes, per worker count
+    from concurrent.futures import ThreadPoolExecutor
+    from hngr import parsers
+    from hngr.loaders import FileLoader
+    from hngr.parsepool import ParsePool
+
+    pages = [(name, path, FileLoader.load(path)) for name, path in PARSERS]
+    batch = [pages[i % len(pages)] for i in range(PARSE_BATCH)]
+
+    def parse_page(name: str, url: str, data: str):
+        return getattr(parsers, name)(url, FileLoader).parse_data(data)
+
+    # a batch is many parses, fewer rounds are enough
+    repeat = max(3, repeat // 10)
+
+    results = {}
+    for workers in worker_counts():
+        pool = ParsePool(workers=workers)
+        pool.start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as threads:
+
+                def in_threads():
+                    return list(threads.map(lambda page: parse_page(*page), batch))
+
+                def in_processes():
+                    return list(threads.map(lambda page: pool.parse(*page), batch))
+
+                for name, fn in [("threads", in_threads), ("processes", in_processes)]:
+                    result = profile(fn, repeat)
+                    result["pages_per_second"] = result["ops_per_second"] * PARSE_BATCH
+                    results[f"parse_pool/{name}/{workers}"] = result
+        finally:
+            pool.stop()
+
+    for name, result in results.items():
+        print(f"{name:<48} {result['pages_per_second']:10.1f} pages/s")
+    return results
+
+
+def worker_counts() -> List[int]:
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    return counts if counts[-1] == cores else counts + [cores]
+
+
+def bench_db(size: int, repeat: int) -> Results:
+    from hngr.db import (
+        Connection,
+        create_recipe,
+        delete_recipe,
+        encode_cursor,
+        list_recipes,
+        list_recipes_page,
+        retrieve_recipe,
+        retrieve_recipe_version,
+        search_recipes,
+    )
+    from hngr.schemes import NewRecipe
+
+    path = temporary_database(size)
+    connection = Connection(path)
+    connection.open()
+    rng = random.Random(size)
+    middle = list_recipes(connection)[size // 2]
+    terms = iter(SEARCH_TERMS * repeat * 2)
+    new_recipe = NewRecipe(
+        name="Benchmark recipe",
+        description="",
+        directions="",
+        ingredients="",
+        source="",
+        image="",
+    )
+
+    def create_and_delete():
+        delete_recipe(connection, create_recipe(connection, new_recipe))
+
+    operations = {
+        "list_recipes_page/first": lambda: list_recipes_page(connection, None, 50),
+        "list_recipes_page/middle": lambda: list_recipes_page(
+            connection, encode_cursor(middle), 50
+        ),
+        "retrieve_recipe": lambda: retrieve_recipe(connection, rng.randint(1, size)),
+        "retrieve_recipe_version": lambda: retrieve_recipe_version(
+            connection, rng.randint(1, size)
+        ),
+        "search_recipes": lambda: search_recipes(connection, next(terms)),
+        "create_and_delete_recipe": create_and_delete,
+    }
+    try:
+        return {
+            f"db/{size}/{name}": profile(operation, repeat)
+            for name, operation in operations.items()
+        }
+    finally:
+        connection.close()
+        remove_database(path)
+
+
+def bench_routes(size: int, repeat: int) -> Results:
+    path = temporary_database(size)
+    # the app reads its database from the environment when it is imported
+    os.environ["DB"] = path
+    from fastapi.testclient import TestClient
+    from hngr import main
+
+    client = TestClient(main.app)
+    etag = client.get("/recipe/1").headers["etag"]
+    cursor = client.get("/api/recipes").json()["next"]
+
+    def uncached_recipe():
+        main.render_cache.clear()
+        return client.get("/recipe/1")
+
+    requests = {
+        "index": lambda: client.get("/"),
+        "recipe": lambda: client.get("/recipe/1"),
+        "recipe/uncached": uncached_recipe,
+        "recipe/not_modified": lambda: client.get("/recipe/1", headers={"If-None-Match": etag}),
+        "api/recipes": lambda: client.get("/api/recipes"),
+        "api/recipes/cursor": lambda: client.get("/api/recipes", params={"cursor": cursor}),
+        "search": lambda: client.post("/search", data={"term": "chicken"}),
+        "api/recipes/bundle": lambda: client.get(
+            "/api/recipes/bundle", params={"ids": ",".join(str(i) for i in range(1, 51))}
+        ),
+    }
+    try:
+        return {
+            f"routes/{size}/{name}": profile(request, repeat) for name, request in requests.items()
+        }
+    finally:
+        main.pool.close()
+        remove_database(path)
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous:
+            print(f"{name:<48} new")
+            continue
+        changes = []
+        for metric in ["p50_ms", "p95_ms", "peak_kib"]:
+            ratio = result[metric] / previous[metric] if previous[metric] else 1
+            if ratio > 1 + threshold:
+                changes.append(f"{metric} {ratio:.2f}x")
+        print(f"{name:<48} p50 {result['p50_ms'] / previous['p50_ms']:.2f}x {' '.join(changes)}")
+        if changes:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark parsers, database and routes")
+    parser.add_argument("--suites", nargs="+", default=["parsers", "parse_pool", "db", "routes"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--routes-size", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown")
+    args = parser.parse_args()
+
+    results: Results = {}
+    if "parsers" in args.suites:
+        results.update(bench_parsers(args.repeat))
+    if "parse_pool" in args.suites:
+        results.update(bench_parse_pool(args.repeat))
+    if "db" in args.suites:
+        for size in args.sizes:
+            results.update(bench_db(size, args.repeat))
+    if "routes" in args.suites:
+        results.update(bench_routes(args.routes_size, args.repeat))
+
+    for name, result in results.items():
+        print(
+            f"{name:<48} {result['ops_per_second']:10.1f}/s "
+            f"p50={result['p50_ms']:8.3f}ms p95={result['p95_ms']:8.3f}ms "
+            f"p99={result['p99_ms']:8.3f}ms peak={result['peak_kib']:9.1f}KiB"
+        )
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.baseline if args.save_baseline else args.output
+    with open(output, "w") as writer:
+        json.dump(report, writer, indent=2)
+    print(f"saved results to {output}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, "r") as reader:
+        baseline = json.load(reader)["results"]
+    print(f"compared with {args.baseline}, threshold {args.threshold:.0%}")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+
+from hngr.db import Connection, search_recipes
+
+from .common import measure, percentile, remove_database, temporary_database
+
+TERMS = ["chicken", "garl", "lemon butter", "coconut curry", "par"]
+
+
+def like_scan(connection: Connection, term: str):
+    assert connection.connection
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT id, name FROM recipes WHERE name LIKE ?", [f"%{term}%"])
+    return cursor.fetchall()
+
+
+def like_scan_all(connection: Connection, term: str):
+    assert connection.connection
+    cursor = connection.connection.cursor()
+    pattern = f"%{term}%"
+    cursor.execute(
+        """
+        SELECT id, name FROM recipes
+        WHERE name LIKE ? OR description LIKE ? OR ingredients LIKE ? OR directions LIKE ?
+        """,
+        [pattern] * 4,
+    )
+    return cursor.fetchall()
+
+
+def run(size: int, repeat: int):
+    path = temporary_database(size)
+    connection = Connection(path)
+    connection.open()
+    for label, fn in [
+        ("like (name)", like_scan),
+        ("like (all)", like_scan_all),
+        ("fts5", search_recipes),
+    ]:
+        timings = []
+        for term in TERMS:
+            timings += measure(lambda: fn(connection, term), repeat)
+        print(
+            f"{size:>7} {label:<11} "
+            f"p50={percentile(timings, 50) * 1000:8.3f}ms "
+            f"p95={percentile(timings, 95) * 1000:8.3f}ms"
+        )
+    connection.close()
+    remove_database(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare LIKE scan with the fts5 index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
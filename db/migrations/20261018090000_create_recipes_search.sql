@@ -0,0 +1,37 @@
+-- migrate:up
+CREATE VIRTUAL TABLE recipes_search USING fts5(
+    name,
+    description,
+    ingredients,
+    directions,
+    content='recipes',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER recipes_search_insert AFTER INSERT ON recipes BEGIN
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
+
+CREATE TRIGGER recipes_search_delete AFTER DELETE ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+END;
+
+CREATE TRIGGER recipes_search_update AFTER UPDATE ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
+
+-- backfill recipes that existed before the index
+INSERT INTO recipes_search (recipes_search) VALUES ('rebuild');
+
+-- migrate:down
+DROP TRIGGER recipes_search_update;
+DROP TRIGGER recipes_search_delete;
+DROP TRIGGER recipes_search_insert;
+DROP TABLE recipes_search;
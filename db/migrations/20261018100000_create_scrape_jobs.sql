@@ -0,0 +1,16 @@
+-- migrate:up
+CREATE TABLE scrape_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    link TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    recipe_id INTEGER,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX scrape_jobs_status ON scrape_jobs (status);
+
+-- migrate:down
+DROP INDEX scrape_jobs_status;
+DROP TABLE scrape_jobs;
@@ -0,0 +1,5 @@
+-- migrate:up
+CREATE INDEX recipes_name_id ON recipes (name, id);
+
+-- migrate:down
+DROP INDEX recipes_name_id;
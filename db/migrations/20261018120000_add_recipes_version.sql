@@ -0,0 +1,17 @@
+-- migrate:up
+ALTER TABLE recipes ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE recipes ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00';
+UPDATE recipes SET updated_at = CURRENT_TIMESTAMP;
+
+-- a single row bumped on every write, validates the recipe lists
+CREATE TABLE recipes_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+INSERT INTO recipes_revision (id, revision, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP);
+
+-- migrate:down
+DROP TABLE recipes_revision;
+ALTER TABLE recipes DROP COLUMN updated_at;
+ALTER TABLE recipes DROP COLUMN version;
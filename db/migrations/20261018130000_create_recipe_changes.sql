@@ -0,0 +1,15 @@
+-- migrate:up
+-- one row per recipe holding the revision of its latest change, deleted rows are tombstones
+CREATE TABLE recipe_changes (
+    recipe_id INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP NOT NULL
+);
+CREATE INDEX recipe_changes_revision ON recipe_changes (revision);
+INSERT INTO recipe_changes (recipe_id, revision, changed_at)
+    SELECT id, (SELECT revision FROM recipes_revision WHERE id = 1), updated_at FROM recipes;
+
+-- migrate:down
+DROP INDEX recipe_changes_revision;
+DROP TABLE recipe_changes;
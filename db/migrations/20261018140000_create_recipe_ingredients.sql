@@ -0,0 +1,21 @@
+-- migrate:up
+-- ingredient lines parsed by hngr.ingredients, existing recipes are backfilled on startup
+CREATE TABLE recipe_ingredients (
+    id INTEGER PRIMARY KEY,
+    recipe_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    quantity REAL,
+    unit TEXT,
+    item TEXT NOT NULL,
+    head TEXT NOT NULL
+);
+CREATE INDEX recipe_ingredients_recipe_id ON recipe_ingredients (recipe_id);
+CREATE INDEX recipe_ingredients_item ON recipe_ingredients (item, recipe_id);
+CREATE INDEX recipe_ingredients_head ON recipe_ingredients (head, recipe_id);
+
+-- migrate:down
+DROP INDEX recipe_ingredients_head;
+DROP INDEX recipe_ingredients_item;
+DROP INDEX recipe_ingredients_recipe_id;
+DROP TABLE recipe_ingredients;
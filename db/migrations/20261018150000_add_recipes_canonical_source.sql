@@ -0,0 +1,10 @@
+-- migrate:up
+-- hngr.urls.canonical_url of the source, existing recipes are backfilled on startup
+ALTER TABLE recipes ADD COLUMN canonical_source TEXT;
+UPDATE recipes SET canonical_source = '' WHERE source = '';
+CREATE UNIQUE INDEX recipes_canonical_source ON recipes (canonical_source)
+WHERE canonical_source != '';
+
+-- migrate:down
+DROP INDEX recipes_canonical_source;
+ALTER TABLE recipes DROP COLUMN canonical_source;
@@ -0,0 +1,10 @@
+-- migrate:up
+-- set by hngr.images once the image is stored locally, an empty hash marks a failed fetch
+ALTER TABLE recipes ADD COLUMN image_hash TEXT;
+ALTER TABLE recipes ADD COLUMN image_width INTEGER;
+ALTER TABLE recipes ADD COLUMN image_height INTEGER;
+
+-- migrate:down
+ALTER TABLE recipes DROP COLUMN image_height;
+ALTER TABLE recipes DROP COLUMN image_width;
+ALTER TABLE recipes DROP COLUMN image_hash;
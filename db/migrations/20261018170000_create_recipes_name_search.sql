@@ -0,0 +1,31 @@
+-- migrate:up
+-- every three characters of the name, so mid-word matches use an index instead of LIKE '%term%'
+CREATE VIRTUAL TABLE recipes_name_search USING fts5(
+    name,
+    content='recipes',
+    content_rowid='id',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER recipes_name_search_insert AFTER INSERT ON recipes BEGIN
+    INSERT INTO recipes_name_search (rowid, name) VALUES (new.id, new.name);
+END;
+
+CREATE TRIGGER recipes_name_search_delete AFTER DELETE ON recipes BEGIN
+    INSERT INTO recipes_name_search (recipes_name_search, rowid, name)
+    VALUES ('delete', old.id, old.name);
+END;
+
+CREATE TRIGGER recipes_name_search_update AFTER UPDATE OF name ON recipes BEGIN
+    INSERT INTO recipes_name_search (recipes_name_search, rowid, name)
+    VALUES ('delete', old.id, old.name);
+    INSERT INTO recipes_name_search (rowid, name) VALUES (new.id, new.name);
+END;
+
+INSERT INTO recipes_name_search (recipes_name_search) VALUES ('rebuild');
+
+-- migrate:down
+DROP TRIGGER recipes_name_search_update;
+DROP TRIGGER recipes_name_search_delete;
+DROP TRIGGER recipes_name_search_insert;
+DROP TABLE recipes_name_search;
@@ -0,0 +1,19 @@
+-- migrate:up
+-- version, image and canonical source updates leave the indexed columns alone
+DROP TRIGGER recipes_search_update;
+CREATE TRIGGER recipes_search_update
+AFTER UPDATE OF name, description, ingredients, directions ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
+
+-- migrate:down
+DROP TRIGGER recipes_search_update;
+CREATE TRIGGER recipes_search_update AFTER UPDATE ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
@@ -7,7 +7,108 @@ CREATE TABLE recipes (
     ingredients TEXT NOT NULL,
     source TEXT NOT NULL,
     image TEXT
+, version INTEGER NOT NULL DEFAULT 1, updated_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00', canonical_source TEXT, image_hash TEXT, image_width INTEGER, image_height INTEGER);
+CREATE VIRTUAL TABLE recipes_search USING fts5(
+    name,
+    description,
+    ingredients,
+    directions,
+    content='recipes',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+/* recipes_search(name,description,ingredients,directions) */;
+CREATE TABLE IF NOT EXISTS 'recipes_search_data'(id INTEGER PRIMARY KEY, block BLOB);
+CREATE TABLE IF NOT EXISTS 'recipes_search_idx'(segid, term, pgno, PRIMARY KEY(segid, term)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS 'recipes_search_docsize'(id INTEGER PRIMARY KEY, sz BLOB);
+CREATE TABLE IF NOT EXISTS 'recipes_search_config'(k PRIMARY KEY, v) WITHOUT ROWID;
+CREATE TRIGGER recipes_search_insert AFTER INSERT ON recipes BEGIN
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
+CREATE TRIGGER recipes_search_delete AFTER DELETE ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+END;
+CREATE TABLE scrape_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    link TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    recipe_id INTEGER,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX scrape_jobs_status ON scrape_jobs (status);
+CREATE INDEX recipes_name_id ON recipes (name, id);
+CREATE TABLE recipes_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+CREATE TABLE recipe_changes (
+    recipe_id INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP NOT NULL
+);
+CREATE INDEX recipe_changes_revision ON recipe_changes (revision);
+CREATE TABLE recipe_ingredients (
+    id INTEGER PRIMARY KEY,
+    recipe_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    quantity REAL,
+    unit TEXT,
+    item TEXT NOT NULL,
+    head TEXT NOT NULL
 );
+CREATE INDEX recipe_ingredients_recipe_id ON recipe_ingredients (recipe_id);
+CREATE INDEX recipe_ingredients_item ON recipe_ingredients (item, recipe_id);
+CREATE INDEX recipe_ingredients_head ON recipe_ingredients (head, recipe_id);
+CREATE UNIQUE INDEX recipes_canonical_source ON recipes (canonical_source)
+WHERE canonical_source != '';
+CREATE VIRTUAL TABLE recipes_name_search USING fts5(
+    name,
+    content='recipes',
+    content_rowid='id',
+    tokenize='trigram'
+)
+/* recipes_name_search(name) */;
+CREATE TABLE IF NOT EXISTS 'recipes_name_search_data'(id INTEGER PRIMARY KEY, block BLOB);
+CREATE TABLE IF NOT EXISTS 'recipes_name_search_idx'(segid, term, pgno, PRIMARY KEY(segid, term)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS 'recipes_name_search_docsize'(id INTEGER PRIMARY KEY, sz BLOB);
+CREATE TABLE IF NOT EXISTS 'recipes_name_search_config'(k PRIMARY KEY, v) WITHOUT ROWID;
+CREATE TRIGGER recipes_name_search_insert AFTER INSERT ON recipes BEGIN
+    INSERT INTO recipes_name_search (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER recipes_name_search_delete AFTER DELETE ON recipes BEGIN
+    INSERT INTO recipes_name_search (recipes_name_search, rowid, name)
+    VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER recipes_name_search_update AFTER UPDATE OF name ON recipes BEGIN
+    INSERT INTO recipes_name_search (recipes_name_search, rowid, name)
+    VALUES ('delete', old.id, old.name);
+    INSERT INTO recipes_name_search (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER recipes_search_update
+AFTER UPDATE OF name, description, ingredients, directions ON recipes BEGIN
+    INSERT INTO recipes_search (recipes_search, rowid, name, description, ingredients, directions)
+    VALUES ('delete', old.id, old.name, old.description, old.ingredients, old.directions);
+    INSERT INTO recipes_search (rowid, name, description, ingredients, directions)
+    VALUES (new.id, new.name, new.description, new.ingredients, new.directions);
+END;
 -- Dbmate schema migrations
 INSERT INTO "schema_migrations" (version) VALUES
-  ('20240816163836');
+  ('20240816163836'),
+  ('20261018090000'),
+  ('20261018100000'),
+  ('20261018110000'),
+  ('20261018120000'),
+  ('20261018130000'),
+  ('20261018140000'),
+  ('20261018150000'),
+  ('20261018160000'),
+  ('20261018170000'),
+  ('20261018180000');
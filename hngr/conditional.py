@@ -0,0 +1,61 @@
+import os
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def http_date(timestamp: str) -> str:
+    # sqlite CURRENT_TIMESTAMP is utc without a zone
+    moment = datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+    return format_datetime(moment, usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: str) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        # stored copies are fine but have to be revalidated every time
+        "Cache-Control": "no-cache",
+    }
+
+
+def is_not_modified(request: Request, etag: str, last_modified: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when the client sent an etag
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    modified = datetime.fromisoformat(last_modified).replace(tzinfo=timezone.utc)
+    return modified <= since
+
+
+def not_modified(etag: str, last_modified: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def templates_version(directory: str) -> str:
+    # part of every html etag so a deploy with changed templates invalidates stored pages
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as reader:
+                digest.update(name.encode("utf-8"))
+                digest.update(reader.read())
+    return digest.hexdigest()[:12]
@@ -1,20 +1,77 @@
+import re
+import json
+import base64
 import sqlite3
 import logging
-from typing import List
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
 
-from .schemes import NewRecipe, Recipe, RecipeListItem
-from .exceptions import DatabaseConnectionClosed
+from .schemes import (
+    IngredientMatch,
+    NewRecipe,
+    Recipe,
+    RecipeChanges,
+    RecipeListItem,
+    ScrapeJob,
+    Version,
+)
+from .exceptions import DatabaseBusy, DatabaseConnectionClosed, DuplicateRecipe
+from .metrics import instrumented
+from .profiler import profiled
+from .ingredients import canonical_item, parse_ingredients
+from .urls import canonical_url
+
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+]
+
+SEARCH_LIMIT = 50
+RECIPE_FIELDS = [
+    "id",
+    "name",
+    "description",
+    "directions",
+    "ingredients",
+    "source",
+    "image",
+    "version",
+    "updated_at",
+    "image_hash",
+    "image_width",
+    "image_height",
+]
+
+T = TypeVar("T")
+
+# called with the recipe id on every create, update and delete
+change_listeners: List[Callable[[int], None]] = []
 
 
 class Connection:
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, readonly: bool = False):
         self.url = url
+        self.readonly = readonly
         self.connection = None
 
     def open(self):
         logging.info(f"connecting to {self.url}")
-        self.connection = sqlite3.connect(self.url)
+        # pooled connections are handed out to whichever thread checks them out
+        self.connection = sqlite3.connect(self.url, check_same_thread=False)
+        for pragma in PRAGMAS:
+            self.connection.execute(pragma)
+        if self.readonly:
+            self.connection.execute("PRAGMA query_only = ON")
 
     def close(self):
         logging.info(f"closing connection to {self.url}")
@@ -23,42 +80,341 @@ class Connection:
             self.connection = None
 
 
+class ConnectionPool:
+
+    def __init__(self, url: str, size: int = 4, max_queued: int = 100):
+        self.url = url
+        self.size = size
+        self.max_queued = max_queued
+        self._readers: queue.LifoQueue[Connection] = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(size)
+        self._writer: Connection | None = None
+        self._write_lock = threading.Lock()
+        self._executors: Dict[bool, ThreadPoolExecutor] = {}
+        self._executors_lock = threading.Lock()
+        # calls running or waiting per executor, the executor queue itself is unbounded
+        self._slots = {
+            True: threading.BoundedSemaphore(max_queued),
+            False: threading.BoundedSemaphore(max_queued),
+        }
+
+    def open(self):
+        logging.info(f"opening pool of {self.size} connections to {self.url}")
+        with self._write_lock:
+            self._writer = self._writer or self._connect(readonly=False)
+        while self._readers.qsize() < self.size:
+            self._readers.put(self._connect(readonly=True))
+
+    def close(self):
+        logging.info(f"closing pool to {self.url}")
+        with self._executors_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+
+    @contextmanager
+    def reader(self) -> Iterator[Connection]:
+        with self._available:
+            try:
+                connection = self._readers.get_nowait()
+            except queue.Empty:
+                connection = self._connect(readonly=True)
+            try:
+                yield connection
+            finally:
+                self._readers.put(connection)
+
+    @contextmanager
+    def writer(self) -> Iterator[Connection]:
+        with self._write_lock:
+            if not self._writer:
+                self._writer = self._connect(readonly=False)
+            try:
+                yield self._writer
+            finally:
+                if self._writer.connection and self._writer.connection.in_transaction:
+                    self._writer.connection.rollback()
+
+    async def read(self, fn: Callable[..., T], *args) -> T:
+        def call():
+            with self.reader() as connection:
+                return fn(connection, *args)
+
+        return await self._run(call, readonly=True)
+
+    async def write(self, fn: Callable[..., T], *args) -> T:
+        def call():
+            with self.writer() as connection:
+                return fn(connection, *args)
+
+        return await self._run(call, readonly=False)
+
+    async def _run(self, call: Callable[[], T], readonly: bool) -> T:
+        # one thread per reader and a single writer thread, so a query waiting for a
+        # connection queues up as a coroutine instead of blocking the event loop
+        with self._executors_lock:
+            executor = self._executors.get(readonly)
+            if not executor:
+                executor = ThreadPoolExecutor(
+                    max_workers=self.size if readonly else 1,
+                    thread_name_prefix="db-reader" if readonly else "db-writer",
+                )
+                self._executors[readonly] = executor
+        slots = self._slots[readonly]
+        if not slots.acquire(blocking=False):
+            raise DatabaseBusy(retry_after=1)
+        try:
+            future = executor.submit(profiled(call))
+        except Exception as e:
+            slots.release()
+            raise e
+        # released when the call finishes, a cancelled caller does not stop the thread
+        future.add_done_callback(lambda _: slots.release())
+        return await asyncio.wrap_future(future)
+
+    def _connect(self, readonly: bool) -> Connection:
+        connection = Connection(url=self.url, readonly=readonly)
+        connection.open()
+        return connection
+
+
+@instrumented
 def create_recipe(connection: Connection, new_recipe: NewRecipe):
     logging.info("about to create new recipe")
     if not connection.connection:
         raise DatabaseConnectionClosed()
 
     cursor = connection.connection.cursor()
+    try:
+        recipe_id = insert_recipe(cursor, new_recipe)
+    except DuplicateRecipe as e:
+        # the ignored insert still opened a write transaction
+        connection.connection.rollback()
+        raise e
+
+    connection.connection.commit()
+    return recipe_id
 
-    if new_recipe.source:
-        cursor.execute("SELECT id FROM recipes WHERE source = ?", [new_recipe.source])
-        recipe = cursor.fetchone()
-        if recipe:
-            raise ValueError(f"recipe with source {new_recipe.source} already exists")
 
+async def acreate_recipe(pool: ConnectionPool, new_recipe: NewRecipe) -> int:
+    return await pool.write(create_recipe, new_recipe)
+
+
+@instrumented
+def create_recipes(connection: Connection, new_recipes: List[NewRecipe]) -> List[int | None]:
+    logging.info(f"about to create {len(new_recipes)} recipes")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    recipe_ids: List[int | None] = []
+    for new_recipe in new_recipes:
+        try:
+            recipe_ids.append(insert_recipe(cursor, new_recipe))
+        except DuplicateRecipe:
+            recipe_ids.append(None)
+
+    connection.connection.commit()
+    return recipe_ids
+
+
+def insert_recipe(cursor: sqlite3.Cursor, new_recipe: NewRecipe) -> int:
+    # the unique index decides, no separate lookup that a concurrent insert could race
     cursor.execute(
         """
             INSERT INTO
-                recipes (name, description, directions, ingredients, source, image)
+                recipes (
+                    name, description, directions, ingredients, source, image, updated_at,
+                    canonical_source
+                )
             VALUES (
-                :name, :description, :directions, :ingredients, :source, :image
-            );
+                :name, :description, :directions, :ingredients, :source, :image, CURRENT_TIMESTAMP,
+                :canonical_source
+            )
+            ON CONFLICT (canonical_source) WHERE canonical_source != '' DO NOTHING
+            RETURNING
+                id;
             """,
-        new_recipe.__dict__,
+        {**new_recipe.__dict__, "canonical_source": canonical_url(new_recipe.source)},
+    )
+    data = cursor.fetchone()
+    if not data:
+        raise DuplicateRecipe(new_recipe.source)
+    recipe_id = data[0]
+    store_ingredients(cursor, recipe_id, new_recipe.ingredients)
+    record_change(cursor, recipe_id)
+    return recipe_id
+
+
+def store_ingredients(cursor: sqlite3.Cursor, recipe_id: int, ingredients: str):
+    cursor.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", [recipe_id])
+    cursor.executemany(
+        """
+        INSERT INTO
+            recipe_ingredients (recipe_id, position, line, quantity, unit, item, head)
+        VALUES
+            (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                recipe_id,
+                position,
+                ingredient.line,
+                ingredient.quantity,
+                ingredient.unit,
+                ingredient.item,
+                ingredient.item.rsplit(" ", 1)[-1],
+            )
+            for position, ingredient in enumerate(parse_ingredients(ingredients))
+        ],
     )
-    recipe_id = cursor.lastrowid
 
+
+@instrumented
+def retrieve_recipe_id_by_source(connection: Connection, source: str) -> int | None:
+    logging.info(f"about to look up recipe with source {source}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    key = canonical_url(source)
+    if not key:
+        return None
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT id FROM recipes WHERE canonical_source = ?", [key])
+    data = cursor.fetchone()
+    return data[0] if data else None
+
+
+@instrumented
+def backfill_canonical_sources(connection: Connection) -> int:
+    logging.info("about to backfill canonical recipe sources")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT id, source FROM recipes WHERE canonical_source IS NULL ORDER BY id")
+    recipes = cursor.fetchall()
+    for recipe_id, source in recipes:
+        try:
+            cursor.execute(
+                "UPDATE recipes SET canonical_source = ? WHERE id = ?",
+                [canonical_url(source), recipe_id],
+            )
+        except sqlite3.IntegrityError:
+            # saved before sources were canonical, the oldest recipe keeps the source
+            logging.warning(f"recipe {recipe_id} duplicates source {source}")
+            cursor.execute("UPDATE recipes SET canonical_source = '' WHERE id = ?", [recipe_id])
     connection.connection.commit()
-    return recipe_id
+    return len(recipes)
+
+
+@instrumented
+def backfill_ingredients(connection: Connection, batch_size: int = 500) -> int:
+    logging.info("about to backfill recipe ingredients")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    count = 0
+    last_id = 0
+    while True:
+        cursor.execute(
+            """
+            SELECT
+                id, ingredients
+            FROM
+                recipes
+            WHERE
+                id > ?
+                AND trim(ingredients) != ''
+                AND NOT EXISTS (SELECT 1 FROM recipe_ingredients WHERE recipe_id = recipes.id)
+            ORDER BY
+                id ASC
+            LIMIT
+                ?
+            """,
+            [last_id, batch_size],
+        )
+        recipes = cursor.fetchall()
+        if not recipes:
+            break
+        for recipe_id, ingredients in recipes:
+            store_ingredients(cursor, recipe_id, ingredients)
+        connection.connection.commit()
+        count += len(recipes)
+        last_id = recipes[-1][0]
+    return count
+
+
+def record_change(cursor: sqlite3.Cursor, recipe_id: int, deleted: bool = False):
+    cursor.execute(
+        """
+        UPDATE
+            recipes_revision
+        SET
+            revision = revision + 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE
+            id = 1
+        RETURNING
+            revision
+        """
+    )
+    revision = cursor.fetchone()[0]
+    # later changes of the same recipe replace the row, so the log never outgrows the recipes
+    cursor.execute(
+        """
+        INSERT INTO
+            recipe_changes (recipe_id, revision, deleted, changed_at)
+        VALUES
+            (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (recipe_id) DO UPDATE SET
+            revision = excluded.revision,
+            deleted = excluded.deleted,
+            changed_at = excluded.changed_at
+        """,
+        [recipe_id, revision, deleted],
+    )
+    for listener in change_listeners:
+        listener(recipe_id)
 
 
-def list_recipes(connection: Connection) -> List[RecipeListItem]:
+@instrumented
+def list_recipes(
+    connection: Connection, after: Tuple[str, int] | None = None, limit: int = -1
+) -> List[RecipeListItem]:
     logging.info(f"about to list recipes")
     if not connection.connection:
         raise DatabaseConnectionClosed()
 
     cursor = connection.connection.cursor()
-    cursor.execute("SELECT id, name FROM recipes ORDER BY name ASC;")
+    if after:
+        # keyset pagination, walks the (name, id) index from the last seen row
+        cursor.execute(
+            """
+            SELECT
+                id, name
+            FROM
+                recipes
+            WHERE
+                (name, id) > (?, ?)
+            ORDER BY
+                name ASC, id ASC
+            LIMIT ?
+            """,
+            [after[0], after[1], limit],
+        )
+    else:
+        cursor.execute("SELECT id, name FROM recipes ORDER BY name ASC, id ASC LIMIT ?;", [limit])
     data = cursor.fetchall()
 
     if not data:
@@ -67,6 +423,94 @@ def list_recipes(connection: Connection) -> List[RecipeListItem]:
     return [RecipeListItem(id=d[0], name=d[1]) for d in data]
 
 
+async def alist_recipes(
+    pool: ConnectionPool, after: Tuple[str, int] | None = None, limit: int = -1
+) -> List[RecipeListItem]:
+    return await pool.read(list_recipes, after, limit)
+
+
+async def alist_recipes_page(
+    pool: ConnectionPool, cursor: str | None, limit: int
+) -> Tuple[List[RecipeListItem], str | None]:
+    return await pool.read(list_recipes_page, cursor, limit)
+
+
+@instrumented
+def list_recipes_page(
+    connection: Connection, cursor: str | None, limit: int
+) -> Tuple[List[RecipeListItem], str | None]:
+    after = decode_cursor(cursor) if cursor else None
+    recipes = list_recipes(connection, after=after, limit=limit + 1)
+    if len(recipes) <= limit:
+        return recipes, None
+    recipes = recipes[:limit]
+    return recipes, encode_cursor(recipes[-1])
+
+
+@instrumented
+def list_recipe_fields_page(
+    connection: Connection, cursor: str | None, limit: int, fields: List[str]
+) -> Tuple[List[Dict[str, Any]], str | None]:
+    logging.info(f"about to list recipe fields {fields}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    after = decode_cursor(cursor) if cursor else None
+    # name and id follow the projection, the cursor needs them even when they were not asked for
+    query = f"SELECT {recipe_columns(fields)}, name, id FROM recipes"
+    parameters: List[Any] = []
+    if after:
+        query += " WHERE (name, id) > (?, ?)"
+        parameters += [after[0], after[1]]
+    query += " ORDER BY name ASC, id ASC LIMIT ?"
+    parameters.append(limit + 1)
+    rows = connection.connection.cursor().execute(query, parameters).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(RecipeListItem(name=rows[-1][-2], id=rows[-1][-1]))
+    return [dict(zip(fields, row)) for row in rows], next_cursor
+
+
+@instrumented
+def retrieve_recipe_fields(
+    connection: Connection, recipe_id: int, fields: List[str]
+) -> Dict[str, Any] | None:
+    logging.info(f"about to retrieve fields {fields} of recipe {recipe_id}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute(f"SELECT {recipe_columns(fields)} FROM recipes WHERE id = ?", [recipe_id])
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(fields, row))
+
+
+def recipe_columns(fields: List[str]) -> str:
+    # the names end up in the query, only known columns get there
+    unknown = [field for field in fields if field not in RECIPE_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f"unknown recipe fields {','.join(unknown)}")
+    return ", ".join(fields)
+
+
+def encode_cursor(recipe: RecipeListItem) -> str:
+    data = json.dumps([recipe.name, recipe.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        name, recipe_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(name), int(recipe_id)
+    except Exception:
+        raise ValueError(f"invalid cursor {cursor}")
+
+
+@instrumented
 def retrieve_recipe(connection: Connection, recipe_id: int) -> Recipe | None:
     logging.info(f"about to retrieve recipe {recipe_id}")
     if not connection.connection:
@@ -76,7 +520,8 @@ def retrieve_recipe(connection: Connection, recipe_id: int) -> Recipe | None:
     cursor.execute(
         """
             SELECT
-                id, name, description, directions, ingredients, source, image
+                id, name, description, directions, ingredients, source, image, version, updated_at,
+                image_hash, image_width, image_height
             FROM
                 recipes
             WHERE
@@ -89,6 +534,51 @@ def retrieve_recipe(connection: Connection, recipe_id: int) -> Recipe | None:
     if not recipe_data:
         return None
 
+    return recipe_from_row(recipe_data)
+
+
+async def aretrieve_recipe(pool: ConnectionPool, recipe_id: int) -> Recipe | None:
+    return await pool.read(retrieve_recipe, recipe_id)
+
+
+@instrumented
+def retrieve_recipes(
+    connection: Connection,
+    recipe_ids: List[int] | None = None,
+    after: int = 0,
+    limit: int = -1,
+) -> List[Recipe]:
+    logging.info(f"about to retrieve recipes after {after}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    # one keyset query per batch instead of a lookup per recipe
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        """
+        SELECT
+            id, name, description, directions, ingredients, source, image, version, updated_at,
+            image_hash, image_width, image_height
+        FROM
+            recipes
+        WHERE
+            id > :after
+            AND (:ids IS NULL OR id IN (SELECT value FROM json_each(:ids)))
+        ORDER BY
+            id ASC
+        LIMIT
+            :limit
+        """,
+        {
+            "after": after,
+            "ids": json.dumps(recipe_ids) if recipe_ids is not None else None,
+            "limit": limit,
+        },
+    )
+    return [recipe_from_row(recipe_data) for recipe_data in cursor.fetchall()]
+
+
+def recipe_from_row(recipe_data: tuple) -> Recipe:
     return Recipe(
         id=recipe_data[0],
         name=recipe_data[1],
@@ -97,9 +587,89 @@ def retrieve_recipe(connection: Connection, recipe_id: int) -> Recipe | None:
         ingredients=recipe_data[4],
         source=recipe_data[5],
         image=recipe_data[6],
+        version=recipe_data[7],
+        updated_at=recipe_data[8],
+        image_hash=recipe_data[9],
+        image_width=recipe_data[10],
+        image_height=recipe_data[11],
+    )
+
+
+@instrumented
+def retrieve_recipe_version(connection: Connection, recipe_id: int) -> Version | None:
+    logging.info(f"about to retrieve version of recipe {recipe_id}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT version, updated_at FROM recipes WHERE id = ?", [recipe_id])
+    data = cursor.fetchone()
+    if not data:
+        return None
+    return Version(version=data[0], updated_at=data[1])
+
+
+@instrumented
+def retrieve_pending_image(connection: Connection, recipe_id: int) -> str | None:
+    logging.info(f"about to retrieve pending image of recipe {recipe_id}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        "SELECT image FROM recipes WHERE id = ? AND image_hash IS NULL AND image != ''",
+        [recipe_id],
+    )
+    data = cursor.fetchone()
+    return data[0] if data else None
+
+
+@instrumented
+def retrieve_revision(connection: Connection) -> Version:
+    logging.info("about to retrieve recipes revision")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT revision, updated_at FROM recipes_revision WHERE id = 1")
+    data = cursor.fetchone()
+    return Version(version=data[0], updated_at=data[1])
+
+
+@instrumented
+def list_recipe_changes(connection: Connection, since: int) -> RecipeChanges:
+    logging.info(f"about to list recipe changes since {since}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    cursor.execute("SELECT revision FROM recipes_revision WHERE id = 1")
+    revision = cursor.fetchone()[0]
+    # a token from the future belongs to another database, the client has to start over
+    reset = since > revision
+    if reset:
+        since = 0
+    # changes committed after the revision was read are left for the next sync
+    cursor.execute(
+        """
+        SELECT
+            recipe_id, deleted
+        FROM
+            recipe_changes
+        WHERE
+            revision > ? AND revision <= ?
+        ORDER BY
+            revision ASC
+        """,
+        [since, revision],
     )
+    changes = RecipeChanges(updated=[], deleted=[], next=revision, reset=reset)
+    for recipe_id, deleted in cursor.fetchall():
+        (changes.deleted if deleted else changes.updated).append(recipe_id)
+    return changes
 
 
+@instrumented
 def update_recipe(connection: Connection, recipe: Recipe) -> Recipe:
     logging.info(f"about to update recipe {recipe.id}")
 
@@ -115,16 +685,74 @@ def update_recipe(connection: Connection, recipe: Recipe) -> Recipe:
             name = :name,
             description = :description,
             directions = :directions,
-            ingredients = :ingredients
+            ingredients = :ingredients,
+            version = version + 1,
+            updated_at = CURRENT_TIMESTAMP
         WHERE
             id = :id
+        RETURNING
+            version, updated_at
         """,
         recipe.__dict__,
     )
+    data = cursor.fetchone()
+    if data:
+        recipe.version, recipe.updated_at = data
+        store_ingredients(cursor, recipe.id, recipe.ingredients)
+        record_change(cursor, recipe.id)
     connection.connection.commit()
     return recipe
 
 
+async def aupdate_recipe(pool: ConnectionPool, recipe: Recipe) -> Recipe:
+    return await pool.write(update_recipe, recipe)
+
+
+@instrumented
+def update_recipe_image(
+    connection: Connection,
+    recipe_id: int,
+    image: str,
+    image_hash: str,
+    width: int | None = None,
+    height: int | None = None,
+) -> bool:
+    logging.info(f"about to update image of recipe {recipe_id}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    cursor = connection.connection.cursor()
+    if not image_hash:
+        # the page still shows the remote image, so the version stays
+        cursor.execute(
+            "UPDATE recipes SET image_hash = '' WHERE id = ? AND image = ?", [recipe_id, image]
+        )
+        connection.connection.commit()
+        return cursor.rowcount > 0
+
+    cursor.execute(
+        """
+        UPDATE
+            recipes
+        SET
+            image_hash = ?,
+            image_width = ?,
+            image_height = ?,
+            version = version + 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE
+            id = ? AND image = ?
+        """,
+        [image_hash, width, height, recipe_id, image],
+    )
+    is_updated = cursor.rowcount > 0
+    if is_updated:
+        record_change(cursor, recipe_id)
+    connection.connection.commit()
+    return is_updated
+
+
+@instrumented
 def delete_recipe(connection: Connection, recipe_id: int) -> int:
     logging.info(f"about to delete recipe {recipe_id}")
     if not connection.connection:
@@ -139,28 +767,233 @@ def delete_recipe(connection: Connection, recipe_id: int) -> int:
         """,
         [recipe_id],
     )
+    is_deleted = cursor.rowcount > 0
+    if is_deleted:
+        cursor.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", [recipe_id])
+        record_change(cursor, recipe_id, deleted=True)
     connection.connection.commit()
-    return cursor.rowcount > 0
+    return is_deleted
+
+
+async def adelete_recipe(pool: ConnectionPool, recipe_id: int) -> int:
+    return await pool.write(delete_recipe, recipe_id)
 
 
-def search_recipes(connection: Connection, term: str) -> List[RecipeListItem]:
+@instrumented
+def search_recipes(
+    connection: Connection, term: str, limit: int = SEARCH_LIMIT
+) -> List[RecipeListItem]:
     logging.info(f"looking for recipes with term: {term}")
     if not connection.connection:
         raise DatabaseConnectionClosed()
     cursor = connection.connection.cursor()
+    query = search_query(term)
+    data = []
+    if query:
+        cursor.execute(
+            """
+            SELECT
+                recipes.id, recipes.name
+            FROM
+                recipes_search
+            JOIN
+                recipes ON recipes.id = recipes_search.rowid
+            WHERE
+                recipes_search MATCH ?
+            ORDER BY
+                bm25(recipes_search, 10.0, 2.0, 1.0, 1.0)
+            LIMIT ?
+            """,
+            [query, limit],
+        )
+        data = cursor.fetchall()
+    name_query = name_search_query(term)
+    if not data and name_query:
+        # the index only matches from the start of a word, keep mid-word name matches working
+        cursor.execute(
+            """
+            SELECT
+                recipes.id, recipes.name
+            FROM
+                recipes_name_search
+            JOIN
+                recipes ON recipes.id = recipes_name_search.rowid
+            WHERE
+                recipes_name_search MATCH ?
+            LIMIT ?
+            """,
+            [name_query, limit],
+        )
+        data = cursor.fetchall()
+    return [RecipeListItem(id=d[0], name=d[1]) for d in data]
+
+
+async def asearch_recipes(
+    pool: ConnectionPool, term: str, limit: int = SEARCH_LIMIT
+) -> List[RecipeListItem]:
+    return await pool.read(search_recipes, term, limit)
+
+
+@instrumented
+def rank_recipes_by_ingredients(
+    connection: Connection, items: List[str], limit: int = SEARCH_LIMIT
+) -> List[IngredientMatch]:
+    logging.info(f"looking for recipes with ingredients: {items}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+
+    terms = sorted({canonical_item(item) for item in items} - {""})
+    if not terms:
+        return []
+    # each term hits the item and head indexes: "onion", "onion ring" or "red onion"
+    cursor = connection.connection.cursor()
     cursor.execute(
         """
-                   SELECT
-                       id, name
-                   FROM
-                       recipes
-                   WHERE
-                       name
-                   LIKE ?
-                   """,
-        [f"%{term}%"],
+        WITH
+            terms (term) AS (SELECT value FROM json_each(:terms)),
+            matches (recipe_id, term) AS (
+                SELECT recipe_id, term FROM terms
+                JOIN recipe_ingredients ON item = term
+                UNION
+                SELECT recipe_id, term FROM terms
+                JOIN recipe_ingredients ON item > term || ' ' AND item < term || '!'
+                UNION
+                SELECT recipe_id, term FROM terms
+                JOIN recipe_ingredients ON head = term
+            ),
+            ranked (recipe_id, matched) AS (
+                SELECT recipe_id, COUNT(*) FROM matches GROUP BY recipe_id
+            )
+        SELECT
+            recipes.id,
+            recipes.name,
+            ranked.matched,
+            (SELECT COUNT(*) FROM recipe_ingredients WHERE recipe_id = recipes.id) AS total
+        FROM
+            ranked
+        JOIN
+            recipes ON recipes.id = ranked.recipe_id
+        ORDER BY
+            ranked.matched DESC, total ASC, recipes.name ASC
+        LIMIT
+            :limit
+        """,
+        {"terms": json.dumps(terms), "limit": limit},
     )
-    data = cursor.fetchall()
+    return [
+        IngredientMatch(id=row[0], name=row[1], matched=row[2], total=row[3])
+        for row in cursor.fetchall()
+    ]
+
+
+def search_query(term: str) -> str:
+    # every word becomes a quoted prefix token so user input can't inject fts5 syntax
+    words = re.findall(r"\w+", term)
+    return " ".join([f'"{word}"*' for word in words])
+
+
+def name_search_query(term: str) -> str:
+    # the whole term as one quoted trigram phrase, shorter terms have no trigram to look up
+    term = term.strip()
+    if len(term) < 3:
+        return ""
+    return '"' + term.replace('"', '""') + '"'
+
+
+@instrumented
+def rebuild_search_index(connection: Connection):
+    logging.info("about to rebuild search index")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+    connection.connection.execute("INSERT INTO recipes_search (recipes_search) VALUES ('rebuild')")
+    connection.connection.execute(
+        "INSERT INTO recipes_name_search (recipes_name_search) VALUES ('rebuild')"
+    )
+    connection.connection.commit()
+
+
+@instrumented
+def create_scrape_job(connection: Connection, link: str) -> int:
+    logging.info(f"about to create scrape job for {link}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+    cursor = connection.connection.cursor()
+    cursor.execute("INSERT INTO scrape_jobs (link) VALUES (?)", [link])
+    connection.connection.commit()
+    return cursor.lastrowid
+
+
+@instrumented
+def retrieve_scrape_job(connection: Connection, job_id: int) -> ScrapeJob | None:
+    logging.info(f"about to retrieve scrape job {job_id}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        """
+        SELECT
+            id, link, status, recipe_id, error
+        FROM
+            scrape_jobs
+        WHERE
+            id = ?
+        """,
+        [job_id],
+    )
+    data = cursor.fetchone()
     if not data:
-        return []
-    return [RecipeListItem(id=d[0], name=d[1]) for d in data]
+        return None
+    return ScrapeJob(id=data[0], link=data[1], status=data[2], recipe_id=data[3], error=data[4])
+
+
+@instrumented
+def list_unfinished_scrape_jobs(connection: Connection) -> List[ScrapeJob]:
+    logging.info("about to list unfinished scrape jobs")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        """
+        SELECT
+            id, link, status, recipe_id, error
+        FROM
+            scrape_jobs
+        WHERE
+            status IN ('queued', 'running')
+        ORDER BY
+            id ASC
+        """
+    )
+    return [
+        ScrapeJob(id=d[0], link=d[1], status=d[2], recipe_id=d[3], error=d[4])
+        for d in cursor.fetchall()
+    ]
+
+
+@instrumented
+def update_scrape_job(
+    connection: Connection,
+    job_id: int,
+    status: str,
+    recipe_id: int | None = None,
+    error: str | None = None,
+):
+    logging.info(f"about to mark scrape job {job_id} as {status}")
+    if not connection.connection:
+        raise DatabaseConnectionClosed()
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        """
+        UPDATE
+            scrape_jobs
+        SET
+            status = ?,
+            recipe_id = ?,
+            error = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE
+            id = ?
+        """,
+        [status, recipe_id, error, job_id],
+    )
+    connection.connection.commit()
@@ -5,3 +5,35 @@ class DatabaseConnectionClosed(Exception):
 
 class ParserException(Exception):
     pass
+
+
+class BrowserPoolSaturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("too many pages are being loaded, try again later")
+        self.retry_after = retry_after
+
+
+class ScrapeQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("too many recipes are waiting to be fetched, try again later")
+        self.retry_after = retry_after
+
+
+class ScrapeQueueStopped(Exception):
+    def __init__(self):
+        super().__init__("scrape queue is stopped")
+
+
+class DatabaseBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("too many database calls are waiting, try again later")
+        self.retry_after = retry_after
+
+
+class LoaderException(Exception):
+    pass
+
+
+class DuplicateRecipe(ValueError):
+    def __init__(self, source: str):
+        super().__init__(f"recipe with source {source} already exists")
@@ -0,0 +1,161 @@
+import io
+import os
+import re
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .db import ConnectionPool, update_recipe_image
+from .exceptions import LoaderException
+from .loaders import RequestLoader
+from .schemes import Recipe
+
+WIDTHS = [320, 640, 1280]
+QUALITY = 80
+EXTENSION = ".webp"
+NAME_PATTERN = re.compile(r"^[0-9a-f]{32}-\d+\.webp$")
+
+
+def variant_widths(width: int) -> List[int]:
+    # never upscaled, the largest variant is the original or the widest size
+    largest = min(width, WIDTHS[-1])
+    return [size for size in WIDTHS if size < largest] + [largest]
+
+
+def variant_name(image_hash: str, width: int) -> str:
+    return f"{image_hash}-{width}{EXTENSION}"
+
+
+def image_src(recipe: Recipe) -> str:
+    if not recipe.image_hash or not recipe.image_width:
+        return ""
+    return f"/images/{variant_name(recipe.image_hash, variant_widths(recipe.image_width)[-1])}"
+
+
+def image_srcset(recipe: Recipe) -> str:
+    if not recipe.image_hash or not recipe.image_width:
+        return ""
+    return ", ".join(
+        f"/images/{variant_name(recipe.image_hash, width)} {width}w"
+        for width in variant_widths(recipe.image_width)
+    )
+
+
+class ImageStore:
+
+    def __init__(self, directory: str, quality: int = QUALITY):
+        self.directory = directory
+        self.quality = quality
+
+    def save(self, data: bytes) -> Tuple[str, int, int]:
+        # named by content, an image shared by recipes or fetched again is encoded once
+        image_hash = hashlib.sha256(data).hexdigest()[:32]
+        os.makedirs(self.directory, exist_ok=True)
+        with Image.open(io.BytesIO(data)) as original:
+            # jpegs decode straight to a smaller scale that is still above the widest size
+            original.draft("RGB", (WIDTHS[-1], WIDTHS[-1]))
+            image = ImageOps.exif_transpose(original)
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+            width, height = image.size
+            for size in variant_widths(width):
+                path = os.path.join(self.directory, variant_name(image_hash, size))
+                if os.path.exists(path):
+                    continue
+                variant = image
+                if size != width:
+                    variant = image.resize(
+                        (size, max(1, round(height * size / width))), Image.Resampling.LANCZOS
+                    )
+                variant.save(path + ".tmp", "WEBP", quality=self.quality)
+                os.replace(path + ".tmp", path)
+        return image_hash, width, height
+
+    def path(self, name: str) -> str | None:
+        if not NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+class ImageQueue:
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        store: ImageStore,
+        workers: int = 2,
+        max_queued: int = 100,
+        retry_delay: float = 60,
+    ):
+        self.pool = pool
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retry_delay = retry_delay
+        self._executor: ThreadPoolExecutor | None = None
+        self._queued: Set[int] = set()
+        self._retry_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, recipe_id: int, image: str) -> bool:
+        # dropped when full or backing off, the next view of the recipe asks again
+        if urlparse(image).scheme not in ("http", "https"):
+            return False
+        with self._lock:
+            if recipe_id in self._queued or len(self._queued) >= self.max_queued:
+                return False
+            if self._retry_at.get(recipe_id, 0) > time.monotonic():
+                return False
+            self._retry_at.pop(recipe_id, None)
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="images"
+                )
+            self._queued.add(recipe_id)
+            self._executor.submit(self._run, recipe_id, image)
+        return True
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._queued.clear()
+            self._retry_at.clear()
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, recipe_id: int, image: str):
+        try:
+            image_hash, width, height = self._fetch(image)
+            with self.pool.writer() as connection:
+                update_recipe_image(connection, recipe_id, image, image_hash, width, height)
+        except Exception as e:
+            # transient, the next view of the recipe after retry_delay submits it again
+            logging.warning(f"could not fetch image of recipe {recipe_id}: {e}")
+            with self._lock:
+                self._retry_at[recipe_id] = time.monotonic() + self.retry_delay
+        finally:
+            with self._lock:
+                self._queued.discard(recipe_id)
+
+    def _fetch(self, image: str) -> Tuple[str, int | None, int | None]:
+        try:
+            data, content_type = RequestLoader.load_bytes(image)
+            if not content_type.startswith("image/"):
+                raise UnidentifiedImageError(f"{image} is {content_type or 'not an image'}")
+            return self.store.save(data)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500:
+                raise e
+            logging.warning(f"image {image} is not available: {e}")
+        except (LoaderException, UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logging.warning(f"image {image} is not usable: {e}")
+        # an empty hash keeps the remote image and stops further fetches
+        return "", None, None
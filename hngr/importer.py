@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+
+from .db import (
+    ConnectionPool,
+    backfill_canonical_sources,
+    create_recipes,
+    retrieve_recipe_id_by_source,
+)
+from .exceptions import ParserException
+from .jobs import parse_link
+from .metrics import SCRAPE_RESULTS
+from .parsepool import ParsePool
+from .parsers import ParserFactory
+from .profiler import profiled
+from .urls import canonical_url
+from .schemes import ImportReport, ImportResult, NewRecipe
+
+# import statuses as scrape outcomes
+OUTCOMES = {
+    "created": "success",
+    "duplicate": "duplicate",
+    "parse_error": "parser_error",
+    "error": "error",
+}
+
+
+def read_links(path: str) -> List[str]:
+    with open(path, "r") as reader:
+        content = reader.read()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        # plain text, one link per line
+        return [line.strip() for line in content.splitlines() if line.strip()]
+    return links_from_json(data)
+
+
+def links_from_json(data) -> List[str]:
+    if isinstance(data, str):
+        return [data]
+    if isinstance(data, list):
+        return [link for item in data for link in links_from_json(item)]
+    if isinstance(data, dict):
+        if "links" in data:
+            return links_from_json(data["links"])
+        # request files like requests/scrape.json keep the link in their variables
+        if "link" in data.get("variables", {}):
+            return links_from_json(data["variables"]["link"])
+    return []
+
+
+def import_links(
+    pool: ConnectionPool, links: List[str], parallelism: int = 4, batch_size: int = 20
+) -> ImportReport:
+    started = time.perf_counter()
+    results: List[ImportResult] = []
+    batch: List[Tuple[ImportResult, NewRecipe]] = []
+
+    def store(items: List[Tuple[ImportResult, NewRecipe]]):
+        with pool.writer() as connection:
+            recipe_ids = create_recipes(connection, [new_recipe for _, new_recipe in items])
+        for (result, _), recipe_id in zip(items, recipe_ids):
+            result.status = "created" if recipe_id else "duplicate"
+            result.recipe_id = recipe_id
+
+    def flush():
+        if not batch:
+            return
+        try:
+            store(batch)
+        except Exception as e:
+            # the failed batch is rolled back, one row at a time finds the links that broke it
+            logging.error(f"could not store {len(batch)} recipes at once: {e}")
+            for item in batch:
+                try:
+                    store([item])
+                except Exception as e:
+                    logging.error(e)
+                    item[0].status = "error"
+                    item[0].error = str(e)
+        batch.clear()
+
+    unique_links: List[str] = []
+    seen = set()
+    with pool.reader() as connection:
+        for link in links:
+            if canonical_url(link) in seen:
+                results.append(ImportResult(link=link, status="duplicate"))
+                continue
+            seen.add(canonical_url(link))
+            # known pages are skipped before they are loaded
+            recipe_id = retrieve_recipe_id_by_source(connection, link)
+            if recipe_id:
+                results.append(ImportResult(link=link, status="duplicate", recipe_id=recipe_id))
+            else:
+                unique_links.append(link)
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="import") as executor:
+        futures = {executor.submit(profiled(parse_link), link): link for link in unique_links}
+        for future in as_completed(futures):
+            result = ImportResult(link=futures[future], status="pending")
+            results.append(result)
+            try:
+                batch.append((result, future.result()))
+            except ParserException as e:
+                result.status = "parse_error"
+                result.error = str(e)
+            except Exception as e:
+                logging.error(e)
+                result.status = "error"
+                result.error = str(e)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+    for result in results:
+        SCRAPE_RESULTS.inc(OUTCOMES.get(result.status, "error"))
+
+    elapsed = time.perf_counter() - started
+    return ImportReport(
+        results=results,
+        elapsed=elapsed,
+        links_per_second=len(links) / elapsed if elapsed else 0,
+    )
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="import recipes from a list of links")
+    parser.add_argument("path", help="json list, request file or text file with one link per line")
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(url=os.environ.get("DB", ""))
+    if args.parse_workers > 0:
+        ParserFactory.pool = ParsePool(workers=args.parse_workers)
+        ParserFactory.pool.start()
+    try:
+        with pool.writer() as connection:
+            backfill_canonical_sources(connection)
+        report = import_links(
+            pool, read_links(args.path), parallelism=args.parallelism, batch_size=args.batch_size
+        )
+    finally:
+        pool.close()
+        if ParserFactory.pool:
+            ParserFactory.pool.stop()
+
+    for result in report.results:
+        print(f"{result.status:<12} {result.link} {result.error or result.recipe_id or ''}")
+    print(
+        f"{len(report.results)} links in {report.elapsed:.2f}s "
+        f"({report.links_per_second:.2f} links/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import re
+from typing import List
+
+from .schemes import Ingredient
+
+VULGAR_FRACTIONS = {"½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75, "⅛": 0.125}
+NUMBER = r"\d+(?:[.,]\d+)?"
+FRACTION = r"\d+/\d+"
+VULGAR = "".join(VULGAR_FRACTIONS)
+QUANTITY_PATTERN = re.compile(
+    rf"^(?P<quantity>{NUMBER}\s+{FRACTION}|{FRACTION}|{NUMBER}\s*[{VULGAR}]?|[{VULGAR}])"
+    rf"(?:\s*[-–]\s*(?:{FRACTION}|{NUMBER}))?\s*"
+)
+PARENTHESES_PATTERN = re.compile(r"\([^)]*\)")
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+
+UNITS = {
+    "g": "g",
+    "gram": "g",
+    "grams": "g",
+    "kg": "kg",
+    "mg": "mg",
+    "ml": "ml",
+    "cl": "cl",
+    "dl": "dl",
+    "l": "l",
+    "litre": "l",
+    "liter": "l",
+    "tbsp": "tbsp",
+    "tbs": "tbsp",
+    "tablespoon": "tbsp",
+    "tablespoons": "tbsp",
+    "tsp": "tsp",
+    "teaspoon": "tsp",
+    "teaspoons": "tsp",
+    "c": "cup",
+    "cup": "cup",
+    "cups": "cup",
+    "oz": "oz",
+    "ounce": "oz",
+    "ounces": "oz",
+    "lb": "lb",
+    "lbs": "lb",
+    "pound": "lb",
+    "pounds": "lb",
+    "pinch": "pinch",
+    "clove": "clove",
+    "cloves": "clove",
+    "can": "can",
+    "cans": "can",
+    "pack": "pack",
+    "packs": "pack",
+    "bunch": "bunch",
+    "handful": "handful",
+    "slice": "slice",
+    "slices": "slice",
+    "rkl": "rkl",
+    "tl": "tl",
+    "ps": "ps",
+    "pkt": "pkt",
+    "prk": "prk",
+    "kpl": "kpl",
+    "ripaus": "ripaus",
+}
+# words describing size, freshness or preparation instead of what the ingredient is
+DESCRIPTORS = {
+    "boneless",
+    "skinless",
+    "chopped",
+    "crushed",
+    "diced",
+    "extra-virgin",
+    "fine",
+    "finely",
+    "fresh",
+    "freshly",
+    "grated",
+    "ground",
+    "large",
+    "low-sodium",
+    "medium",
+    "minced",
+    "peeled",
+    "roughly",
+    "sliced",
+    "small",
+    "thinly",
+}
+# a comma followed by one of these starts the preparation notes
+PREPARATIONS = {
+    "at",
+    "beaten",
+    "chopped",
+    "crushed",
+    "cubed",
+    "cut",
+    "diced",
+    "divided",
+    "drained",
+    "finely",
+    "for",
+    "grated",
+    "halved",
+    "melted",
+    "minced",
+    "optional",
+    "peeled",
+    "plus",
+    "roughly",
+    "sliced",
+    "softened",
+    "thinly",
+    "to",
+}
+
+
+def parse_ingredients(ingredients: str) -> List[Ingredient]:
+    return [parse_ingredient(line) for line in ingredients.splitlines() if line.strip()]
+
+
+def parse_ingredient(line: str) -> Ingredient:
+    text = PARENTHESES_PATTERN.sub(" ", line).strip()
+    quantity = None
+    match = QUANTITY_PATTERN.match(text)
+    if match:
+        quantity = parse_quantity(match.group("quantity"))
+        text = text[match.end() :]
+
+    text = strip_preparation(text)
+    unit = None
+    words = [word.lower() for word in WORD_PATTERN.findall(text)]
+    while words and (words[0] in DESCRIPTORS or (not unit and words[0] in UNITS)):
+        word = words.pop(0)
+        if word in UNITS:
+            unit = UNITS[word]
+            if words and words[0] == "of":
+                words.pop(0)
+    return Ingredient(
+        line=line.strip(),
+        quantity=quantity,
+        unit=unit,
+        item=canonical_item(" ".join(words)),
+    )
+
+
+def parse_quantity(quantity: str) -> float:
+    total = 0.0
+    for part in quantity.replace(",", ".").split():
+        if part[-1] in VULGAR_FRACTIONS:
+            total += VULGAR_FRACTIONS[part[-1]]
+            part = part[:-1]
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            total += int(numerator) / int(denominator) if int(denominator) else 0
+        elif part:
+            total += float(part)
+    return total
+
+
+def strip_preparation(text: str) -> str:
+    parts = text.split(",")
+    for i, part in enumerate(parts[1:], start=1):
+        words = part.lower().split()
+        if words and words[0] in PREPARATIONS:
+            return " ".join(parts[:i])
+    return " ".join(parts)
+
+
+def canonical_item(item: str) -> str:
+    words = [
+        word
+        for word in WORD_PATTERN.findall(item.lower())
+        if word not in DESCRIPTORS and word not in UNITS
+    ]
+    if words:
+        words[-1] = singular(words[-1])
+    return " ".join(words)
+
+
+def singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
@@ -0,0 +1,201 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Tuple
+
+from .parsers import ParserFactory
+from .urls import clean_url
+from .db import (
+    Connection,
+    ConnectionPool,
+    create_recipe,
+    create_scrape_job,
+    list_unfinished_scrape_jobs,
+    retrieve_scrape_job,
+    update_scrape_job,
+)
+from .exceptions import (
+    BrowserPoolSaturated,
+    DuplicateRecipe,
+    LoaderException,
+    ParserException,
+    ScrapeQueueFull,
+    ScrapeQueueStopped,
+)
+from .images import ImageQueue
+from .metrics import SCRAPE_RESULTS
+from .profiler import Profiler, ProfileStore, current_profile
+from .schemes import NewRecipe, ScrapeJob
+
+
+class ScrapeQueue:
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        workers: int = 4,
+        max_queued: int = 100,
+        max_attempts: int = 5,
+        images: ImageQueue | None = None,
+    ):
+        self.pool = pool
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.images = images
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        with self._write_lock:
+            self._stopped = False
+        # jobs left queued or running by the previous process are picked up again
+        with self.pool.reader() as connection:
+            jobs = list_unfinished_scrape_jobs(connection)
+        logging.info(f"resuming {len(jobs)} scrape jobs")
+        for job in jobs:
+            self._reserve(limit=False)
+            self._submit(job.id, job.link)
+
+    def stop(self):
+        # waits for a write in progress, running jobs make no further writes after this
+        with self._write_lock:
+            self._stopped = True
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            # unfinished jobs stay in the table and are resumed on the next start
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, link: str) -> ScrapeJob:
+        self._reserve()
+        try:
+            with self.pool.writer() as connection:
+                job_id = create_scrape_job(connection, link)
+        except Exception as e:
+            self._release()
+            raise e
+        self._submit(job_id, link)
+        return ScrapeJob(id=job_id, link=link, status="queued")
+
+    async def asubmit(self, link: str) -> ScrapeJob:
+        self._reserve()
+        try:
+            job_id = await self.pool.write(create_scrape_job, link)
+        except BaseException as e:
+            # also released when the request is cancelled while waiting for the write
+            self._release()
+            raise e
+        # a profiled request also profiles the scrape it queued
+        self._submit(job_id, link, profile=current_profile.get())
+        return ScrapeJob(id=job_id, link=link, status="queued")
+
+    def retrieve(self, job_id: int) -> ScrapeJob | None:
+        with self.pool.reader() as connection:
+            return retrieve_scrape_job(connection, job_id)
+
+    async def aretrieve(self, job_id: int) -> ScrapeJob | None:
+        return await self.pool.read(retrieve_scrape_job, job_id)
+
+    def _reserve(self, limit: bool = True):
+        # taken before the job is created, so concurrent submits cannot overshoot max_queued
+        with self._lock:
+            if limit and self._pending >= self.max_queued:
+                raise ScrapeQueueFull(retry_after=self.workers)
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, job_id: int, link: str, profile: Tuple[ProfileStore, str] | None = None):
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="scrape"
+                )
+            future = self._executor.submit(self._run, job_id, link, profile)
+        # the reserved slot is also released for jobs cancelled by stop
+        future.add_done_callback(lambda _: self._release())
+
+    @contextmanager
+    def _writer(self) -> Iterator[Connection]:
+        # refused once stopped, the pool is closed next and would otherwise be reopened
+        with self._write_lock:
+            if self._stopped:
+                raise ScrapeQueueStopped()
+            with self.pool.writer() as connection:
+                yield connection
+
+    def _run(self, job_id: int, link: str, profile: Tuple[ProfileStore, str] | None = None):
+        profiler = None
+        if profile:
+            profiler = Profiler(interval=profile[0].interval, thread_ids={threading.get_ident()})
+            profiler.start()
+        try:
+            self._update(job_id, "running")
+            recipe_id = self._scrape(link)
+            self._update(job_id, "done", recipe_id=recipe_id)
+            SCRAPE_RESULTS.inc(scrape_outcome(None))
+        except ScrapeQueueStopped:
+            logging.info(f"scrape job {job_id} is left for the next start")
+        except (ValueError, ParserException, LoaderException, BrowserPoolSaturated) as e:
+            self._update(job_id, "failed", error=str(e))
+            SCRAPE_RESULTS.inc(scrape_outcome(e))
+        except Exception as e:
+            logging.error(e)
+            self._update(job_id, "failed", error=f"Internal server error: {str(e)}")
+            SCRAPE_RESULTS.inc(scrape_outcome(e))
+        finally:
+            if profile and profiler:
+                store, name = profile
+                store.save(f"{name}-job-{job_id}", profiler.stop())
+
+    def _scrape(self, link: str) -> int:
+        new_recipe = parse_link(link, max_attempts=self.max_attempts)
+        if not new_recipe:
+            raise Exception("something went wrong")
+        with self._writer() as connection:
+            recipe_id = create_recipe(connection, new_recipe)
+        if self.images:
+            # the job is done without waiting for the image
+            self.images.submit(recipe_id, new_recipe.image)
+        return recipe_id
+
+    def _update(
+        self, job_id: int, status: str, recipe_id: int | None = None, error: str | None = None
+    ):
+        try:
+            with self._writer() as connection:
+                update_scrape_job(connection, job_id, status, recipe_id=recipe_id, error=error)
+        except ScrapeQueueStopped:
+            # the job stays unfinished in the table and is resumed on the next start
+            logging.info(f"scrape job {job_id} could not be marked {status}, the queue is stopped")
+
+
+def parse_link(link: str, max_attempts: int = 5) -> NewRecipe:
+    attempt = 1
+    while True:
+        try:
+            return ParserFactory.get_parser(clean_url(link)).parse()
+        except BrowserPoolSaturated as e:
+            # callers already run in the background, so back off instead of failing
+            if attempt >= max_attempts:
+                raise e
+            attempt += 1
+            time.sleep(e.retry_after)
+
+
+def scrape_outcome(error: Exception | None) -> str:
+    if error is None:
+        return "success"
+    if isinstance(error, DuplicateRecipe):
+        return "duplicate"
+    if isinstance(error, ParserException):
+        return "parser_error"
+    return "error"
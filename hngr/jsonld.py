@@ -0,0 +1,98 @@
+import re
+import json
+from typing import List
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+SCRIPT_PATTERN = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL)
+TYPE_PATTERN = re.compile(r"""(?:^|\s)type\s*=\s*["']?\s*application/ld\+json""", re.IGNORECASE)
+ID_PATTERN = re.compile(r"""(?:^|\s)id\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+OPEN_PATTERN = re.compile(r"<script\b", re.IGNORECASE)
+
+
+def extract_json_ld(data: str, script_id: str | None = None) -> List[str]:
+    payloads = scan_json_ld(data, script_id)
+    if payloads or "ld+json" not in data:
+        return payloads
+    # markup the scan doesn't understand, let the html parser look at the script tags only
+    return parse_json_ld(data, script_id)
+
+
+def scan_json_ld(data: str, script_id: str | None = None) -> List[str]:
+    payloads = []
+    for match in SCRIPT_PATTERN.finditer(data):
+        attributes, payload = match.groups()
+        if not TYPE_PATTERN.search(attributes):
+            continue
+        if script_id is not None:
+            found = ID_PATTERN.search(attributes)
+            if not found or found.group(1) != script_id:
+                continue
+        payloads.append(payload)
+    return payloads
+
+
+def parse_json_ld(data: str, script_id: str | None = None) -> List[str]:
+    attributes = {"type": "application/ld+json"}
+    if script_id is not None:
+        attributes["id"] = script_id
+    strainer = SoupStrainer("script", attrs=attributes)
+    soup = BeautifulSoup(data, "html.parser", parse_only=strainer)
+    return [script.text for script in soup.find_all("script")]
+
+
+def find_recipe(payloads: List[str]) -> dict | None:
+    for payload in payloads:
+        recipe = find_recipe_in_payload(payload)
+        if recipe:
+            return recipe
+    return None
+
+
+def find_recipe_in_payload(payload: str) -> dict | None:
+    try:
+        json_data = json.loads(payload)
+    except ValueError:
+        return None
+    # a block may hold any json value, only objects and arrays can be or contain a recipe
+    if not isinstance(json_data, (dict, list)):
+        return None
+
+    data = json_data
+    if isinstance(json_data, dict) and "@graph" in json_data:
+        data = json_data["@graph"]
+    items = data if isinstance(data, list) else [data]
+    for item in items:
+        if isinstance(item, dict) and is_recipe(item):
+            return item
+    return None
+
+
+def is_recipe(item: dict) -> bool:
+    types = item.get("@type")
+    if isinstance(types, list):
+        return "Recipe" in types
+    return types == "Recipe"
+
+
+class RecipeScanner:
+    # looks for a recipe json-ld block while the page is still being downloaded
+
+    def __init__(self):
+        self.text = ""
+        self.recipe: dict | None = None
+        self._position = 0
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        for match in SCRIPT_PATTERN.finditer(self.text, self._position):
+            self._position = match.end()
+            attributes, payload = match.groups()
+            if TYPE_PATTERN.search(attributes):
+                self.recipe = find_recipe_in_payload(payload)
+                if self.recipe:
+                    return True
+        # the next chunk is scanned from the script that is still open, or the last few characters
+        opened = OPEN_PATTERN.search(self.text, self._position)
+        self._position = opened.start() if opened else max(self._position, len(self.text) - 8)
+        return False
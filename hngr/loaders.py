@@ -1,6 +1,51 @@
+import os
+import math
+import codecs
+import time
+import queue
+import logging
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
 import httpx
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import Browser, Playwright, Request, Route, sync_playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from .exceptions import BrowserPoolSaturated, LoaderException
+from .jsonld import RecipeScanner, extract_json_ld, find_recipe
+from .metrics import BROWSER_BLOCKED_REQUESTS, LOADER_STREAMS, LOADER_TIERS, record_fetch
+
+
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", 5))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", 20))
+MAX_DOWNLOAD_SIZE = int(os.environ.get("MAX_DOWNLOAD_SIZE", 10 * 1024 * 1024))
+BROWSER_TIMEOUT = float(os.environ.get("BROWSER_TIMEOUT", 15))
+MEMORY_CHECK_PAGES = 10
+WORKER_RESTART_DELAY = 1.0
+# nothing the recipe json-ld depends on
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+# scripts that add the json-ld after the load event get a short grace period
+RECIPE_LOAD_GRACE = 1.0
+# bot protection and challenge pages answer these, a real browser usually gets the page
+BROWSER_FALLBACK_STATUSES = {403, 429, 503}
+# true once a recipe json-ld is in the page or the load event is a grace period behind
+RECIPE_SCRIPT_CHECK = """
+(grace) => {
+  const scripts = document.querySelectorAll('script[type="application/ld+json"]');
+  if (Array.from(scripts).some(
+    (script) => /"@type"\\s*:\\s*(\\[[^\\]]*)?"Recipe"/.test(script.textContent),
+  )) {
+    return true;
+  }
+  const [navigation] = performance.getEntriesByType("navigation");
+  return Boolean(navigation && navigation.loadEventEnd)
+    && performance.now() - navigation.loadEventEnd > grace;
+}
+"""
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
 
 class Loader(ABC):
@@ -27,25 +72,460 @@ class TextLoader(Loader):
 
 
 class RequestLoader(Loader):
+    # shared by every load so connections to a host are kept alive and reused
+    client: httpx.Client | None = None
+    async_client: httpx.AsyncClient | None = None
+    _lock = threading.Lock()
 
     @staticmethod
     def load(source: str):
-        response = httpx.get(source)
-        return response.text
+        content, _ = RequestLoader.load_conditional(source)
+        return content or ""
+
+    @staticmethod
+    def load_conditional(
+        source: str, etag: str | None = None, last_modified: str | None = None
+    ) -> Tuple[str | None, httpx.Response]:
+        # returns no content when the server answers 304 to the given validators
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        with fetching(source) as download:
+            with RequestLoader.get_client().stream("GET", source, headers=headers) as response:
+                if response.status_code == 304:
+                    return None, response
+                read_body(response, download)
+                return decode(response, download.content()), response
+
+    @staticmethod
+    async def aload(source: str) -> str:
+        with fetching(source) as download:
+            async with RequestLoader.get_async_client().stream("GET", source) as response:
+                await aread_body(response, download)
+                return decode(response, download.content())
+
+    @staticmethod
+    def load_until_recipe(source: str) -> Tuple[str, bool]:
+        # stops reading once a recipe json-ld block is complete, the html after it is not needed
+        # returns the page up to that point and whether a recipe was seen
+        with fetching(source) as download:
+            with RequestLoader.get_client().stream("GET", source) as response:
+                # an error page is never the recipe, the caller decides whether to retry elsewhere
+                response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")("replace")
+                scanner = RecipeScanner()
+                if read_body(response, download, lambda chunk: scanner.feed(decoder.decode(chunk))):
+                    LOADER_STREAMS.inc("recipe")
+                    return scanner.text, True
+                scanner.feed(decoder.decode(b"", final=True))
+                LOADER_STREAMS.inc("full")
+                return scanner.text, False
+
+    @staticmethod
+    def load_bytes(source: str) -> Tuple[bytes, str]:
+        # raw content and its type, for images and other files that are not decoded
+        with fetching(source) as download:
+            with RequestLoader.get_client().stream("GET", source) as response:
+                response.raise_for_status()
+                read_body(response, download)
+                return download.content(), response.headers.get("content-type", "")
+
+    @staticmethod
+    def get_client() -> httpx.Client:
+        with RequestLoader._lock:
+            if not RequestLoader.client:
+                RequestLoader.client = httpx.Client(**client_options())
+            return RequestLoader.client
+
+    @staticmethod
+    def get_async_client() -> httpx.AsyncClient:
+        with RequestLoader._lock:
+            if not RequestLoader.async_client:
+                RequestLoader.async_client = httpx.AsyncClient(**client_options())
+            return RequestLoader.async_client
+
+    @staticmethod
+    def open():
+        RequestLoader.get_client()
+        RequestLoader.get_async_client()
+
+    @staticmethod
+    async def close():
+        if RequestLoader.client:
+            RequestLoader.client.close()
+            RequestLoader.client = None
+        if RequestLoader.async_client:
+            await RequestLoader.async_client.aclose()
+            RequestLoader.async_client = None
+
+
+class TieredLoader(Loader):
+    # most sites serve their recipe json-ld in the static html, the browser is the fallback
+
+    @staticmethod
+    def load(source: str) -> str:
+        try:
+            content, found = RequestLoader.load_until_recipe(source)
+            # the scan misses markup only the html parser understands
+            if found or has_recipe(content):
+                LOADER_TIERS.inc("http", "recipe")
+                return content
+            LOADER_TIERS.inc("http", "no_recipe")
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status not in BROWSER_FALLBACK_STATUSES:
+                LOADER_TIERS.inc("http", "bad_status")
+                raise LoaderException(f"{source} answered {status}")
+            logging.info(f"falling back to the browser for {source}: {e}")
+            LOADER_TIERS.inc("http", "blocked")
+        except LoaderException as e:
+            # a page too large to download is too large for the browser as well
+            LOADER_TIERS.inc("http", "too_large")
+            raise e
+        except httpx.HTTPError as e:
+            # unreachable or timed out, a browser would not load it either
+            LOADER_TIERS.inc("http", "error")
+            raise LoaderException(f"could not load {source}: {e}")
+        content = BrowserLoader.load(source)
+        LOADER_TIERS.inc("browser", "recipe" if has_recipe(content) else "no_recipe")
+        return content
+
+
+def has_recipe(content: str) -> bool:
+    return find_recipe(extract_json_ld(content)) is not None
+
+
+def client_options() -> dict:
+    return {
+        "http2": True,
+        "follow_redirects": True,
+        "headers": {"User-Agent": USER_AGENT},
+        "timeout": httpx.Timeout(DOWNLOAD_TIMEOUT, connect=CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=50, max_keepalive_connections=20, keepalive_expiry=30
+        ),
+    }
+
+
+class Download:
+    # the bytes read so far, counted for the fetch metrics even when the read fails
+
+    def __init__(self):
+        self.size = 0
+        self.chunks: List[bytes] = []
+
+    def add(self, response: httpx.Response, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > MAX_DOWNLOAD_SIZE:
+            raise download_too_large(response)
+        self.chunks.append(chunk)
+
+    def content(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+@contextmanager
+def fetching(source: str) -> Iterator[Download]:
+    started = time.perf_counter()
+    download = Download()
+    try:
+        yield download
+    finally:
+        record_fetch("RequestLoader", source, started, download.size)
+
+
+def read_body(
+    response: httpx.Response, download: Download, stop: Callable[[bytes], bool] | None = None
+) -> bool:
+    # every streamed load reads through here, true when stop ended the read early
+    check_content_length(response)
+    for chunk in response.iter_bytes():
+        download.add(response, chunk)
+        if stop and stop(chunk):
+            return True
+    return False
+
+
+async def aread_body(
+    response: httpx.Response, download: Download, stop: Callable[[bytes], bool] | None = None
+) -> bool:
+    check_content_length(response)
+    async for chunk in response.aiter_bytes():
+        download.add(response, chunk)
+        if stop and stop(chunk):
+            return True
+    return False
+
+
+def check_content_length(response: httpx.Response):
+    # a compressed body only grows when decoded, so the header alone can reject a page
+    length = response.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_DOWNLOAD_SIZE:
+        raise download_too_large(response)
+
+
+def download_too_large(response: httpx.Response) -> LoaderException:
+    return LoaderException(f"{response.url} is larger than {MAX_DOWNLOAD_SIZE} bytes")
+
+
+def decode(response: httpx.Response, content: bytes) -> str:
+    return content.decode(response.encoding or "utf-8", errors="replace")
 
 
 class BrowserLoader(Loader):
+    # set by the app on startup, without it every load launches its own browser
+    pool: "BrowserPool | None" = None
 
     @staticmethod
     def load(source: str) -> str:
+        started = time.perf_counter()
+        transferred = 0
+        try:
+            if BrowserLoader.pool:
+                content, transferred = BrowserLoader.pool.load(source)
+                return content
+            with sync_playwright() as p:
+                browser = launch_browser(p)
+                try:
+                    content, transferred = load_page(browser, source)
+                    return content
+                finally:
+                    browser.close()
+        finally:
+            record_fetch("BrowserLoader", source, started, transferred)
+            logging.info(
+                f"loaded {source} in {time.perf_counter() - started:.2f}s, "
+                f"{transferred} bytes transferred"
+            )
+
+
+class BrowserPool:
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_waiting: int = 4,
+        max_pages: int = 50,
+        max_memory: int = 1024 * 1024 * 1024,
+        timeout: float = 60,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self._jobs: queue.Queue[Tuple[str, Future[Tuple[str, int]]] | None] = queue.Queue()
+        # pages being loaded plus pages waiting for a browser
+        self._slots = threading.BoundedSemaphore(size + max_waiting)
+        self._workers: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._average_duration = 5.0
+
+    def start(self):
+        logging.info(f"starting pool of {self.size} browsers")
+        for i in range(self.size):
+            worker = threading.Thread(target=self._work, name=f"browser-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        logging.info("stopping browser pool")
+        self._stopping.set()
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join(timeout=self.timeout)
+        self._workers = []
+
+    def load(self, source: str) -> Tuple[str, int]:
+        if not self._slots.acquire(blocking=False):
+            raise BrowserPoolSaturated(retry_after=self.retry_after())
+        future: Future[Tuple[str, int]] = Future()
+        # the slot is freed when the page is done, even if the caller gave up waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        self._jobs.put((source, future))
+        return future.result(timeout=self.timeout)
+
+    def retry_after(self) -> int:
+        waiting = self._jobs.qsize() + self.size
+        return max(1, math.ceil(self._average_duration * waiting / max(self.size, 1)))
+
+    def _work(self):
+        # a failure outside a page load restarts the worker instead of leaving its jobs waiting
+        while not self._stopping.is_set():
+            try:
+                self._serve()
+            except Exception as e:
+                logging.exception(f"browser worker failed, restarting it: {e}")
+                self._stopping.wait(WORKER_RESTART_DELAY)
+
+    def _serve(self):
         with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                viewport={"width": 1280, "height": 800},
+            browser = self._launch(p)
+            pages = 0
+            try:
+                while True:
+                    job = self._jobs.get()
+                    if job is None:
+                        return
+                    source, future = job
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        browser = (
+                            browser if browser and browser.is_connected() else launch_browser(p)
+                        )
+                        future.set_result(load_page(browser, source))
+                    except Exception as e:
+                        future.set_exception(e)
+                    self._average_duration = (
+                        0.8 * self._average_duration + 0.2 * (time.perf_counter() - started)
+                    )
+                    pages += 1
+                    if browser and self._should_recycle(browser, pages):
+                        logging.info(f"recycling browser after {pages} pages")
+                        close_browser(browser)
+                        browser = None
+                        pages = 0
+            finally:
+                if browser:
+                    close_browser(browser)
+
+    def _should_recycle(self, browser: Browser, pages: int) -> bool:
+        if pages >= self.max_pages:
+            return True
+        # measuring asks chromium for its processes and walks /proc, not worth it every page
+        return pages % MEMORY_CHECK_PAGES == 0 and browser_memory(browser) > self.max_memory
+
+    def _launch(self, p: Playwright) -> Browser | None:
+        try:
+            return launch_browser(p)
+        except Exception as e:
+            # keep the worker alive, it retries the launch with the first job
+            logging.error(e)
+            return None
+
+
+def launch_browser(p: Playwright) -> Browser:
+    return p.chromium.launch(headless=True)
+
+
+def close_browser(browser: Browser):
+    try:
+        browser.close()
+    except Exception as e:
+        # already gone, a crashed browser has nothing left to free
+        logging.warning(f"could not close browser: {e}")
+
+
+def load_page(browser: Browser, source: str) -> Tuple[str, int]:
+    # returns the html and the bytes transferred for it
+    # a fresh context per page so cookies and storage never leak between scrapes
+    context = browser.new_context(
+        user_agent=USER_AGENT,
+        viewport={"width": 1280, "height": 800},
+    )
+    finished: List[Request] = []
+
+    def handle_route(route: Route):
+        request = route.request
+        if is_blocked(request, source):
+            BROWSER_BLOCKED_REQUESTS.inc(request.resource_type)
+            route.abort()
+        else:
+            route.continue_()
+
+    try:
+        context.route("**/*", handle_route)
+        page = context.new_page()
+        page.on("requestfinished", finished.append)
+        deadline = time.perf_counter() + BROWSER_TIMEOUT
+        try:
+            response = page.goto(
+                source, wait_until="domcontentloaded", timeout=BROWSER_TIMEOUT * 1000
             )
-            page = context.new_page()
-            page.goto(source)
-            content = page.content()
-            browser.close()
-            return content
+        except PlaywrightTimeoutError:
+            raise LoaderException(f"{source} did not load in {BROWSER_TIMEOUT:g}s")
+        # error and challenge pages must not be parsed or cached as the recipe
+        if response and not response.ok:
+            raise LoaderException(f"{source} answered {response.status}")
+        try:
+            # a zero timeout would wait forever
+            remaining = max(1, (deadline - time.perf_counter()) * 1000)
+            page.wait_for_function(
+                RECIPE_SCRIPT_CHECK, arg=RECIPE_LOAD_GRACE * 1000, timeout=remaining
+            )
+        except PlaywrightTimeoutError:
+            # the page never finished loading, whatever is there is parsed as it is
+            logging.info(f"no recipe json-ld in {source} after {BROWSER_TIMEOUT:g}s")
+        content = page.content()
+        return content, sum(transferred_size(request) for request in finished)
+    finally:
+        context.close()
+
+
+def is_blocked(request: Request, source: str) -> bool:
+    if request.is_navigation_request() and not request.frame.parent_frame:
+        return False
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    return site(request.url) != site(source)
+
+
+def site(url: str) -> str:
+    # the last two labels, close enough to tell a site's own cdn from ads and analytics
+    hostname = urlparse(url).hostname or ""
+    return ".".join(hostname.split(".")[-2:])
+
+
+def transferred_size(request: Request) -> int:
+    try:
+        sizes = request.sizes()
+    except Exception:
+        return 0
+    return sizes["responseHeadersSize"] + sizes["responseBodySize"]
+
+
+def browser_memory(browser: Browser) -> int:
+    # resident memory of this browser only, the other workers' browsers have their own limit
+    try:
+        session = browser.new_browser_cdp_session()
+        try:
+            processes = session.send("SystemInfo.getProcessInfo")["processInfo"]
+        finally:
+            session.detach()
+    except Exception as e:
+        logging.warning(f"could not get browser processes: {e}")
+        return 0
+    roots = [process["id"] for process in processes if process.get("type") == "browser"]
+    return process_tree_memory(roots[0]) if roots else 0
+
+
+def process_tree_memory(root: int) -> int:
+    # resident memory of a process and everything it spawned, ie chromium and its renderers
+    if not os.path.isdir("/proc"):
+        return 0
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as reader:
+                stat = reader.read()
+        except OSError:
+            continue
+        ppid = int(stat[stat.rindex(")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm", "r") as reader:
+                total += int(reader.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            continue
+    return total
@@ -1,25 +1,77 @@
 import os
+import json
+import zlib
+import asyncio
 import logging
-from typing import Annotated, Optional
+from contextlib import asynccontextmanager
+from typing import Annotated, Iterator, List, Optional
 from fastapi import FastAPI, Form, HTTPException, Request, Response
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    ORJSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
-from hngr.schemes import NewRecipe
+from hngr.schemes import (
+    ImportReport,
+    ImportRequest,
+    IngredientMatch,
+    NewRecipe,
+    ProfileInfo,
+    RecipeChanges,
+    RenderCacheStats,
+)
 
-from .parsers import ParserFactory, clean_url
 from .db import (
+    RECIPE_FIELDS,
+    ConnectionPool,
     Connection,
+    acreate_recipe,
+    adelete_recipe,
+    alist_recipes_page,
+    aretrieve_recipe,
+    asearch_recipes,
+    backfill_canonical_sources,
+    backfill_ingredients,
+    change_listeners,
     list_recipes,
-    create_recipe,
+    list_recipes_page,
+    list_recipe_changes,
+    list_recipe_fields_page,
+    rank_recipes_by_ingredients,
     retrieve_recipe,
-    delete_recipe,
-    search_recipes,
+    retrieve_recipe_fields,
+    retrieve_pending_image,
+    retrieve_recipe_id_by_source,
+    retrieve_recipes,
+    retrieve_recipe_version,
+    retrieve_revision,
     update_recipe,
 )
-from .exceptions import ParserException
+from .conditional import (
+    is_not_modified,
+    make_etag,
+    not_modified,
+    templates_version,
+    validator_headers,
+)
+from .loaders import BrowserLoader, BrowserPool, RequestLoader
+from .jobs import ScrapeQueue
+from .images import ImageQueue, ImageStore, image_src, image_srcset
+from .pagecache import PageCache
+from .rendercache import RenderCache
+from . import metrics
+from .profiler import ProfilerMiddleware, ProfileStore, profiled_thread
+from .parsers import ParserFactory
+from .parsepool import ParsePool
+from .importer import import_links
+from .exceptions import DatabaseBusy, ScrapeQueueFull
 
 
 load_dotenv()
@@ -30,29 +82,165 @@ if os.environ.get("DEV", False):
 DIRECTORY_STATIC = "hngr/static"
 DIRECTORY_TEMPLATES = "hngr/templates"
 DATABASE_URL = os.environ.get("DB", "")
+DATABASE_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 4))
+DATABASE_MAX_QUEUED = int(os.environ.get("DB_MAX_QUEUED", 100))
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 2))
+BROWSER_POOL_MAX_WAITING = int(os.environ.get("BROWSER_POOL_MAX_WAITING", 4))
+BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", 50))
+BROWSER_MAX_MEMORY_MB = int(os.environ.get("BROWSER_MAX_MEMORY_MB", 1024))
+SCRAPE_WORKERS = int(os.environ.get("SCRAPE_WORKERS", 4))
+SCRAPE_MAX_QUEUED = int(os.environ.get("SCRAPE_MAX_QUEUED", 100))
+SCRAPE_POLL_INTERVAL = 0.5
+RECIPES_PAGE_SIZE = 50
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+API_LIST_FIELDS = ["id", "name"]
+INGREDIENTS_MAX_ITEMS = 20
+IMPORT_MAX_PARALLELISM = int(os.environ.get("IMPORT_MAX_PARALLELISM", 8))
+IMPORT_MAX_LINKS = int(os.environ.get("IMPORT_MAX_LINKS", 100))
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", "")
+PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 24 * 60 * 60))
+PAGE_CACHE_MAX_SIZE_MB = int(os.environ.get("PAGE_CACHE_MAX_SIZE_MB", 256))
+RENDER_CACHE_MAX_SIZE_MB = int(os.environ.get("RENDER_CACHE_MAX_SIZE_MB", 16))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_TIMEOUT = float(os.environ.get("PARSE_TIMEOUT", 10))
+PARSE_MAX_SIZE_MB = int(os.environ.get("PARSE_MAX_SIZE_MB", 10))
+IMAGE_DIR = os.environ.get("IMAGE_DIR", "images")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_MAX_QUEUED = int(os.environ.get("IMAGE_MAX_QUEUED", 100))
+IMAGE_RETRY_DELAY = float(os.environ.get("IMAGE_RETRY_DELAY", 60))
+# profiling and the admin endpoints stay disabled without a token
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+
+pool = ConnectionPool(url=DATABASE_URL, size=DATABASE_POOL_SIZE, max_queued=DATABASE_MAX_QUEUED)
+image_store = ImageStore(IMAGE_DIR)
+image_queue = ImageQueue(
+    pool,
+    image_store,
+    workers=IMAGE_WORKERS,
+    max_queued=IMAGE_MAX_QUEUED,
+    retry_delay=IMAGE_RETRY_DELAY,
+)
+scrape_queue = ScrapeQueue(
+    pool, workers=SCRAPE_WORKERS, max_queued=SCRAPE_MAX_QUEUED, images=image_queue
+)
+render_cache = RenderCache(max_size=RENDER_CACHE_MAX_SIZE_MB * 1024 * 1024)
+change_listeners.append(render_cache.invalidate)
+profile_store = ProfileStore(
+    PROFILE_DIR,
+    token=PROFILE_TOKEN,
+    max_files=PROFILE_MAX_FILES,
+    interval=PROFILE_INTERVAL_MS / 1000,
+)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool.open()
+    with pool.writer() as connection:
+        backfill_canonical_sources(connection)
+        backfilled = backfill_ingredients(connection)
+    if backfilled:
+        logging.info(f"parsed ingredients of {backfilled} recipes")
+    RequestLoader.open()
+    if PAGE_CACHE_DIR:
+        ParserFactory.cache = PageCache(
+            PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL, max_size=PAGE_CACHE_MAX_SIZE_MB * 1024 * 1024
+        )
+    if BROWSER_POOL_SIZE > 0:
+        BrowserLoader.pool = BrowserPool(
+            size=BROWSER_POOL_SIZE,
+            max_waiting=BROWSER_POOL_MAX_WAITING,
+            max_pages=BROWSER_MAX_PAGES,
+            max_memory=BROWSER_MAX_MEMORY_MB * 1024 * 1024,
+        )
+        BrowserLoader.pool.start()
+    if PARSE_WORKERS > 0:
+        ParserFactory.pool = ParsePool(
+            workers=PARSE_WORKERS,
+            max_size=PARSE_MAX_SIZE_MB * 1024 * 1024,
+            timeout=PARSE_TIMEOUT,
+        )
+        ParserFactory.pool.start()
+    scrape_queue.start()
+    yield
+    scrape_queue.stop()
+    image_queue.stop()
+    if BrowserLoader.pool:
+        BrowserLoader.pool.stop()
+        BrowserLoader.pool = None
+    ParserFactory.cache = None
+    if ParserFactory.pool:
+        ParserFactory.pool.stop()
+        ParserFactory.pool = None
+    await RequestLoader.close()
+    pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware, store=profile_store)
+
+
+@app.exception_handler(DatabaseBusy)
+async def database_busy(request: Request, e: DatabaseBusy):
+    return JSONResponse(
+        content={"detail": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)}
+    )
 
 
 app.mount("/static", StaticFiles(directory=DIRECTORY_STATIC), name="static")
 
 templates = Jinja2Templates(directory=DIRECTORY_TEMPLATES)
+templates.env.globals["image_src"] = image_src
+templates.env.globals["image_srcset"] = image_srcset
+TEMPLATES_VERSION = templates_version(DIRECTORY_TEMPLATES)
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    connection = Connection(url=DATABASE_URL)
+    def render(connection: Connection) -> Response:
+        revision = retrieve_revision(connection)
+        etag = make_etag("recipes", revision.version, TEMPLATES_VERSION)
+        if is_not_modified(request, etag, revision.updated_at):
+            return not_modified(etag, revision.updated_at)
+        page = render_cache.get("index", 0, revision.version)
+        if page is None:
+            recipes, next_cursor = list_recipes_page(connection, None, RECIPES_PAGE_SIZE)
+            page = templates.get_template("index.html").render(
+                recipes=recipes, next_cursor=next_cursor
+            )
+            render_cache.put("index", 0, revision.version, page)
+        return HTMLResponse(content=page, headers=validator_headers(etag, revision.updated_at))
+
     try:
-        connection.open()
-        recipes = list_recipes(connection)
-        return templates.TemplateResponse(
-            request=request, name="index.html", context={"recipes": recipes}
-        )
+        return await pool.read(render)
+    except DatabaseBusy as e:
+        raise e
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        connection.close()
+
+
+@app.get("/recipes", response_class=HTMLResponse)
+async def recipes_page(request: Request, cursor: str):
+    try:
+        recipes, next_cursor = await alist_recipes_page(pool, cursor, RECIPES_PAGE_SIZE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return templates.TemplateResponse(
+        request=request,
+        name="partials/recipes_page.html",
+        context={"recipes": recipes, "next_cursor": next_cursor},
+    )
+
+
+@app.get("/metrics")
+async def metrics_page():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/service-worker.js")
@@ -62,33 +250,74 @@ async def service_worker():
 
 
 @app.post("/scrape")
-# keep it synchonous because of playwright, ie BrowserLoader
-def scrape(request: Request, response: Response, link: Annotated[str, Form()]):
-    connection = Connection(url=DATABASE_URL)
+async def scrape(request: Request, link: Annotated[str, Form()]):
+    # known pages are never loaded again
+    recipe_id = await pool.read(retrieve_recipe_id_by_source, link)
+    if recipe_id:
+        headers = {"Location": f"/recipe/{recipe_id}"}
+        if "hx-request" in request.headers:
+            return Response(status_code=200, headers={"HX-Redirect": headers["Location"]})
+        return JSONResponse(
+            content={"link": link, "status": "done", "recipe_id": recipe_id}, headers=headers
+        )
+
     try:
-        parser = ParserFactory.get_parser(clean_url(link))
-        new_recipe = parser.parse()
-        if new_recipe:
-            connection.open()
-            recipe_id = create_recipe(connection, new_recipe)
-            recipe_url = f"/recipe/{recipe_id}/edit"
-            if "hx-request" in request.headers:
-                response.headers["HX-Redirect"] = recipe_url
-                response.status_code = 303
-                return response
-            return RedirectResponse(url=recipe_url, status_code=303)
-        raise Exception("something went wrong")
-    except ValueError as e:
-        return HTMLResponse(content=f"<div class='error'>{str(e)}</div>", status_code=400)
-    except ParserException as e:
-        return HTMLResponse(content=f"<div class='error'>{str(e)}</div>", status_code=400)
-    except Exception as e:
-        logging.error(e)
+        job = await scrape_queue.asubmit(link)
+    except ScrapeQueueFull as e:
         return HTMLResponse(
-            content=f"<div class='error'>Internal server error: {str(e)}</div>", status_code=500
+            content=f"<div class='error'>{str(e)}</div>",
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    headers = {"Location": f"/scrape/{job.id}"}
+    if "hx-request" in request.headers:
+        return templates.TemplateResponse(
+            request=request,
+            name="partials/scrape_job.html",
+            context={"job": job},
+            status_code=202,
+            headers=headers,
         )
-    finally:
-        connection.close()
+    return JSONResponse(content=job.model_dump(), status_code=202, headers=headers)
+
+
+@app.get("/scrape/{job_id}")
+async def scrape_status(request: Request, job_id: int):
+    job = await scrape_queue.aretrieve(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"scrape job {job_id} not found")
+    if "hx-request" not in request.headers:
+        return job
+    if job.status == "done":
+        response = Response(status_code=200)
+        response.headers["HX-Redirect"] = f"/recipe/{job.recipe_id}/edit"
+        return response
+    if job.status == "failed":
+        return HTMLResponse(content=f"<div class='error'>{job.error}</div>", status_code=400)
+    return templates.TemplateResponse(
+        request=request, name="partials/scrape_job.html", context={"job": job}
+    )
+
+
+@app.get("/scrape/{job_id}/events")
+async def scrape_events(job_id: int):
+    if not await scrape_queue.aretrieve(job_id):
+        raise HTTPException(status_code=404, detail=f"scrape job {job_id} not found")
+
+    async def events():
+        status = None
+        while True:
+            job = await scrape_queue.aretrieve(job_id)
+            if not job:
+                return
+            if job.status != status:
+                status = job.status
+                yield f"event: status\ndata: {job.model_dump_json()}\n\n"
+            if job.is_finished:
+                return
+            await asyncio.sleep(SCRAPE_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.get("/new-recipe", response_class=HTMLResponse)
@@ -114,7 +343,6 @@ async def new_recipe_create(
     directions: Annotated[str, Form()],
     ingredients: Annotated[str, Form()],
 ):
-    connection = Connection(url=DATABASE_URL)
     try:
         new_recipe = NewRecipe(
             name=name,
@@ -124,75 +352,97 @@ async def new_recipe_create(
             source="",
             image="",
         )
-        connection.open()
-        recipe_id = create_recipe(connection, new_recipe)
+        recipe_id = await acreate_recipe(pool, new_recipe)
         recipe_url = f"/recipe/{recipe_id}"
         if "hx-request" in request.headers:
             response.headers["HX-Redirect"] = recipe_url
             response.status_code = 303
             return response
         return RedirectResponse(url=recipe_url, status_code=303)
+    except DatabaseBusy as e:
+        raise e
     except Exception as e:
         logging.error(e)
         return HTMLResponse(
             content=f"<div class='error'>Internal server error: {str(e)}</div>", status_code=500
         )
-    finally:
-        connection.close()
 
 
 @app.get("/recipe/{recipe_id}", response_class=HTMLResponse)
 async def recipe_page(request: Request, recipe_id: int):
-    connection = Connection(url=DATABASE_URL)
-    try:
-        connection.open()
-        recipe = retrieve_recipe(connection, recipe_id)
-        if not recipe:
+    def render(connection: Connection) -> Response:
+        # revalidation only needs the primary key lookup, not the render
+        version = retrieve_recipe_version(connection, recipe_id)
+        if not version:
             raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
-        return templates.TemplateResponse(
-            request=request, name="recipe.html", context={"recipe": recipe}
-        )
+        # asked on every view, a cached page or a 304 would never retry a failed fetch
+        image = retrieve_pending_image(connection, recipe_id)
+        if image:
+            # stored locally in the background, a later version of the page uses it
+            image_queue.submit(recipe_id, image)
+        etag = recipe_etag(recipe_id, version.version)
+        if is_not_modified(request, etag, version.updated_at):
+            return not_modified(etag, version.updated_at)
+        page = render_cache.get("recipe", recipe_id, version.version)
+        if page is None:
+            recipe = retrieve_recipe(connection, recipe_id)
+            if not recipe:
+                raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
+            page = templates.get_template("recipe.html").render(recipe=recipe)
+            render_cache.put("recipe", recipe_id, version.version, page)
+        return HTMLResponse(content=page, headers=validator_headers(etag, version.updated_at))
+
+    try:
+        return await pool.read(render)
+    except (HTTPException, DatabaseBusy) as e:
+        raise e
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        connection.close()
+
+
+def recipe_etag(recipe_id: int, version: int) -> str:
+    return make_etag("recipe", recipe_id, version, TEMPLATES_VERSION)
+
+
+@app.get("/images/{name}")
+async def image(name: str):
+    path = image_store.path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail=f"image {name} not found")
+    # named by content hash, so a name never points to other bytes
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    return FileResponse(path, media_type="image/webp", headers=headers)
 
 
 @app.delete("/recipe/{recipe_id}", status_code=204)
 async def recipe_delete(recipe_id: int):
-    connection = Connection(url=DATABASE_URL)
     try:
-        connection.open()
-        is_deleted = delete_recipe(connection, recipe_id)
+        is_deleted = await adelete_recipe(pool, recipe_id)
         if not is_deleted:
             raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
         return
-    except HTTPException as e:
+    except (HTTPException, DatabaseBusy) as e:
         raise e
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        connection.close()
 
 
 @app.get("/recipe/{recipe_id}/edit")
 async def edit_recipe_page(request: Request, recipe_id: int):
-    connection = Connection(url=DATABASE_URL)
     try:
-        connection.open()
-        recipe = retrieve_recipe(connection, recipe_id)
+        recipe = await aretrieve_recipe(pool, recipe_id)
         if not recipe:
             raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
         return templates.TemplateResponse(
             request=request, name="edit_recipe.html", context={"recipe": recipe}
         )
+    except DatabaseBusy as e:
+        raise e
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        connection.close()
 
 
 @app.post("/recipe/{recipe_id}/edit")
@@ -205,10 +455,7 @@ async def edit_recipe(
     directions: Annotated[str, Form()],
     ingredients: Annotated[str, Form()],
 ):
-    connection = Connection(url=DATABASE_URL)
-    try:
-        connection.open()
-
+    def edit(connection: Connection):
         recipe = retrieve_recipe(connection, recipe_id)
         if not recipe:
             raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
@@ -220,45 +467,232 @@ async def edit_recipe(
 
         update_recipe(connection, recipe)
 
+    try:
+        await pool.write(edit)
+
         recipe_url = f"/recipe/{recipe_id}"
         if "hx-request" in request.headers:
             response.headers["HX-Redirect"] = recipe_url
             response.status_code = 303
             return response
         return RedirectResponse(url=recipe_url, status_code=303)
+    except DatabaseBusy as e:
+        raise e
     except Exception as e:
         logging.error(e)
         return HTMLResponse(
             content=f"<div class='error'>Internal server error: {str(e)}</div>", status_code=500
         )
-    finally:
-        connection.close()
 
 
 @app.post("/search", status_code=200, response_class=HTMLResponse)
 async def search(request: Request, term: Annotated[Optional[str], Form()] = None):
-    connection = Connection(url=DATABASE_URL)
-    try:
-        connection.open()
-        if term:
-            recipes = search_recipes(connection, term)
-        else:
-            recipes = list_recipes(connection)
-        return templates.TemplateResponse(
-            request=request,
-            name="partials/recipes_list.html",
-            context={"recipes": recipes, "search": True},
-        )
-    finally:
-        connection.close()
+    next_cursor = None
+    if term:
+        recipes = await asearch_recipes(pool, term)
+    else:
+        recipes, next_cursor = await alist_recipes_page(pool, None, RECIPES_PAGE_SIZE)
+    return templates.TemplateResponse(
+        request=request,
+        name="partials/recipes_list.html",
+        context={"recipes": recipes, "next_cursor": next_cursor, "search": True},
+    )
 
 
 @app.get("/api/recipes", status_code=200)
-async def api_list_recipes():
-    connection = Connection(url=DATABASE_URL)
+async def api_list_recipes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = API_PAGE_SIZE,
+    fields: Optional[str] = None,
+):
+    limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    selected = parse_fields(fields, API_LIST_FIELDS)
+
+    def list_page(connection: Connection) -> Response:
+        revision = retrieve_revision(connection)
+        # the default projection shares its etag with /api/recipes/all
+        etag = make_etag("recipes", revision.version, *(selected if fields else []))
+        if is_not_modified(request, etag, revision.updated_at):
+            return not_modified(etag, revision.updated_at)
+        # plain rows straight to orjson, without building and dumping models
+        recipes, next_cursor = list_recipe_fields_page(connection, cursor, limit, selected)
+        return ORJSONResponse(
+            content={"data": recipes, "next": next_cursor},
+            headers=validator_headers(etag, revision.updated_at),
+        )
+
     try:
-        connection.open()
-        recipes = list_recipes(connection)
-        return {"data": recipes}
-    finally:
-        connection.close()
+        return await pool.read(list_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/recipes/all", status_code=200)
+async def api_list_all_recipes(request: Request):
+    revision = await pool.read(retrieve_revision)
+    etag = make_etag("recipes", revision.version)
+    if is_not_modified(request, etag, revision.updated_at):
+        return not_modified(etag, revision.updated_at)
+
+    # sync generators are iterated in the threadpool, so they may block
+    def stream():
+        # one short read per batch so a slow client never holds a pooled connection
+        after = None
+        separator = ""
+        yield '{"data":['
+        while True:
+            with pool.reader() as connection:
+                recipes = list_recipes(connection, after=after, limit=API_MAX_PAGE_SIZE)
+            for recipe in recipes:
+                yield separator + recipe.model_dump_json()
+                separator = ","
+            if len(recipes) < API_MAX_PAGE_SIZE:
+                break
+            after = (recipes[-1].name, recipes[-1].id)
+        yield "]}"
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/json",
+        headers=validator_headers(etag, revision.updated_at),
+    )
+
+
+@app.get("/api/recipes/bundle", status_code=200)
+async def api_recipes_bundle(request: Request, ids: Optional[str] = None):
+    try:
+        recipe_ids = [int(recipe_id) for recipe_id in ids.split(",")] if ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid recipe ids {ids}")
+    recipe_template = templates.get_template("recipe.html")
+
+    def stream() -> Iterator[str]:
+        # the pages rendered as the service worker stores them, one json object per line
+        after = 0
+        while True:
+            with pool.reader() as connection:
+                recipes = retrieve_recipes(
+                    connection, recipe_ids, after=after, limit=API_MAX_PAGE_SIZE
+                )
+            lines = []
+            for recipe in recipes:
+                page = {
+                    "id": recipe.id,
+                    "url": f"/recipe/{recipe.id}",
+                    "headers": validator_headers(
+                        recipe_etag(recipe.id, recipe.version), recipe.updated_at
+                    ),
+                    "html": render_cache.get("recipe", recipe.id, recipe.version)
+                    or recipe_template.render(recipe=recipe),
+                }
+                lines.append(json.dumps(page) + "\n")
+            yield "".join(lines)
+            if len(recipes) < API_MAX_PAGE_SIZE:
+                break
+            after = recipes[-1].id
+
+    headers = {"Cache-Control": "no-store"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(
+            gzip_stream(stream()), media_type="application/x-ndjson", headers=headers
+        )
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers=headers)
+
+
+def gzip_stream(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        # flushed per batch so the client can start storing pages before the end
+        yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+@app.get("/api/recipes/changes", status_code=200)
+async def api_list_recipe_changes(since: int = 0) -> RecipeChanges:
+    return await pool.read(list_recipe_changes, max(0, since))
+
+
+@app.get("/api/recipes/by-ingredients", status_code=200)
+async def api_recipes_by_ingredients(
+    items: str, limit: int = API_PAGE_SIZE
+) -> List[IngredientMatch]:
+    terms = [item for item in items.split(",") if item.strip()]
+    if not terms or len(terms) > INGREDIENTS_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"expected 1 to {INGREDIENTS_MAX_ITEMS} ingredients"
+        )
+    limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    return await pool.read(rank_recipes_by_ingredients, terms, limit)
+
+
+# declared after the other /api/recipes routes, which would otherwise match as an id
+@app.get("/api/recipes/{recipe_id}", status_code=200)
+async def api_retrieve_recipe(request: Request, recipe_id: int, fields: Optional[str] = None):
+    selected = parse_fields(fields, RECIPE_FIELDS)
+
+    def retrieve(connection: Connection) -> Response:
+        version = retrieve_recipe_version(connection, recipe_id)
+        if not version:
+            raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
+        etag = make_etag("api-recipe", recipe_id, version.version, *selected)
+        if is_not_modified(request, etag, version.updated_at):
+            return not_modified(etag, version.updated_at)
+        recipe = retrieve_recipe_fields(connection, recipe_id, selected)
+        if recipe is None:
+            raise HTTPException(status_code=404, detail=f"recipe {recipe_id} not found")
+        return ORJSONResponse(content=recipe, headers=validator_headers(etag, version.updated_at))
+
+    return await pool.read(retrieve)
+
+
+def parse_fields(fields: str | None, default: List[str]) -> List[str]:
+    if not fields:
+        return default
+    selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in selected if field not in RECIPE_FIELDS]
+    if not selected or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"unknown fields {','.join(unknown)}, expected some of {','.join(RECIPE_FIELDS)}",
+        )
+    return selected
+
+
+@app.get("/api/render-cache", status_code=200)
+async def api_render_cache() -> RenderCacheStats:
+    return render_cache.stats()
+
+
+@app.get("/admin/profiles")
+async def admin_list_profiles(request: Request) -> List[ProfileInfo]:
+    check_admin(request)
+    return profile_store.list()
+
+
+@app.get("/admin/profiles/{name}")
+async def admin_download_profile(request: Request, name: str):
+    check_admin(request)
+    path = profile_store.path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail=f"profile {name} not found")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+
+
+def check_admin(request: Request):
+    if not profile_store.is_authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="not authorized")
+
+
+@app.post("/api/import", status_code=200)
+# synchronous, the import blocks until every link is parsed and stored
+def api_import(body: ImportRequest) -> ImportReport:
+    # every link is loaded while a threadpool worker waits, larger lists go to the cli importer
+    if len(body.links) > IMPORT_MAX_LINKS:
+        raise HTTPException(
+            status_code=422, detail=f"expected at most {IMPORT_MAX_LINKS} links per import"
+        )
+    parallelism = max(1, min(body.parallelism, IMPORT_MAX_PARALLELISM))
+    with profiled_thread():
+        return import_links(pool, body.links, parallelism=parallelism)
@@ -0,0 +1,208 @@
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, TypeVar
+from urllib.parse import urlparse
+
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry: List["Metric"] = []
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def label_pairs(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{self.label_pairs(labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: List[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # per label set: one count per bucket plus +Inf, then the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def timer(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        for labels, values in series:
+            cumulative = 0
+            bounds = [format_value(bucket) for bucket in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                le = self.label_pairs(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {format_value(cumulative)}")
+            pairs = self.label_pairs(labels)
+            lines.append(f"{self.name}_sum{pairs} {format_value(values[-1])}")
+            lines.append(f"{self.name}_count{pairs} {format_value(cumulative)}")
+        return lines
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "hngr_http_request_duration_seconds",
+    "Time spent handling requests",
+    ("method", "route", "status"),
+)
+DB_QUERY_SECONDS = Histogram(
+    "hngr_db_query_duration_seconds", "Time spent in db.py functions", ("function",)
+)
+LOADER_FETCH_SECONDS = Histogram(
+    "hngr_loader_fetch_duration_seconds", "Time spent fetching pages", ("loader", "domain")
+)
+LOADER_FETCHED_BYTES = Counter(
+    "hngr_loader_fetched_bytes_total", "Bytes of fetched pages", ("loader", "domain")
+)
+LOADER_STREAMS = Counter(
+    "hngr_loader_streamed_loads_total",
+    "Streamed loads that stopped at the recipe or read the full page",
+    ("outcome",),
+)
+LOADER_TIERS = Counter(
+    "hngr_loader_tier_loads_total",
+    "Tiered loads by tier and outcome",
+    ("tier", "outcome"),
+)
+BROWSER_BLOCKED_REQUESTS = Counter(
+    "hngr_browser_blocked_requests_total",
+    "Requests the browser was not allowed to make, by resource type",
+    ("type",),
+)
+PARSE_SECONDS = Histogram(
+    "hngr_parser_parse_duration_seconds",
+    "Time spent parsing a loaded page",
+    ("parser",),
+)
+SCRAPE_RESULTS = Counter(
+    "hngr_scrape_results_total", "Scraped and imported links by outcome", ("outcome",)
+)
+
+
+def instrumented(fn: Callable[..., T]) -> Callable[..., T]:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, fn.__name__)
+
+    return wrapper
+
+
+def record_fetch(loader: str, source: str, started: float, size: int):
+    domain = urlparse(source).hostname or ""
+    LOADER_FETCH_SECONDS.observe(time.perf_counter() - started, loader, domain)
+    LOADER_FETCHED_BYTES.inc(loader, domain, amount=size)
+
+
+class MetricsMiddleware:
+    # plain asgi instead of BaseHTTPMiddleware, it adds no task or stream wrapping per request
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router stores the matched route in the scope, its path is the template
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], route, str(status)
+            )
@@ -0,0 +1,198 @@
+import os
+import gzip
+import argparse
+import time
+import logging
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+from dotenv import load_dotenv
+
+from .loaders import Loader, RequestLoader
+from .exceptions import LoaderException
+from .schemes import CachedPage
+from .urls import clean_url
+
+
+class PageCache:
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = 24 * 60 * 60,
+        max_size: int = 256 * 1024 * 1024,
+        offline: bool = False,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._fetching: Dict[str, Tuple[threading.Lock, int]] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path, _ in self._entries())
+
+    def fetch(self, source: str, loader: type[Loader]) -> str:
+        key = clean_url(source)
+        # concurrent loads of the same page wait for the first one instead of fetching again
+        with self._coalesce(key):
+            cached = self.get(key)
+            # only successful pages are kept, an error page is fetched again on the next load
+            if cached and not is_success(cached[0].status):
+                cached = None
+            if cached and (self.offline or time.time() - cached[0].fetched_at < self.ttl):
+                return cached[1]
+            if self.offline:
+                raise LoaderException(f"{key} is not cached")
+            if loader is not RequestLoader:
+                # these loaders raise on error statuses, so only successful pages get here
+                content = loader.load(source)
+                self.put(key, content)
+                return content
+
+            page = cached[0] if cached else None
+            etag = page.etag if page else None
+            last_modified = page.last_modified if page else None
+            content, response = RequestLoader.load_conditional(source, etag, last_modified)
+            if content is None and cached:
+                logging.info(f"{key} not modified")
+                content = cached[1]
+            elif not is_success(response.status_code):
+                logging.info(f"not caching {key}, the server answered {response.status_code}")
+                return content or ""
+            self.put(
+                key,
+                content or "",
+                response.headers.get("etag") or etag,
+                response.headers.get("last-modified") or last_modified,
+            )
+            return content or ""
+
+    def get(self, key: str) -> Tuple[CachedPage, str] | None:
+        content_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as reader:
+                page = CachedPage.model_validate_json(reader.read())
+            with gzip.open(content_path, "rt", encoding="utf-8") as reader:
+                content = reader.read()
+            # reads count as use for the lru eviction
+            os.utime(content_path)
+        except (OSError, ValueError):
+            return None
+        return page, content
+
+    def put(
+        self,
+        key: str,
+        content: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        status: int = 200,
+    ):
+        content_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(content_path), exist_ok=True)
+        compressed = gzip.compress(content.encode("utf-8"))
+        page = CachedPage(
+            url=key,
+            fetched_at=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+            size=len(compressed),
+            status=status,
+        )
+        with self._lock:
+            previous = os.path.getsize(content_path) if os.path.exists(content_path) else 0
+            write_atomic(content_path, compressed)
+            write_atomic(meta_path, page.model_dump_json().encode("utf-8"))
+            self._size += len(compressed) - previous
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            for content_path, _ in entries:
+                if self._size <= self.max_size:
+                    break
+                try:
+                    size = os.path.getsize(content_path)
+                    os.remove(content_path)
+                    os.remove(content_path[: -len(".html.gz")] + ".json")
+                except OSError:
+                    continue
+                self._size -= size
+                logging.info(f"evicted {content_path} from page cache")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".html.gz"):
+                    path = os.path.join(root, name)
+                    yield path, os.path.getmtime(path)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, digest[:2], digest)
+        return f"{base}.html.gz", f"{base}.json"
+
+    @contextmanager
+    def _coalesce(self, key: str) -> Iterator[None]:
+        with self._lock:
+            lock, waiting = self._fetching.get(key, (threading.Lock(), 0))
+            self._fetching[key] = (lock, waiting + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, waiting = self._fetching[key]
+                if waiting == 1:
+                    del self._fetching[key]
+                else:
+                    self._fetching[key] = (lock, waiting - 1)
+
+
+class CachedLoader(Loader):
+
+    def __init__(self, loader: type[Loader], cache: PageCache):
+        self.loader = loader
+        self.cache = cache
+
+    def load(self, source: str) -> str:
+        return self.cache.fetch(source, self.loader)
+
+
+def is_success(status: int | None) -> bool:
+    return status is not None and 200 <= status < 300
+
+
+def write_atomic(path: str, data: bytes):
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as writer:
+        writer.write(data)
+    os.replace(temporary, path)
+
+
+def main():
+    # replays the parsers against cached pages without touching the network
+    from .parsers import ParserFactory
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="parse recipes from cached pages only")
+    parser.add_argument("links", nargs="+")
+    parser.add_argument("--directory", default=os.environ.get("PAGE_CACHE_DIR", "cache/pages"))
+    args = parser.parse_args()
+
+    ParserFactory.cache = PageCache(args.directory, offline=True)
+    for link in args.links:
+        try:
+            recipe = ParserFactory.get_parser(clean_url(link)).parse()
+            print(recipe.model_dump_json(indent=2))
+        except Exception as e:
+            print(f"{link}: {e}")
+
+
+if __name__ == "__main__":
+    main()
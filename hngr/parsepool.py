@@ -0,0 +1,97 @@
+import os
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .exceptions import ParserException
+from .schemes import NewRecipe
+
+
+class ParsePool:
+    # beautifulsoup is pure python, parser threads would take turns on the gil
+
+    def __init__(self, workers: int = 2, max_size: int = 10 * 1024 * 1024, timeout: float = 10):
+        self.workers = workers
+        self.max_size = max_size
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # every worker is spawned and has imported the parsers before the first scrape
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        logging.info(f"started {self.workers} parser processes")
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self, parser: str, url: str, data: str) -> NewRecipe:
+        content = data.encode("utf-8")
+        if len(content) > self.max_size:
+            raise ParserException(f"{url} is larger than {self.max_size} bytes")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(parse_in_worker, parser, url, content, self.timeout)
+            # the worker interrupts itself at the timeout, this only covers a stuck worker
+            return future.result(timeout=self.timeout + 5)
+        except FutureTimeoutError:
+            self._reset(executor)
+            raise ParserException(f"parsing {url} took longer than {self.timeout:g}s")
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise ParserException(f"parser process stopped while parsing {url}")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if not self._executor:
+                # spawned, forking a process with browser and database threads is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_up,
+                )
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # shutdown alone leaves a hung worker running, so the processes are stopped here
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+                process.join(timeout=1)
+
+
+def warm_up():
+    from . import parsers  # noqa: F401
+
+
+def parse_in_worker(parser: str, url: str, content: bytes, timeout: float) -> NewRecipe:
+    from . import parsers
+    from .loaders import TextLoader
+
+    signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return getattr(parsers, parser)(url, TextLoader).parse_data(content.decode("utf-8"))
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def raise_timeout(signum, frame):
+    raise ParserException("parsing took too long")
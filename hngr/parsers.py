@@ -2,12 +2,17 @@ from typing import List
 from bs4 import BeautifulSoup, Tag
 import re
 import json
+import logging
 from abc import ABC, abstractmethod
-from urllib.parse import urlparse, urljoin
 
-from .exceptions import ParserException
+from .exceptions import BrowserPoolSaturated, ParserException
 from .schemes import NewRecipe
-from .loaders import FileLoader, RequestLoader, BrowserLoader, TextLoader
+from .jsonld import extract_json_ld, find_recipe
+from .metrics import PARSE_SECONDS
+from .pagecache import CachedLoader, PageCache
+from .parsepool import ParsePool
+from .urls import clean_url
+from .loaders import FileLoader, RequestLoader, BrowserLoader, TextLoader, TieredLoader
 
 
 class Parser(ABC):
@@ -16,35 +21,61 @@ class Parser(ABC):
         self,
         url: str,
         loader: (
-            type[FileLoader] | type[RequestLoader] | type[TextLoader] | type[BrowserLoader]
+            type[FileLoader]
+            | type[RequestLoader]
+            | type[TextLoader]
+            | type[BrowserLoader]
+            | type[TieredLoader]
+            | CachedLoader
         ) = RequestLoader,
     ):
         self.url = url
         self.loader = loader
 
-    @abstractmethod
     def parse(self) -> NewRecipe:
+        data = self.loader.load(self.url)
+        # timed without the load, downloads and renders have their own metrics
+        with PARSE_SECONDS.timer(type(self).__name__):
+            if ParserFactory.pool:
+                return ParserFactory.pool.parse(type(self).__name__, self.url, data)
+            return self.parse_data(data)
+
+    @abstractmethod
+    def parse_data(self, data: str) -> NewRecipe:
         pass
 
 
 class ParserFactory:
+    # set by the app on startup to keep fetched pages on disk
+    cache: PageCache | None = None
+    # set by the app on startup to parse in worker processes
+    pool: ParsePool | None = None
 
     @staticmethod
     def get_parser(source: str) -> Parser:
         if source == "mock":
             return MockParser(source, FileLoader)
         if "delish.com" in source:
-            return DelishParser(source)
+            return DelishParser(source, ParserFactory.loader(RequestLoader))
         if "bbcgoodfood.com" in source:
-            return BbcgoodfoodParser(source)
+            return BbcgoodfoodParser(source, ParserFactory.loader(RequestLoader))
         if "k-ruoka.fi" in source:
-            return KruokaParser(source, BrowserLoader)
-        return SchemaParser(source, BrowserLoader)
+            return KruokaParser(source, ParserFactory.loader(BrowserLoader))
+        return SchemaParser(source, ParserFactory.loader(TieredLoader))
+
+    @staticmethod
+    def loader(loader: type[RequestLoader] | type[BrowserLoader] | type[TieredLoader]):
+        if ParserFactory.cache:
+            return CachedLoader(loader, ParserFactory.cache)
+        return loader
 
 
 class MockParser(Parser):
 
     def parse(self):
+        return self.parse_data("")
+
+    def parse_data(self, data: str):
         return NewRecipe(
             name="Mock recipe",
             description="Description",
@@ -57,8 +88,7 @@ class MockParser(Parser):
 
 class BbcgoodfoodParser(Parser):
 
-    def parse(self) -> NewRecipe:
-        data = self.loader.load(self.url)
+    def parse_data(self, data: str) -> NewRecipe:
         soup = BeautifulSoup(data, "html.parser")
         return NewRecipe(
             name=self._get_name(soup),
@@ -112,8 +142,7 @@ class BbcgoodfoodParser(Parser):
 
 class DelishParser(Parser):
 
-    def parse(self) -> NewRecipe:
-        data = self.loader.load(self.url)
+    def parse_data(self, data: str) -> NewRecipe:
         soup = BeautifulSoup(data, "html.parser")
         return NewRecipe(
             name=self._get_title(soup),
@@ -184,13 +213,11 @@ class DelishParser(Parser):
 
 class KruokaParser(Parser):
 
-    def parse(self):
-        data = self.loader.load(self.url)
-        soup = BeautifulSoup(data, "html.parser")
-        json_data = soup.find("script", {"id": "recipe-json-ld"})
-        if not json_data:
+    def parse_data(self, data: str):
+        scripts = extract_json_ld(data, script_id="recipe-json-ld")
+        if not scripts:
             raise ParserException("'script#id=\"recipe-json-ld\"' element not found")
-        parsed_data = json.loads(json_data.text)
+        parsed_data = json.loads(scripts[0])
         return NewRecipe(
             name=parsed_data["name"],
             description=parsed_data["description"],
@@ -205,12 +232,19 @@ class SchemaParser(Parser):
 
     def parse(self):
         try:
-            data = self.loader.load(self.url)
-            soup = BeautifulSoup(data, "html.parser")
-            scripts = soup.find_all("script", {"type": "application/ld+json"})
+            return super().parse()
+        except (BrowserPoolSaturated, ParserException):
+            raise
+        except Exception as e:
+            logging.exception(f"could not parse {self.url}: {e}")
+            raise ParserException("Unable to parse, try manual creation")
+
+    def parse_data(self, data: str):
+        try:
+            scripts = extract_json_ld(data)
             if not scripts:
                 raise Exception("script element not found")
-            parsed_data = self._find_recipe(scripts)
+            parsed_data = find_recipe(scripts)
             if not parsed_data:
                 raise Exception("no recipe found")
             return NewRecipe(
@@ -224,7 +258,7 @@ class SchemaParser(Parser):
                 image=self._get_image(parsed_data),
             )
         except Exception as e:
-            print(e)
+            logging.warning(f"could not parse {self.url}: {e}")
             raise ParserException("Unable to parse, try manual creation")
 
     def _get_image(self, data: dict) -> str:
@@ -235,52 +269,6 @@ class SchemaParser(Parser):
                 return data["image"]
         return ""
 
-    def _find_recipe(self, scripts: List[Tag]):
-        try:
-            for script in scripts:
-                recipe = self._try_find_recipe_in_script(script)
-                print(recipe)
-                if recipe:
-                    return recipe
-            return None
-        except Exception as e:
-            print(self.url)
-            print("failed to find recipe: ", e)
-            return None
-
-    def _try_find_recipe_in_script(self, script: Tag) -> dict | None:
-        try:
-            json_data = self._try_parse_json(script)
-            if not json_data:
-                return None
-
-            data = json_data if "@graph" not in json_data else json_data["@graph"]
-
-            if isinstance(data, dict):
-                if data["@type"] == "Recipe":
-                    print("Found recipe")
-                    return data
-            elif isinstance(data, list):
-                for item in data:
-                    if item["@type"] == "Recipe":
-                        return item
-
-            return None
-        except:
-            return None
-
-    def _try_parse_json(self, script: Tag) -> dict | None:
-        try:
-            loaded = json.loads(script.text)
-            return loaded
-        except Exception:
-            return None
-
 
 def remove_whitespace(s: str) -> str:
     return re.sub(r"\s+", " ", s.strip())
-
-
-def clean_url(s: str) -> str:
-    parsed = urlparse(s)
-    return urljoin(s, parsed.path)
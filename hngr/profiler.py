@@ -0,0 +1,192 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Callable, Iterator, List, Set, Tuple, TypeVar
+from urllib.parse import parse_qs
+
+from .schemes import ProfileInfo
+
+DIRECTORY_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+EXTENSION = ".folded"
+
+# set while a profiled request runs, background work it starts can profile itself too
+current_profile: ContextVar[Tuple["ProfileStore", str] | None] = ContextVar(
+    "current_profile", default=None
+)
+# the profiler of the request, threads working for it add themselves while they run
+current_profiler: ContextVar["Profiler | None"] = ContextVar("current_profiler", default=None)
+
+T = TypeVar("T")
+
+
+class Profiler:
+
+    def __init__(self, interval: float = 0.005, thread_ids: Set[int] | None = None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.samples
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = collapse(frame)
+                if stack:
+                    self.samples[f"{names.get(ident, ident)};{stack}"] += 1
+
+
+@contextmanager
+def profiled_thread() -> Iterator[None]:
+    profiler = current_profiler.get()
+    if profiler is None or profiler.thread_ids is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profiler.thread_ids.add(ident)
+    try:
+        yield
+    finally:
+        profiler.thread_ids.discard(ident)
+
+
+def profiled(fn: Callable[..., T]) -> Callable[..., T]:
+    # executor threads don't inherit the context, the call takes a copy of the caller's along
+    context = copy_context()
+
+    def call(*args) -> T:
+        def run() -> T:
+            with profiled_thread():
+                return fn(*args)
+
+        return context.run(run)
+
+    return call
+
+
+def collapse(frame) -> str | None:
+    frames = []
+    is_ours = False
+    while frame:
+        code = frame.f_code
+        is_ours = is_ours or code.co_filename.startswith(DIRECTORY_PACKAGE)
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    # idle pool threads never run our code, they would only bury the request in noise
+    if not is_ours:
+        return None
+    return ";".join(reversed(frames))
+
+
+class ProfileStore:
+
+    def __init__(
+        self, directory: str, token: str = "", max_files: int = 50, interval: float = 0.005
+    ):
+        self.directory = directory
+        self.token = token
+        self.max_files = max_files
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def is_authorized(self, token: str | None) -> bool:
+        return bool(self.token) and hmac.compare_digest(token or "", self.token)
+
+    def save(self, name: str, samples: Counter[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name + EXTENSION), "w") as writer:
+            for stack, count in samples.most_common():
+                writer.write(f"{stack} {count}\n")
+        with self._lock:
+            for profile in self.list()[self.max_files :]:
+                os.remove(os.path.join(self.directory, profile.name + EXTENSION))
+                logging.info(f"removed profile {profile.name}")
+
+    def list(self) -> List[ProfileInfo]:
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(EXTENSION):
+                stat = entry.stat()
+                profiles.append(
+                    ProfileInfo(
+                        name=entry.name[: -len(EXTENSION)],
+                        size=stat.st_size,
+                        created_at=stat.st_mtime,
+                    )
+                )
+        return sorted(profiles, key=lambda profile: profile.created_at, reverse=True)
+
+    def path(self, name: str) -> str | None:
+        # only names that were listed, never a path from the request
+        if name not in {profile.name for profile in self.list()}:
+            return None
+        return os.path.join(self.directory, name + EXTENSION)
+
+
+def profile_name(label: str) -> str:
+    slug = "".join(c if c.isalnum() else "-" for c in label).strip("-")
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}"
+
+
+class ProfilerMiddleware:
+    # profiles a request sent with "X-Profile: 1" or "?profile=1" and the admin token
+
+    def __init__(self, app, store: ProfileStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.is_requested(scope):
+            return await self.app(scope, receive, send)
+
+        name = profile_name(f"{scope['method']} {scope['path']}")
+        # only the request's own threads, idle pool workers and other requests stay out
+        profiler = Profiler(interval=self.store.interval, thread_ids={threading.get_ident()})
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile", name.encode())]
+            await send(message)
+
+        token = current_profile.set((self.store, name))
+        profiler_token = current_profiler.set(profiler)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            samples = profiler.stop()
+            current_profiler.reset(profiler_token)
+            current_profile.reset(token)
+            self.store.save(name, samples)
+
+    def is_requested(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        flag = headers.get(b"x-profile") == b"1"
+        flag = flag or parse_qs(scope.get("query_string", b"").decode()).get("profile") == ["1"]
+        if not flag:
+            return False
+        token = headers.get(b"x-profile-token", b"").decode()
+        return self.store.is_authorized(token)
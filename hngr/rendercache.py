@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+from .schemes import RenderCacheStats
+
+
+class RenderCache:
+
+    def __init__(self, max_size: int = 16 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._pages: OrderedDict[Tuple[str, int, Hashable], Tuple[str, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, key: int, version: Hashable) -> str | None:
+        with self._lock:
+            entry = self._pages.get((kind, key, version))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pages.move_to_end((kind, key, version))
+            return entry[0]
+
+    def put(self, kind: str, key: int, version: Hashable, page: str):
+        size = len(page.encode("utf-8"))
+        if size > self.max_size:
+            return
+        with self._lock:
+            previous = self._pages.pop((kind, key, version), None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._pages[(kind, key, version)] = (page, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self._pages.popitem(last=False)
+                self.size -= evicted
+
+    def invalidate(self, recipe_id: int):
+        # versions are part of the keys, this only frees pages that can no longer be hit
+        with self._lock:
+            for cache_key in list(self._pages):
+                kind, key, _ = cache_key
+                if kind != "recipe" or key == recipe_id:
+                    self.size -= self._pages.pop(cache_key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+    def stats(self) -> RenderCacheStats:
+        with self._lock:
+            return RenderCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                entries=len(self._pages),
+                size=self.size,
+                max_size=self.max_size,
+            )
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 from urllib.parse import urlparse
 
@@ -10,6 +11,11 @@ class Recipe(BaseModel):
     ingredients: str
     source: str
     image: str
+    version: int = 1
+    updated_at: str | None = None
+    image_hash: str | None = None
+    image_width: int | None = None
+    image_height: int | None = None
 
     @property
     def source_label(self) -> str | None:
@@ -32,3 +38,83 @@ class NewRecipe(BaseModel):
     ingredients: str
     source: str
     image: str
+
+
+class ScrapeJob(BaseModel):
+    id: int
+    link: str
+    status: str
+    recipe_id: int | None = None
+    error: str | None = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+class ImportResult(BaseModel):
+    link: str
+    status: str
+    recipe_id: int | None = None
+    error: str | None = None
+
+
+class ImportReport(BaseModel):
+    results: List[ImportResult]
+    elapsed: float
+    links_per_second: float
+
+
+class ImportRequest(BaseModel):
+    links: List[str]
+    parallelism: int = 4
+
+
+class CachedPage(BaseModel):
+    url: str
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+    size: int
+    # missing on entries stored before statuses were, those are fetched again
+    status: int | None = None
+
+
+class Version(BaseModel):
+    version: int
+    updated_at: str
+
+
+class RecipeChanges(BaseModel):
+    updated: List[int]
+    deleted: List[int]
+    next: int
+    reset: bool = False
+
+
+class RenderCacheStats(BaseModel):
+    hits: int
+    misses: int
+    entries: int
+    size: int
+    max_size: int
+
+
+class ProfileInfo(BaseModel):
+    name: str
+    size: int
+    created_at: float
+
+
+class Ingredient(BaseModel):
+    line: str
+    quantity: float | None = None
+    unit: str | None = None
+    item: str
+
+
+class IngredientMatch(BaseModel):
+    id: int
+    name: str
+    matched: int
+    total: int
@@ -1,7 +1,9 @@
 "use strict";
 
-const version = 8;
+const version = 13;
 const cacheName = `hngr-v${version}`;
+const syncTokenUrl = "/api/recipes/changes/token";
+const maxBundleIds = 500;
 let isOnline = true;
 
 const urlsToCache = [
@@ -68,12 +70,20 @@ async function router(request) {
   if (url.origin == location.origin && request.method === "GET") {
     let response;
 
+    // local images are named by their content and never change
+    if (requestPathname.startsWith("/images/")) {
+      response = await cache.match(requestPathname);
+      if (response) {
+        return response;
+      }
+    }
+
     if (isOnline) {
       try {
         response = await fetch(request, {
           method: request.method,
           headers: request.headers,
-          cache: "no-store",
+          cache: "no-cache",
         });
 
         if (response && response.ok) {
@@ -159,41 +169,88 @@ async function cacheFiles({ forceReload = false }) {
 
 async function cacheRecipes({ forceReload = false }) {
   const cache = await caches.open(cacheName);
+  const since = forceReload ? 0 : await readSyncToken(cache);
 
-  const response = await fetch("/api/recipes", {
+  // only the recipes created, edited or deleted since the last sync
+  const response = await fetch(`/api/recipes/changes?since=${since}`, {
     method: "GET",
-    cache: "no-cache",
+    cache: "no-store",
   });
 
   if (!response.ok) {
     return;
   }
 
-  const { data } = await response.json();
+  const { updated, deleted, next, reset } = await response.json();
 
-  return Promise.all(
-    data.map(async ({ id }) => {
-      const recipeUrl = `/recipe/${id}`;
-      try {
-        let response;
-        if (!forceReload) {
-          response = await cache.match(recipeUrl);
-          if (response) {
-            return response;
-          }
-        }
+  if (reset) {
+    const requests = await cache.keys();
+    await Promise.all(
+      requests
+        .filter(({ url }) => new URL(url).pathname.startsWith("/recipe/"))
+        .map((request) => cache.delete(request)),
+    );
+  }
+  await Promise.all(deleted.map((id) => cache.delete(`/recipe/${id}`)));
+  let isCached = true;
+  if (since === 0 || reset || updated.length > maxBundleIds) {
+    isCached = await cacheBundle(cache, null);
+  } else if (updated.length > 0) {
+    isCached = await cacheBundle(cache, updated);
+  }
+  if (since > 0 && (updated.length > 0 || deleted.length > 0)) {
+    await cacheFiles({ forceReload: true });
+  }
 
-        response = await fetch(recipeUrl, {
-          method: "GET",
-          cache: "no-cache",
-        });
+  // a failed bundle is fetched again on the next sync
+  if (isCached) {
+    await cache.put(syncTokenUrl, new Response(String(next)));
+  }
+}
 
-        if (response.ok) {
-          await cache.put(recipeUrl, response.clone());
-        }
-      } catch (error) {
-        console.error(`Failed to cache ${recipeUrl} recipe: ${error}`);
+async function cacheBundle(cache, ids) {
+  const query = ids ? `?ids=${ids.join(",")}` : "";
+  try {
+    // every page in one response, one json object per line
+    const response = await fetch(`/api/recipes/bundle${query}`, {
+      method: "GET",
+      cache: "no-store",
+    });
+    if (!response.ok) {
+      return false;
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    const writes = [];
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      buffer += value || "";
+      const lines = buffer.split("\n");
+      buffer = done ? "" : lines.pop();
+      for (const line of lines.filter(Boolean)) {
+        const { url, headers, html } = JSON.parse(line);
+        const page = new Response(html, {
+          headers: { ...headers, "Content-Type": "text/html; charset=utf-8" },
+        });
+        writes.push(cache.put(url, page));
       }
-    }),
-  );
+      if (done) {
+        break;
+      }
+    }
+    await Promise.all(writes);
+    return true;
+  } catch (error) {
+    console.error(`Failed to cache recipes bundle: ${error}`);
+    return false;
+  }
+}
+
+async function readSyncToken(cache) {
+  const response = await cache.match(syncTokenUrl);
+  if (!response) {
+    return 0;
+  }
+  return Number(await response.text()) || 0;
 }
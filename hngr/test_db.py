@@ -1,17 +1,38 @@
 import os
+import time
+import asyncio
+import sqlite3
+import threading
 import pytest
 
 from .db import (
     Connection,
+    ConnectionPool,
+    alist_recipes,
+    backfill_canonical_sources,
+    backfill_ingredients,
     create_recipe,
     list_recipes,
+    list_recipes_page,
+    list_recipe_changes,
+    list_recipe_fields_page,
+    decode_cursor,
     retrieve_recipe,
+    retrieve_recipe_fields,
+    retrieve_recipe_id_by_source,
+    retrieve_recipes,
+    retrieve_recipe_version,
+    retrieve_revision,
     delete_recipe,
     search_recipes,
+    search_query,
+    name_search_query,
+    rank_recipes_by_ingredients,
+    rebuild_search_index,
     update_recipe,
 )
 from .schemes import NewRecipe
-from .exceptions import DatabaseConnectionClosed
+from .exceptions import DatabaseBusy, DatabaseConnectionClosed
 
 
 db_url = os.environ.get("DB", "")
@@ -25,6 +46,113 @@ def test_connection():
     assert not connection.connection
 
 
+def test_connection_uses_wal():
+    connection = Connection(db_url)
+    connection.open()
+    assert connection.connection
+    mode = connection.connection.execute("PRAGMA journal_mode").fetchone()[0]
+    connection.close()
+    assert mode == "wal"
+
+
+def test_pool_reuses_reader():
+    pool = ConnectionPool(db_url, size=1)
+    with pool.reader() as connection:
+        first = connection.connection
+        assert retrieve_recipe(connection, 999) is None
+    with pool.reader() as connection:
+        assert connection.connection is first
+    pool.close()
+
+
+def test_pool_reader_is_readonly():
+    pool = ConnectionPool(db_url, size=1)
+    with pool.reader() as connection:
+        with pytest.raises(sqlite3.OperationalError):
+            delete_recipe(connection, 999)
+    pool.close()
+
+
+def test_pool_writer():
+    pool = ConnectionPool(db_url, size=1)
+    pool.open()
+    with pool.writer() as connection:
+        assert delete_recipe(connection, 999) == False
+    pool.close()
+
+
+def test_pool_async_does_not_block_event_loop():
+    pool = ConnectionPool(db_url, size=2)
+
+    async def run():
+        lags = []
+
+        async def tick():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - started - 0.01)
+
+        ticker = asyncio.create_task(tick())
+        # a slow write holds the writer while reads keep queueing up behind the readers
+        results = await asyncio.gather(
+            pool.write(lambda connection: time.sleep(0.3)),
+            *[alist_recipes(pool) for _ in range(20)],
+        )
+        ticker.cancel()
+        return lags, results
+
+    lags, results = asyncio.run(run())
+    pool.close()
+    assert all(isinstance(recipes, list) for recipes in results[1:])
+    assert len(lags) > 10
+    assert max(lags) < 0.1
+
+
+def test_pool_rejects_when_queue_is_full():
+    pool = ConnectionPool(db_url, size=1, max_queued=2)
+    release = threading.Event()
+
+    async def run():
+        # one call running and one waiting fill the queue
+        blocked = [
+            asyncio.create_task(pool.read(lambda connection: release.wait(5))) for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        with pytest.raises(DatabaseBusy):
+            await alist_recipes(pool)
+        # writes have their own queue
+        await pool.write(lambda connection: None)
+        release.set()
+        await asyncio.gather(*blocked)
+        return await alist_recipes(pool)
+
+    recipes = asyncio.run(run())
+    pool.close()
+    assert isinstance(recipes, list)
+
+
+def test_pool_keeps_slot_of_cancelled_call():
+    pool = ConnectionPool(db_url, size=1, max_queued=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.create_task(pool.read(lambda connection: release.wait(5)))
+        await asyncio.sleep(0.05)
+        blocked.cancel()
+        await asyncio.sleep(0.05)
+        # the thread still runs the cancelled call, so its slot stays taken
+        with pytest.raises(DatabaseBusy):
+            await alist_recipes(pool)
+        release.set()
+        await asyncio.sleep(0.05)
+        return await alist_recipes(pool)
+
+    recipes = asyncio.run(run())
+    pool.close()
+    assert isinstance(recipes, list)
+
+
 def test_retrieve_recipe_does_not_exist():
     connection = Connection(db_url)
     connection.open()
@@ -160,6 +288,251 @@ def test_delete_recipe_failure():
     assert is_deleted == False
 
 
+def test_recipe_versions():
+    connection = Connection(db_url)
+    connection.open()
+
+    revision = retrieve_revision(connection)
+    recipe_id = create_recipe(
+        connection,
+        new_recipe=NewRecipe(
+            name="Versioned recipe",
+            description="Test Description",
+            directions="Test Instructions",
+            ingredients="Test ingredients",
+            source="versioned source",
+            image="imagepath",
+        ),
+    )
+    assert retrieve_revision(connection).version == revision.version + 1
+
+    version = retrieve_recipe_version(connection, recipe_id)
+    assert version
+    assert version.version == 1
+    assert version.updated_at
+
+    recipe = retrieve_recipe(connection, recipe_id)
+    assert recipe
+    recipe.name = "Versioned recipe updated"
+    update_recipe(connection, recipe)
+    assert recipe.version == 2
+    version = retrieve_recipe_version(connection, recipe_id)
+    assert version
+    assert version.version == 2
+    assert retrieve_revision(connection).version == revision.version + 2
+
+    delete_recipe(connection, recipe_id)
+    assert not retrieve_recipe_version(connection, recipe_id)
+    assert retrieve_revision(connection).version == revision.version + 3
+
+    connection.close()
+
+
+def test_list_recipe_changes():
+    connection = Connection(db_url)
+    connection.open()
+
+    since = retrieve_revision(connection).version
+    recipe_ids = [
+        create_recipe(
+            connection,
+            new_recipe=NewRecipe(
+                name=f"Changed recipe {i}",
+                description="",
+                directions="",
+                ingredients="",
+                source=f"changed source {i}",
+                image="",
+            ),
+        )
+        for i in range(3)
+    ]
+    changes = list_recipe_changes(connection, since)
+    assert changes.updated == recipe_ids
+    assert changes.deleted == []
+    assert not changes.reset
+
+    since = changes.next
+    recipe = retrieve_recipe(connection, recipe_ids[1])
+    assert recipe
+    update_recipe(connection, recipe)
+    delete_recipe(connection, recipe_ids[0])
+    changes = list_recipe_changes(connection, since)
+    assert changes.updated == [recipe_ids[1]]
+    assert changes.deleted == [recipe_ids[0]]
+
+    changes = list_recipe_changes(connection, changes.next)
+    assert changes.updated == []
+    assert changes.deleted == []
+
+    changes = list_recipe_changes(connection, changes.next + 100)
+    assert changes.reset
+    assert recipe_ids[2] in changes.updated
+
+    for recipe_id in recipe_ids[1:]:
+        delete_recipe(connection, recipe_id)
+    connection.close()
+
+
+def ingredient_rows(connection: Connection, recipe_id: int) -> list:
+    assert connection.connection
+    return connection.connection.execute(
+        "SELECT item, head FROM recipe_ingredients WHERE recipe_id = ? ORDER BY position",
+        [recipe_id],
+    ).fetchall()
+
+
+def test_recipe_ingredients_are_stored():
+    connection = Connection(db_url)
+    connection.open()
+
+    recipe_id = create_recipe(
+        connection,
+        new_recipe=NewRecipe(
+            name="Ingredient recipe",
+            description="",
+            directions="",
+            ingredients="2 red kohlrabis\n1 tbsp olive oil",
+            source="ingredient source",
+            image="",
+        ),
+    )
+    assert ingredient_rows(connection, recipe_id) == [
+        ("red kohlrabi", "kohlrabi"),
+        ("olive oil", "oil"),
+    ]
+
+    recipe = retrieve_recipe(connection, recipe_id)
+    assert recipe
+    recipe.ingredients = "3 parsnips"
+    update_recipe(connection, recipe)
+    assert ingredient_rows(connection, recipe_id) == [("parsnip", "parsnip")]
+
+    delete_recipe(connection, recipe_id)
+    assert ingredient_rows(connection, recipe_id) == []
+    connection.close()
+
+
+def test_rank_recipes_by_ingredients():
+    connection = Connection(db_url)
+    connection.open()
+
+    recipe_ids = [
+        create_recipe(
+            connection,
+            new_recipe=NewRecipe(
+                name=name,
+                description="",
+                directions="",
+                ingredients=ingredients,
+                source=f"ranked source {name}",
+                image="",
+            ),
+        )
+        for name, ingredients in [
+            ("Ranked one", "1 rutabaga\nsalt\npepper"),
+            ("Ranked two", "2 rutabagas\n1 celeriac, peeled"),
+            ("Ranked three", "1 yellow rutabaga\n1 celeriac\n1 fennel"),
+            ("Ranked four", "1 fennel bulb"),
+        ]
+    ]
+
+    matches = rank_recipes_by_ingredients(connection, ["Rutabagas", "celeriac", "fennel"])
+    assert [(match.name, match.matched, match.total) for match in matches] == [
+        ("Ranked three", 3, 3),
+        ("Ranked two", 2, 2),
+        ("Ranked four", 1, 1),
+        ("Ranked one", 1, 3),
+    ]
+    assert rank_recipes_by_ingredients(connection, ["rutabaga"], limit=1)[0].name == "Ranked two"
+    assert rank_recipes_by_ingredients(connection, ["", " "]) == []
+
+    for recipe_id in recipe_ids:
+        delete_recipe(connection, recipe_id)
+    connection.close()
+
+
+def test_backfill_ingredients():
+    connection = Connection(db_url)
+    connection.open()
+    assert connection.connection
+
+    cursor = connection.connection.execute(
+        """
+        INSERT INTO
+            recipes (name, description, directions, ingredients, source, image)
+        VALUES
+            ('Backfilled', '', '', '1 kg turnips', 'backfill source', '')
+        """
+    )
+    recipe_id = cursor.lastrowid
+    connection.connection.commit()
+    assert ingredient_rows(connection, recipe_id) == []
+
+    assert backfill_ingredients(connection, batch_size=1) >= 1
+    assert ingredient_rows(connection, recipe_id) == [("turnip", "turnip")]
+    assert backfill_ingredients(connection) == 0
+
+    delete_recipe(connection, recipe_id)
+    connection.close()
+
+
+def test_create_recipe_throws_on_canonical_source():
+    connection = Connection(db_url)
+    connection.open()
+
+    new_recipe = NewRecipe(
+        name="Canonical recipe",
+        description="",
+        directions="",
+        ingredients="",
+        source="https://example.com/canonical",
+        image="",
+    )
+    recipe_id = create_recipe(connection, new_recipe)
+    assert (
+        retrieve_recipe_id_by_source(connection, "http://www.EXAMPLE.com/canonical/") == recipe_id
+    )
+    assert retrieve_recipe_id_by_source(connection, "https://example.com/other") is None
+    assert retrieve_recipe_id_by_source(connection, "") is None
+
+    new_recipe.source = "http://www.example.com/canonical/?utm_source=feed"
+    with pytest.raises(ValueError, match="already exists"):
+        create_recipe(connection, new_recipe)
+
+    delete_recipe(connection, recipe_id)
+    connection.close()
+
+
+def test_backfill_canonical_sources():
+    connection = Connection(db_url)
+    connection.open()
+    assert connection.connection
+
+    recipe_ids = []
+    for source in ["http://www.example.com/backfill", "https://example.com/backfill/"]:
+        cursor = connection.connection.execute(
+            """
+            INSERT INTO
+                recipes (name, description, directions, ingredients, source, image)
+            VALUES
+                ('Backfilled source', '', '', '', ?, '')
+            """,
+            [source],
+        )
+        recipe_ids.append(cursor.lastrowid)
+    connection.connection.commit()
+    assert retrieve_recipe_id_by_source(connection, "https://example.com/backfill") is None
+
+    assert backfill_canonical_sources(connection) >= 2
+    assert retrieve_recipe_id_by_source(connection, "https://example.com/backfill") == recipe_ids[0]
+    assert backfill_canonical_sources(connection) == 0
+
+    for recipe_id in recipe_ids:
+        delete_recipe(connection, recipe_id)
+    connection.close()
+
+
 def test_search_recipe_uppercase(populate_db):
     connection = Connection(db_url)
     connection.open()
@@ -189,6 +562,41 @@ def test_search_recipe_end(populate_db):
     assert items[0].name == "Search recipe"
 
 
+def test_search_recipe_middle_of_name(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    items = search_recipes(connection, "arch rec")
+    # too short for a trigram, never a scan of every name
+    short = search_recipes(connection, "ea")
+    connection.close()
+    assert [item.name for item in items] == ["Search recipe"]
+    assert short == []
+
+
+def test_search_index_skips_unindexed_updates(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    assert connection.connection
+
+    def index_size():
+        return connection.connection.execute("SELECT COUNT(*) FROM recipes_search_data").fetchone()
+
+    before = index_size()
+    connection.connection.execute("UPDATE recipes SET version = version + 1 WHERE id = 51")
+    unchanged = index_size()
+    connection.connection.execute("UPDATE recipes SET name = 'Searched recipe' WHERE id = 51")
+    renamed = search_recipes(connection, "searched")
+    connection.connection.rollback()
+    connection.close()
+    assert unchanged == before
+    assert [item.id for item in renamed] == [51]
+
+
+def test_name_search_query_quotes_term():
+    assert name_search_query(' a "b" c ') == '"a ""b"" c"'
+    assert name_search_query("ab") == ""
+
+
 def test_search_recipe_multiple_terms(populate_db):
     connection = Connection(db_url)
     connection.open()
@@ -197,3 +605,185 @@ def test_search_recipe_multiple_terms(populate_db):
     assert len(items) == 1
     assert len(items) == 1
     assert items[0].name == "Search recipe"
+
+
+def test_search_recipe_ingredients():
+    connection = Connection(db_url)
+    connection.open()
+    recipe_id = create_recipe(
+        connection,
+        NewRecipe(
+            name="Plain soup",
+            description="",
+            directions="Boil everything",
+            ingredients="1 kohlrabi\n2 parsnips",
+            source="",
+            image="",
+        ),
+    )
+    items = search_recipes(connection, "kohlr")
+    delete_recipe(connection, recipe_id)
+    connection.close()
+    assert [item.id for item in items] == [recipe_id]
+
+
+def test_search_recipe_name_ranks_first():
+    connection = Connection(db_url)
+    connection.open()
+    by_ingredient = create_recipe(
+        connection,
+        NewRecipe(
+            name="Stew",
+            description="",
+            directions="",
+            ingredients="quinceberry",
+            source="",
+            image="",
+        ),
+    )
+    by_name = create_recipe(
+        connection,
+        NewRecipe(
+            name="Quinceberry pie",
+            description="",
+            directions="",
+            ingredients="",
+            source="",
+            image="",
+        ),
+    )
+    items = search_recipes(connection, "quinceberry")
+    limited = search_recipes(connection, "quinceberry", limit=1)
+    delete_recipe(connection, by_ingredient)
+    delete_recipe(connection, by_name)
+    connection.close()
+    assert [item.id for item in items] == [by_name, by_ingredient]
+    assert [item.id for item in limited] == [by_name]
+
+
+def test_search_recipe_deleted_is_not_found():
+    connection = Connection(db_url)
+    connection.open()
+    recipe_id = create_recipe(
+        connection,
+        NewRecipe(
+            name="Vanishing gazpacho",
+            description="",
+            directions="",
+            ingredients="",
+            source="",
+            image="",
+        ),
+    )
+    delete_recipe(connection, recipe_id)
+    items = search_recipes(connection, "gazpacho")
+    connection.close()
+    assert items == []
+
+
+def test_search_query_quotes_words():
+    assert search_query('chick "pea" OR') == '"chick"* "pea"* "OR"*'
+    assert search_query("  ") == ""
+
+
+def test_rebuild_search_index(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    rebuild_search_index(connection)
+    items = search_recipes(connection, "search recipe")
+    connection.close()
+    assert items[0].name == "Search recipe"
+
+
+def test_list_recipes_page_walks_all_recipes(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    everything = list_recipes(connection)
+    seen = []
+    cursor = None
+    while True:
+        recipes, cursor = list_recipes_page(connection, cursor, 2)
+        seen += recipes
+        if not cursor:
+            break
+    connection.close()
+    assert seen == everything
+
+
+def test_list_recipe_fields_page_walks_all_recipes(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    everything = list_recipes(connection)
+    seen = []
+    cursor = None
+    while True:
+        recipes, cursor = list_recipe_fields_page(connection, cursor, 2, ["image", "id"])
+        seen += recipes
+        if not cursor:
+            break
+    connection.close()
+    assert [recipe["id"] for recipe in seen] == [recipe.id for recipe in everything]
+    assert all(list(recipe) == ["image", "id"] for recipe in seen)
+
+
+def test_retrieve_recipe_fields(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+    recipe = retrieve_recipe(connection, 101)
+    fields = retrieve_recipe_fields(connection, 101, ["name", "version"])
+    missing = retrieve_recipe_fields(connection, 999, ["name"])
+    with pytest.raises(ValueError):
+        retrieve_recipe_fields(connection, 101, ["name", "1; DROP TABLE recipes"])
+    connection.close()
+    assert recipe
+    assert fields == {"name": recipe.name, "version": recipe.version}
+    assert missing is None
+
+
+def test_list_recipes_page_same_names():
+    connection = Connection(db_url)
+    connection.open()
+    ids = [
+        create_recipe(
+            connection,
+            NewRecipe(
+                name="Zzz same name",
+                description="",
+                directions="",
+                ingredients="",
+                source="",
+                image="",
+            ),
+        )
+        for _ in range(3)
+    ]
+    recipes = list_recipes(connection, after=("Zzz same name", ids[0]), limit=10)
+    for recipe_id in ids:
+        delete_recipe(connection, recipe_id)
+    connection.close()
+    assert [recipe.id for recipe in recipes][:2] == ids[1:]
+
+
+def test_retrieve_recipes(populate_db):
+    connection = Connection(db_url)
+    connection.open()
+
+    recipes = retrieve_recipes(connection)
+    recipe_ids = [recipe.id for recipe in recipes]
+    assert recipe_ids == sorted(recipe_ids)
+    assert len(recipe_ids) > 2
+
+    recipes = retrieve_recipes(connection, [recipe_ids[2], recipe_ids[0], 999])
+    assert [recipe.id for recipe in recipes] == [recipe_ids[0], recipe_ids[2]]
+    assert recipes[0] == retrieve_recipe(connection, recipe_ids[0])
+
+    recipes = retrieve_recipes(connection, after=recipe_ids[0], limit=1)
+    assert [recipe.id for recipe in recipes] == [recipe_ids[1]]
+    assert retrieve_recipes(connection, []) == []
+
+    connection.close()
+
+
+def test_decode_cursor_invalid():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
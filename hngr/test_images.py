@@ -0,0 +1,128 @@
+import io
+import os
+import httpx
+from PIL import Image
+
+from .db import ConnectionPool, create_recipe, delete_recipe, retrieve_recipe
+from .images import ImageQueue, ImageStore, image_src, image_srcset, variant_widths
+from .loaders import RequestLoader
+from .schemes import NewRecipe, Recipe
+
+
+db_url = os.environ.get("DB", "")
+
+
+def jpeg(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_variant_widths():
+    assert variant_widths(2000) == [320, 640, 1280]
+    assert variant_widths(800) == [320, 640, 800]
+    assert variant_widths(200) == [200]
+
+
+def test_image_store_saves_variants(tmp_path):
+    store = ImageStore(str(tmp_path))
+    image_hash, width, height = store.save(jpeg(2000, 1000))
+    assert (width, height) == (2000, 1000)
+    assert sorted(os.listdir(tmp_path)) == [
+        f"{image_hash}-1280.webp",
+        f"{image_hash}-320.webp",
+        f"{image_hash}-640.webp",
+    ]
+    with Image.open(tmp_path / f"{image_hash}-320.webp") as variant:
+        assert variant.size == (320, 160)
+
+    # the same content is not encoded again
+    assert store.save(jpeg(2000, 1000))[0] == image_hash
+    assert store.path(f"{image_hash}-640.webp") == str(tmp_path / f"{image_hash}-640.webp")
+    assert store.path(f"{image_hash}-100.webp") is None
+    assert store.path("../service-worker.js") is None
+
+
+def test_image_srcset():
+    recipe = Recipe(
+        id=1,
+        name="",
+        description="",
+        directions="",
+        ingredients="",
+        source="",
+        image="https://example.com/a.jpg",
+        image_hash="a" * 32,
+        image_width=800,
+        image_height=600,
+    )
+    assert image_src(recipe) == f"/images/{'a' * 32}-800.webp"
+    assert image_srcset(recipe) == ", ".join(
+        f"/images/{'a' * 32}-{width}.webp {width}w" for width in [320, 640, 800]
+    )
+    recipe.image_hash = None
+    assert image_srcset(recipe) == ""
+
+
+def test_image_queue_stores_image(monkeypatch, tmp_path):
+    pool = ConnectionPool(db_url)
+    queue = ImageQueue(pool, ImageStore(str(tmp_path)))
+    responses = {
+        "https://example.com/image.jpg": (jpeg(400, 300), "image/jpeg"),
+        "https://example.com/page.html": (b"<html></html>", "text/html"),
+    }
+    monkeypatch.setattr(RequestLoader, "load_bytes", lambda source: responses[source])
+
+    with pool.writer() as connection:
+        recipe_ids = [
+            create_recipe(
+                connection,
+                NewRecipe(
+                    name="Image recipe",
+                    description="",
+                    directions="",
+                    ingredients="",
+                    source=f"image source {image}",
+                    image=image,
+                ),
+            )
+            for image in responses
+        ]
+    assert not queue.submit(recipe_ids[0], "Test image")
+
+    for recipe_id, image in zip(recipe_ids, responses):
+        queue._run(recipe_id, image)
+
+    with pool.writer() as connection:
+        stored = retrieve_recipe(connection, recipe_ids[0])
+        failed = retrieve_recipe(connection, recipe_ids[1])
+        for recipe_id in recipe_ids:
+            delete_recipe(connection, recipe_id)
+    pool.close()
+
+    assert stored and stored.image_hash
+    assert (stored.image_width, stored.image_height) == (400, 300)
+    assert stored.version == 2
+    assert os.listdir(tmp_path)
+    # a page instead of an image is not fetched again and keeps the version
+    assert failed and failed.image_hash == ""
+    assert failed.version == 1
+
+
+def test_image_queue_backs_off_after_failure(monkeypatch, tmp_path):
+    pool = ConnectionPool(db_url)
+    queue = ImageQueue(pool, ImageStore(str(tmp_path)), retry_delay=60)
+
+    def load_bytes(source: str):
+        raise httpx.ConnectError("connection reset")
+
+    monkeypatch.setattr(RequestLoader, "load_bytes", load_bytes)
+    queue._run(1, "https://example.com/image.jpg")
+    assert not queue.submit(1, "https://example.com/image.jpg")
+
+    queue.retry_delay = 0
+    queue._run(1, "https://example.com/image.jpg")
+    assert queue.submit(1, "https://example.com/image.jpg")
+    # the retry fails again before the patched loader goes away
+    queue._executor.shutdown(wait=True)
+    pool.close()
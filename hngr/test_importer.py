@@ -0,0 +1,80 @@
+import os
+import sqlite3
+
+from . import importer
+from .db import ConnectionPool, create_recipes, delete_recipe
+from .importer import import_links, links_from_json, read_links
+from .schemes import NewRecipe
+
+
+db_url = os.environ.get("DB", "")
+
+
+def test_read_links_request_file():
+    assert read_links("./requests/scrape.json") == ["mock"]
+
+
+def test_read_links_text_file(tmp_path):
+    path = tmp_path / "links.txt"
+    path.write_text("https://example.com/a\n\nhttps://example.com/b\n")
+    assert read_links(str(path)) == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_links_from_json():
+    data = [
+        "https://example.com/a",
+        {"links": ["https://example.com/b"]},
+        {"variables": {"link": "c"}},
+    ]
+    assert links_from_json(data) == [
+        "https://example.com/a",
+        "https://example.com/b",
+        "c",
+    ]
+
+
+def test_import_links_reports_every_link():
+    pool = ConnectionPool(db_url)
+    report = import_links(pool, ["mock", "mock?again", "invalidsource.com"], parallelism=2)
+    statuses = {result.link: result.status for result in report.results}
+    created = [result.recipe_id for result in report.results if result.status == "created"]
+    with pool.writer() as connection:
+        for recipe_id in created:
+            delete_recipe(connection, recipe_id)
+    pool.close()
+
+    assert statuses["mock?again"] == "duplicate"
+    assert statuses["mock"] in ("created", "duplicate")
+    assert statuses["invalidsource.com"] == "parse_error"
+    assert report.links_per_second > 0
+
+
+def test_import_links_reports_failed_inserts(monkeypatch):
+    def parse_link(link: str) -> NewRecipe:
+        name = "Broken" if link.endswith("broken") else "Imported"
+        return NewRecipe(
+            name=name, description="", directions="", ingredients="", source=link, image=""
+        )
+
+    def insert(connection, new_recipes):
+        if any(new_recipe.name == "Broken" for new_recipe in new_recipes):
+            raise sqlite3.IntegrityError("constraint failed")
+        return create_recipes(connection, new_recipes)
+
+    monkeypatch.setattr(importer, "parse_link", parse_link)
+    monkeypatch.setattr(importer, "create_recipes", insert)
+    pool = ConnectionPool(db_url)
+    links = ["https://example.com/first", "https://example.com/broken", "https://example.com/last"]
+    report = import_links(pool, links)
+    results = {result.link: result for result in report.results}
+    with pool.writer() as connection:
+        for result in report.results:
+            if result.recipe_id:
+                delete_recipe(connection, result.recipe_id)
+    pool.close()
+
+    # the other links of the batch are still stored
+    assert results["https://example.com/first"].status == "created"
+    assert results["https://example.com/last"].status == "created"
+    assert results["https://example.com/broken"].status == "error"
+    assert "constraint failed" in results["https://example.com/broken"].error
@@ -0,0 +1,58 @@
+from .ingredients import canonical_item, parse_ingredient, parse_ingredients, parse_quantity
+
+
+def test_parse_ingredient():
+    ingredient = parse_ingredient("2 cloves garlic, finely chopped")
+    assert ingredient.line == "2 cloves garlic, finely chopped"
+    assert ingredient.quantity == 2
+    assert ingredient.unit == "clove"
+    assert ingredient.item == "garlic"
+
+
+def test_parse_ingredient_descriptors():
+    ingredient = parse_ingredient("2 boneless, skinless chicken breasts (about 500g)")
+    assert ingredient.quantity == 2
+    assert ingredient.unit is None
+    assert ingredient.item == "chicken breast"
+
+
+def test_parse_ingredient_unit_of():
+    ingredient = parse_ingredient("1 ½ cups of plain flour")
+    assert ingredient.quantity == 1.5
+    assert ingredient.unit == "cup"
+    assert ingredient.item == "plain flour"
+
+
+def test_parse_ingredient_finnish():
+    ingredient = parse_ingredient("2 rkl voita")
+    assert ingredient.quantity == 2
+    assert ingredient.unit == "rkl"
+    assert ingredient.item == "voita"
+
+
+def test_parse_ingredient_without_quantity():
+    ingredient = parse_ingredient("salt, to taste")
+    assert ingredient.quantity is None
+    assert ingredient.unit is None
+    assert ingredient.item == "salt"
+
+
+def test_parse_quantity():
+    assert parse_quantity("1/2") == 0.5
+    assert parse_quantity("1 1/2") == 1.5
+    assert parse_quantity("0,5") == 0.5
+    assert parse_quantity("¾") == 0.75
+    assert parse_quantity("1/0") == 0
+
+
+def test_parse_ingredients_skips_empty_lines():
+    ingredients = parse_ingredients("1 onion\n\n  \n2 tomatoes")
+    assert [ingredient.item for ingredient in ingredients] == ["onion", "tomato"]
+
+
+def test_canonical_item():
+    assert canonical_item("Fresh Tomatoes") == "tomato"
+    assert canonical_item("berries") == "berry"
+    assert canonical_item("peaches") == "peach"
+    assert canonical_item("grass") == "grass"
+    assert canonical_item("") == ""
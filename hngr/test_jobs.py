@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from . import jobs
+from .db import (
+    ConnectionPool,
+    create_scrape_job,
+    delete_recipe,
+    retrieve_recipe_id_by_source,
+    retrieve_scrape_job,
+    update_scrape_job,
+)
+from .jobs import ScrapeQueue, scrape_outcome
+from .exceptions import DuplicateRecipe, LoaderException, ParserException
+from .schemes import NewRecipe
+
+
+db_url = os.environ.get("DB", "")
+
+
+def wait_for_job(pool: ConnectionPool, job_id: int):
+    for _ in range(100):
+        with pool.reader() as connection:
+            job = retrieve_scrape_job(connection, job_id)
+        if job and job.is_finished:
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"scrape job {job_id} did not finish")
+
+
+def test_scrape_job_crud():
+    pool = ConnectionPool(db_url)
+    with pool.writer() as connection:
+        job_id = create_scrape_job(connection, "https://example.com/crud")
+        job = retrieve_scrape_job(connection, job_id)
+        assert job
+        assert job.status == "queued"
+        assert not job.is_finished
+        update_scrape_job(connection, job_id, "failed", error="broken")
+        job = retrieve_scrape_job(connection, job_id)
+        assert job
+        assert job.status == "failed"
+        assert job.error == "broken"
+    pool.close()
+
+
+def test_scrape_queue_resumes_unfinished_jobs():
+    pool = ConnectionPool(db_url)
+    with pool.writer() as connection:
+        queued = create_scrape_job(connection, "mock")
+        running = create_scrape_job(connection, "mock")
+        update_scrape_job(connection, running, "running")
+
+    queue = ScrapeQueue(pool, workers=1)
+    queue.start()
+    jobs = [wait_for_job(pool, queued), wait_for_job(pool, running)]
+    queue.stop()
+
+    # both jobs ran, the second one finds the recipe the first one created
+    assert [job.status for job in jobs] == ["done", "failed"]
+    with pool.writer() as connection:
+        delete_recipe(connection, jobs[0].recipe_id)
+    pool.close()
+
+
+def test_scrape_outcome():
+    assert scrape_outcome(None) == "success"
+    assert scrape_outcome(DuplicateRecipe("mock")) == "duplicate"
+    assert scrape_outcome(ParserException("no recipe")) == "parser_error"
+    assert scrape_outcome(LoaderException("too large")) == "error"
+
+
+def test_scrape_queue_releases_slot_when_job_is_not_created(monkeypatch):
+    def broken(connection, link):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(jobs, "create_scrape_job", broken)
+    pool = ConnectionPool(db_url)
+    queue = ScrapeQueue(pool, workers=1, max_queued=1)
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            queue.submit("https://example.com/locked")
+    assert queue._pending == 0
+    pool.close()
+
+
+def test_scrape_queue_stop_refuses_writes(monkeypatch):
+    parsing = threading.Event()
+    release = threading.Event()
+
+    def parse_link(link, max_attempts):
+        parsing.set()
+        release.wait(5)
+        return NewRecipe(
+            name="Late", description="", directions="", ingredients="", source=link, image=""
+        )
+
+    monkeypatch.setattr(jobs, "parse_link", parse_link)
+    pool = ConnectionPool(db_url)
+    queue = ScrapeQueue(pool, workers=1)
+    job = queue.submit("https://example.com/late")
+    assert parsing.wait(5)
+    queue.stop()
+    release.set()
+    for _ in range(100):
+        if queue._pending == 0:
+            break
+        time.sleep(0.05)
+
+    # the job is left running for the next start instead of writing after the stop
+    assert queue._pending == 0
+    with pool.writer() as connection:
+        assert retrieve_scrape_job(connection, job.id).status == "running"
+        assert retrieve_recipe_id_by_source(connection, "https://example.com/late") is None
+        update_scrape_job(connection, job.id, "failed", error="stopped")
+    pool.close()
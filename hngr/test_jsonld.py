@@ -0,0 +1,76 @@
+import json
+
+from .jsonld import RecipeScanner, extract_json_ld, find_recipe, parse_json_ld, scan_json_ld
+from .loaders import FileLoader
+
+
+def test_scan_json_ld_mock():
+    data = FileLoader.load("./mocks/bbcgoodfood.html")
+    scripts = scan_json_ld(data)
+    assert len(scripts) == 4
+    assert scripts == parse_json_ld(data)
+
+
+def test_scan_json_ld_by_id():
+    data = FileLoader.load("./mocks/kruoka.html")
+    scripts = scan_json_ld(data, script_id="recipe-json-ld")
+    assert len(scripts) == 1
+    assert json.loads(scripts[0])["name"] == "Helppo kalakeitto"
+    assert scan_json_ld(data, script_id="missing") == []
+
+
+def test_scan_json_ld_ignores_other_scripts():
+    data = '<script>var a = 1;</script><script type="text/javascript">{}</script>'
+    assert scan_json_ld(data) == []
+
+
+def test_extract_json_ld_falls_back_to_html_parser():
+    # the attribute value holds a '>' which the scan can't step over
+    data = '<script data-x="a>b" type="application/ld+json">{"@type": "Recipe"}</script>'
+    assert extract_json_ld(data) == ['{"@type": "Recipe"}']
+
+
+def test_find_recipe():
+    scripts = [
+        "not json",
+        json.dumps({"@type": "WebPage"}),
+        json.dumps({"@graph": [{"@type": "WebSite"}, {"@type": ["Recipe"], "name": "Soup"}]}),
+    ]
+    recipe = find_recipe(scripts)
+    assert recipe
+    assert recipe["name"] == "Soup"
+    assert find_recipe(scripts[:2]) is None
+
+
+def test_recipe_scanner_across_chunks():
+    data = FileLoader.load("./mocks/bbcgoodfood.html")
+    scanner = RecipeScanner()
+    chunks = [data[i : i + 1000] for i in range(0, len(data), 1000)]
+    fed = 0
+    for chunk in chunks:
+        fed += 1
+        if scanner.feed(chunk):
+            break
+    assert scanner.recipe == find_recipe(extract_json_ld(data))
+    assert fed < len(chunks)
+    assert data.startswith(scanner.text)
+
+
+def test_recipe_scanner_without_recipe():
+    scanner = RecipeScanner()
+    assert not scanner.feed('<script type="application/ld+json">{"@type": "Web')
+    assert not scanner.feed('Site"}</script><scr')
+    assert not scanner.feed("ipt>var a = 1;</script>")
+    assert scanner.recipe is None
+
+
+def test_find_recipe_skips_scalar_blocks():
+    recipe = json.dumps({"@type": "Recipe", "name": "Soup"})
+    assert find_recipe(["null", "3", '"text"', recipe]) == {"@type": "Recipe", "name": "Soup"}
+
+    scanner = RecipeScanner()
+    assert scanner.feed(
+        '<script type="application/ld+json">null</script>'
+        f'<script type="application/ld+json">{recipe}</script>'
+    )
+    assert scanner.recipe and scanner.recipe["name"] == "Soup"
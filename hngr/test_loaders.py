@@ -1,4 +1,35 @@
-from .loaders import FileLoader, TextLoader
+import os
+import sys
+import asyncio
+import gzip
+import subprocess
+from contextlib import contextmanager
+from types import SimpleNamespace
+import httpx
+import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from .loaders import (
+    MAX_DOWNLOAD_SIZE,
+    BrowserLoader,
+    BrowserPool,
+    Download,
+    FileLoader,
+    RequestLoader,
+    TextLoader,
+    TieredLoader,
+    browser_memory,
+    is_blocked,
+    load_page,
+    process_tree_memory,
+    read_body,
+    site,
+)
+from . import loaders
+from .exceptions import BrowserPoolSaturated, LoaderException
+from .metrics import LOADER_TIERS
+
+RECIPE_PAGE = '<script type="application/ld+json">{"@type": "Recipe", "name": "Keitto"}</script>'
 
 
 def test_fileloader_not_throwing():
@@ -10,3 +41,265 @@ def test_textloader_returns_source():
     loader = TextLoader()
     result = loader.load("loaded content")
     assert result == "loaded content"
+
+
+def test_browserpool_raises_when_saturated():
+    pool = BrowserPool(size=0, max_waiting=0)
+    with pytest.raises(BrowserPoolSaturated) as e:
+        pool.load("https://example.com")
+    assert e.value.retry_after >= 1
+
+
+def test_browserloader_uses_pool():
+    BrowserLoader.pool = BrowserPool(size=0, max_waiting=0)
+    try:
+        with pytest.raises(BrowserPoolSaturated):
+            BrowserLoader.load("https://example.com")
+    finally:
+        BrowserLoader.pool = None
+
+
+def browser_request(url: str, resource_type: str, navigation: bool = False):
+    frame = SimpleNamespace(parent_frame=None)
+    return SimpleNamespace(
+        url=url,
+        resource_type=resource_type,
+        frame=frame,
+        is_navigation_request=lambda: navigation,
+    )
+
+
+def test_browser_pool_worker_survives_failures(monkeypatch):
+    starts = []
+
+    @contextmanager
+    def playwright():
+        starts.append(len(starts))
+        if len(starts) == 1:
+            raise RuntimeError("driver did not start")
+        yield SimpleNamespace()
+
+    def close():
+        raise RuntimeError("browser already closed")
+
+    browser = SimpleNamespace(is_connected=lambda: True, close=close)
+    monkeypatch.setattr(loaders, "sync_playwright", playwright)
+    monkeypatch.setattr(loaders, "launch_browser", lambda p: browser)
+    monkeypatch.setattr(loaders, "load_page", lambda browser, source: (source, 0))
+    monkeypatch.setattr(loaders, "WORKER_RESTART_DELAY", 0.01)
+
+    # recycled after every page, and closing the browser fails every time
+    pool = BrowserPool(size=1, max_pages=1, timeout=5)
+    pool.start()
+    try:
+        assert pool.load("https://example.com/a") == ("https://example.com/a", 0)
+        assert pool.load("https://example.com/b") == ("https://example.com/b", 0)
+    finally:
+        pool.stop()
+    assert len(starts) == 2
+
+
+def test_site():
+    assert site("https://www.example.com/recipe") == "example.com"
+    assert site("https://cdn.example.com/app.js") == "example.com"
+    assert site("https://www.google-analytics.com/analytics.js") == "google-analytics.com"
+
+
+def test_browser_blocks_heavy_and_third_party_requests():
+    source = "https://www.example.com/recipe"
+    assert not is_blocked(browser_request(source, "document", navigation=True), source)
+    assert not is_blocked(browser_request("https://cdn.example.com/app.js", "script"), source)
+    assert is_blocked(browser_request("https://cdn.example.com/hero.jpg", "image"), source)
+    assert is_blocked(browser_request("https://www.example.com/font.woff2", "font"), source)
+    assert is_blocked(browser_request("https://ads.example.net/ad.js", "script"), source)
+    # a redirect of the page itself to another domain is still followed
+    assert not is_blocked(
+        browser_request("https://example.co.uk/recipe", "document", navigation=True), source
+    )
+
+
+def test_load_page_without_recipe_stops_waiting():
+    waits = []
+
+    def wait_for_function(expression, arg, timeout):
+        waits.append((arg, timeout))
+        raise PlaywrightTimeoutError("timeout")
+
+    page = SimpleNamespace(
+        on=lambda event, handler: None,
+        goto=lambda source, wait_until, timeout: SimpleNamespace(ok=True, status=200),
+        wait_for_function=wait_for_function,
+        content=lambda: "<html></html>",
+    )
+    context = SimpleNamespace(
+        route=lambda pattern, handler: None, new_page=lambda: page, close=lambda: None
+    )
+    browser = SimpleNamespace(new_context=lambda **options: context)
+    # a page that never gets its recipe is returned as it is instead of failing
+    assert load_page(browser, "https://example.com/recipe") == ("<html></html>", 0)
+    assert waits[0][0] == 1000
+
+
+def test_load_page_rejects_error_status():
+    page = SimpleNamespace(
+        on=lambda event, handler: None,
+        goto=lambda source, wait_until, timeout: SimpleNamespace(ok=False, status=403),
+    )
+    context = SimpleNamespace(
+        route=lambda pattern, handler: None, new_page=lambda: page, close=lambda: None
+    )
+    browser = SimpleNamespace(new_context=lambda **options: context)
+    with pytest.raises(LoaderException, match="403"):
+        load_page(browser, "https://example.com/recipe")
+
+
+def test_process_tree_memory():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        assert process_tree_memory(os.getpid()) > process_tree_memory(child.pid) > 0
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_browser_memory(monkeypatch):
+    # the live process keeps allocating, so only the measured root is compared
+    monkeypatch.setattr(loaders, "process_tree_memory", lambda root: root)
+
+    def session(processes):
+        return SimpleNamespace(send=lambda method: {"processInfo": processes}, detach=lambda: None)
+
+    # only the tree of the browser process is measured, not every child of this process
+    browser = SimpleNamespace(
+        new_browser_cdp_session=lambda: session(
+            [{"type": "renderer", "id": 1}, {"type": "browser", "id": os.getpid()}]
+        )
+    )
+    assert browser_memory(browser) == os.getpid()
+    assert browser_memory(SimpleNamespace(new_browser_cdp_session=lambda: session([]))) == 0
+
+
+def mock_page(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/large":
+        return httpx.Response(200, content=b"x" * (MAX_DOWNLOAD_SIZE + 1))
+    if request.url.path == "/recipe":
+        return httpx.Response(200, text=RECIPE_PAGE)
+    if request.url.path == "/blocked":
+        return httpx.Response(403, text="<html>checking your browser</html>")
+    if request.url.path == "/missing":
+        return httpx.Response(404, text="<html>not found</html>")
+    body = gzip.compress("<h1>Kalakeitto ää</h1>".encode("utf-8"))
+    headers = {"content-encoding": "gzip", "content-type": "text/html; charset=utf-8"}
+    return httpx.Response(200, content=body, headers=headers)
+
+
+@pytest.fixture
+def mock_clients():
+    RequestLoader.client = httpx.Client(transport=httpx.MockTransport(mock_page))
+    RequestLoader.async_client = httpx.AsyncClient(transport=httpx.MockTransport(mock_page))
+    yield
+    asyncio.run(RequestLoader.close())
+
+
+def test_requestloader_decodes_compressed_page(mock_clients):
+    assert RequestLoader.load("https://example.com/page") == "<h1>Kalakeitto ää</h1>"
+
+
+def test_requestloader_reuses_client(mock_clients):
+    client = RequestLoader.client
+    RequestLoader.load("https://example.com/page")
+    RequestLoader.load("https://example.com/page")
+    assert RequestLoader.client is client
+
+
+def test_requestloader_rejects_large_page(mock_clients):
+    with pytest.raises(LoaderException):
+        RequestLoader.load("https://example.com/large")
+
+
+def test_requestloader_async(mock_clients):
+    page = asyncio.run(RequestLoader.aload("https://example.com/page"))
+    assert page == "<h1>Kalakeitto ää</h1>"
+    with pytest.raises(LoaderException):
+        asyncio.run(RequestLoader.aload("https://example.com/large"))
+
+
+def test_read_body_caps_streamed_size():
+    def chunks():
+        for _ in range(3):
+            yield b"x" * (MAX_DOWNLOAD_SIZE // 2)
+
+    request = httpx.Request("GET", "https://example.com/stream")
+    download = Download()
+    # no content-length, the cap has to hold while reading
+    with pytest.raises(LoaderException):
+        read_body(httpx.Response(200, content=chunks(), request=request), download)
+    assert download.size > MAX_DOWNLOAD_SIZE
+
+    download = Download()
+    response = httpx.Response(200, content=chunks(), request=request)
+    assert read_body(response, download, lambda chunk: True)
+    assert download.size == MAX_DOWNLOAD_SIZE // 2
+
+
+def test_requestloader_stops_at_recipe():
+    sent = []
+
+    def chunks():
+        for chunk in [b"<html><head>", RECIPE_PAGE.encode(), b"</head><body>", b"x" * 1000]:
+            sent.append(chunk)
+            yield chunk
+
+    RequestLoader.client = httpx.Client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+    )
+    try:
+        content, found = RequestLoader.load_until_recipe("https://example.com/recipe")
+    finally:
+        asyncio.run(RequestLoader.close())
+    assert found
+    assert content == "<html><head>" + RECIPE_PAGE
+    assert len(sent) == 2
+
+
+def test_requestloader_reads_full_page_without_recipe(mock_clients):
+    content, found = RequestLoader.load_until_recipe("https://example.com/page")
+    assert not found
+    assert content == "<h1>Kalakeitto ää</h1>"
+
+
+def test_tieredloader_skips_browser_for_static_recipe(mock_clients, monkeypatch):
+    browser_loads = []
+    monkeypatch.setattr(
+        BrowserLoader, "load", staticmethod(lambda source: browser_loads.append(source) or "")
+    )
+    recipes = LOADER_TIERS.value("http", "recipe")
+    assert TieredLoader.load("https://example.com/recipe") == RECIPE_PAGE
+    assert browser_loads == []
+    assert LOADER_TIERS.value("http", "recipe") == recipes + 1
+
+
+def test_tieredloader_falls_back_to_browser(mock_clients, monkeypatch):
+    monkeypatch.setattr(BrowserLoader, "load", staticmethod(lambda source: RECIPE_PAGE))
+    misses = LOADER_TIERS.value("http", "no_recipe")
+    blocked = LOADER_TIERS.value("http", "blocked")
+    assert TieredLoader.load("https://example.com/page") == RECIPE_PAGE
+    assert TieredLoader.load("https://example.com/blocked") == RECIPE_PAGE
+    assert LOADER_TIERS.value("http", "no_recipe") == misses + 1
+    assert LOADER_TIERS.value("http", "blocked") == blocked + 1
+
+
+def test_tieredloader_raises_without_browser(mock_clients, monkeypatch):
+    browser_loads = []
+    monkeypatch.setattr(
+        BrowserLoader, "load", staticmethod(lambda source: browser_loads.append(source) or "")
+    )
+    bad_status = LOADER_TIERS.value("http", "bad_status")
+    too_large = LOADER_TIERS.value("http", "too_large")
+    with pytest.raises(LoaderException, match="answered 404"):
+        TieredLoader.load("https://example.com/missing")
+    with pytest.raises(LoaderException, match="larger than"):
+        TieredLoader.load("https://example.com/large")
+    assert browser_loads == []
+    assert LOADER_TIERS.value("http", "bad_status") == bad_status + 1
+    assert LOADER_TIERS.value("http", "too_large") == too_large + 1
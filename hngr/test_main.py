@@ -1,6 +1,17 @@
+import time
+import json
+import asyncio
+import httpx
 from fastapi.testclient import TestClient
 
-from .main import app
+
+from . import main
+from .main import app, scrape_queue
+from .db import create_recipe, delete_recipe, retrieve_recipe
+from .exceptions import DatabaseBusy
+from .loaders import RequestLoader
+from .schemes import NewRecipe
+from .test_images import jpeg
 
 
 client = TestClient(app)
@@ -11,27 +22,176 @@ def test_index_loads():
     assert response.status_code == 200
 
 
+def test_metrics(populate_db):
+    client.get("/recipe/101")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'hngr_http_request_duration_seconds_count{method="GET",route="/recipe/{recipe_id}",status="200"}'
+        in response.text
+    )
+    assert 'hngr_db_query_duration_seconds_count{function="retrieve_recipe_version"}' in response.text
+
+
 def test_service_worker_loads():
     response = client.get("/service-worker.js")
     assert response.status_code == 200
 
 
+def wait_for_job(job_id: int) -> dict:
+    for _ in range(100):
+        job = client.get(f"/scrape/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"scrape job {job_id} did not finish")
+
+
 def test_scrape():
-    response = client.post("/scrape", data={"link": "mock"}, follow_redirects=False)
-    assert response.status_code == 303
+    response = client.post("/scrape", data={"link": "mock"})
+    assert response.status_code == 202
+    assert response.headers.get("location") == f"/scrape/{response.json()['id']}"
+    job = wait_for_job(response.json()["id"])
+    assert job["status"] == "done"
+    assert job["recipe_id"]
+    response = client.get(f"/scrape/{job['id']}", headers={"HX-Request": "true"})
+    assert response.headers.get("hx-redirect") == f"/recipe/{job['recipe_id']}/edit"
+
+
+def test_scrape_htmx_returns_polling_fragment():
+    response = client.post(
+        "/scrape", data={"link": "htmxsource.com"}, headers={"HX-Request": "true"}
+    )
+    assert response.status_code == 202
+    assert "text/html" in response.headers.get("content-type")
+    assert f'hx-get="{response.headers["location"]}"' in response.text
+
+
+def test_scrape_known_source():
+    response = client.post("/scrape", data={"link": "mock"})
+    if response.status_code == 202:
+        wait_for_job(response.json()["id"])
+
+    response = client.post("/scrape", data={"link": "mock?again"})
+    assert response.status_code == 200
+    assert response.json()["recipe_id"]
+    assert response.headers.get("location") == f"/recipe/{response.json()['recipe_id']}"
+
+    response = client.post("/scrape", data={"link": "mock"}, headers={"HX-Request": "true"})
+    assert response.status_code == 200
+    assert response.headers.get("hx-redirect", "").startswith("/recipe/")
 
 
 def test_scrape_invalidsource():
     response = client.post("/scrape", data={"link": "invalidsource.com"})
+    job = wait_for_job(response.json()["id"])
+    assert job["status"] == "failed"
+    response = client.get(f"/scrape/{job['id']}", headers={"HX-Request": "true"})
     assert response.status_code == 400
     assert "text/html" in response.headers.get("content-type")
 
 
+def test_scrape_events():
+    response = client.post("/scrape", data={"link": "eventssource.com"})
+    with client.stream("GET", f"/scrape/{response.json()['id']}/events") as events:
+        lines = [line for line in events.iter_lines() if line.startswith("data:")]
+    assert lines
+    assert '"status":"done"' in lines[-1] or '"status":"failed"' in lines[-1]
+
+
+def test_scrape_status_not_found():
+    response = client.get("/scrape/999999")
+    assert response.status_code == 404
+
+
+def test_scrape_queue_full():
+    max_queued = scrape_queue.max_queued
+    scrape_queue.max_queued = 0
+    try:
+        response = client.post("/scrape", data={"link": "queuefullsource.com"})
+    finally:
+        scrape_queue.max_queued = max_queued
+    assert response.status_code == 429
+    assert response.headers.get("retry-after")
+
+
 def test_recipe_loads():
     response = client.get("/recipe/101")
     assert response.status_code == 200
 
 
+def test_recipe_not_found():
+    response = client.get("/recipe/999")
+    assert response.status_code == 404
+
+
+def test_recipe_not_modified():
+    response = client.get("/recipe/101")
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    assert etag
+    assert last_modified
+    assert response.headers.get("cache-control") == "no-cache"
+
+    response = client.get("/recipe/101", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers.get("etag") == etag
+    assert not response.content
+
+    response = client.get("/recipe/101", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    response = client.get("/recipe/101", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_recipe_modified_after_edit():
+    etag = client.get("/recipe/101").headers.get("etag")
+    recipe = client.get("/api/recipes", params={"limit": 500}).json()["data"]
+    recipe = next(item for item in recipe if item["id"] == 101)
+    client.post(
+        "/recipe/101/edit",
+        data={
+            "name": recipe["name"],
+            "description": "Edited description",
+            "directions": "Test directions",
+            "ingredients": "Test ingredients",
+        },
+        follow_redirects=False,
+    )
+    response = client.get("/recipe/101", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers.get("etag") != etag
+
+
+def test_recipe_render_cache():
+    main.render_cache.clear()
+    first = client.get("/recipe/101").text
+    stats = client.get("/api/render-cache").json()
+    assert client.get("/recipe/101").text == first
+    assert client.get("/api/render-cache").json()["hits"] == stats["hits"] + 1
+
+    client.post(
+        "/recipe/101/edit",
+        data={
+            "name": "Load recipe in main route",
+            "description": "Cached description",
+            "directions": "Test directions",
+            "ingredients": "Test ingredients",
+        },
+        follow_redirects=False,
+    )
+    assert client.get("/api/render-cache").json()["entries"] == 0
+    assert "Cached description" in client.get("/recipe/101").text
+
+
+def test_index_not_modified():
+    etag = client.get("/").headers.get("etag")
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
 def test_recipe_delete_non_existant():
     response = client.delete("/recipe/999")
     assert response.status_code == 404
@@ -92,3 +252,286 @@ def test_api_list_recipes():
     recipes = response.json()
     assert "data" in recipes
     assert len(recipes["data"]) > 0
+
+
+def test_api_list_recipes_not_modified():
+    etag = client.get("/api/recipes").headers.get("etag")
+    assert etag
+    response = client.get("/api/recipes", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get("/api/recipes/all", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_api_list_recipe_changes():
+    since = client.get("/api/recipes/changes").json()["next"]
+    response = client.post(
+        "/new-recipe/edit",
+        data={
+            "name": "Changed recipe",
+            "description": "Test description",
+            "directions": "Test directions",
+            "ingredients": "Test ingredients",
+        },
+        follow_redirects=False,
+    )
+    recipe_id = int(response.headers["location"].split("/")[-1])
+    changes = client.get("/api/recipes/changes", params={"since": since}).json()
+    assert changes["updated"] == [recipe_id]
+
+    client.delete(f"/recipe/{recipe_id}")
+    changes = client.get("/api/recipes/changes", params={"since": changes["next"]}).json()
+    assert changes["updated"] == []
+    assert changes["deleted"] == [recipe_id]
+
+
+def test_api_list_recipes_paginated():
+    first = client.get("/api/recipes", params={"limit": 1}).json()
+    assert len(first["data"]) == 1
+    assert first["next"]
+    second = client.get("/api/recipes", params={"limit": 1, "cursor": first["next"]}).json()
+    assert second["data"][0]["id"] != first["data"][0]["id"]
+
+
+def test_api_list_recipes_fields():
+    recipes = client.get("/api/recipes", params={"fields": "source,id,source"}).json()["data"]
+    assert recipes
+    assert all(list(recipe) == ["source", "id"] for recipe in recipes)
+    response = client.get("/api/recipes", params={"fields": "id,password"})
+    assert response.status_code == 400
+
+
+def test_api_retrieve_recipe(populate_db):
+    response = client.get("/api/recipes/101")
+    assert response.status_code == 200
+    recipe = response.json()
+    assert recipe["id"] == 101
+    assert "ingredients" in recipe
+    assert response.headers["etag"]
+
+    response = client.get("/api/recipes/101", params={"fields": "name,version"})
+    assert response.json() == {"name": recipe["name"], "version": recipe["version"]}
+    etag = response.headers["etag"]
+    response = client.get(
+        "/api/recipes/101", params={"fields": "name,version"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    response = client.get("/api/recipes/101", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    assert client.get("/api/recipes/999").status_code == 404
+    assert client.get("/api/recipes/101", params={"fields": "secret"}).status_code == 400
+
+
+def test_database_busy(monkeypatch):
+    async def busy(fn, *args):
+        raise DatabaseBusy(retry_after=1)
+
+    monkeypatch.setattr(main.pool, "read", busy)
+    for url in ["/", "/api/recipes", "/recipe/101"]:
+        response = client.get(url)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+
+def test_api_list_recipes_invalid_cursor():
+    response = client.get("/api/recipes", params={"cursor": "broken"})
+    assert response.status_code == 400
+
+
+def test_api_list_all_recipes(monkeypatch):
+    expected = client.get("/api/recipes/all").json()["data"]
+    # one recipe per batch, so the stream has to follow the keyset across batches
+    monkeypatch.setattr(main, "API_MAX_PAGE_SIZE", 1)
+    response = client.get("/api/recipes/all")
+    assert response.status_code == 200
+    assert response.json()["data"] == expected
+    assert len(expected) > 1
+
+
+def test_api_recipes_bundle(monkeypatch):
+    expected = [recipe["id"] for recipe in client.get("/api/recipes/all").json()["data"]]
+    # one recipe per batch, so the stream has to follow the keyset across batches
+    monkeypatch.setattr(main, "API_MAX_PAGE_SIZE", 1)
+    response = client.get("/api/recipes/bundle", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == "gzip"
+    pages = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(page["id"] for page in pages) == sorted(expected)
+
+    page = next(page for page in pages if page["id"] == 101)
+    assert page["url"] == "/recipe/101"
+    recipe = client.get("/recipe/101")
+    assert page["headers"]["ETag"] == recipe.headers.get("etag")
+    assert page["html"] == recipe.text
+
+
+def test_api_recipes_bundle_ids():
+    response = client.get(
+        "/api/recipes/bundle", params={"ids": "101,999"}, headers={"Accept-Encoding": ""}
+    )
+    assert response.status_code == 200
+    assert not response.headers.get("content-encoding")
+    pages = [json.loads(line) for line in response.text.splitlines()]
+    assert [page["id"] for page in pages] == [101]
+
+
+def test_api_recipes_bundle_invalid_ids():
+    response = client.get("/api/recipes/bundle", params={"ids": "1,a"})
+    assert response.status_code == 400
+
+
+def test_image(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.image_store, "directory", str(tmp_path))
+    name = f"{'0' * 32}-320.webp"
+    (tmp_path / name).write_bytes(b"webp")
+    response = client.get(f"/images/{name}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+
+    assert client.get(f"/images/{'0' * 32}-640.webp").status_code == 404
+    assert client.get("/images/recipe.html").status_code == 404
+
+
+def test_image_retried_from_cached_page(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.image_store, "directory", str(tmp_path))
+    monkeypatch.setattr(main.image_queue, "retry_delay", 0)
+    fetches = []
+
+    def load_bytes(source: str):
+        fetches.append(source)
+        if len(fetches) == 1:
+            raise httpx.ConnectError("connection reset")
+        return jpeg(400, 300), "image/jpeg"
+
+    monkeypatch.setattr(RequestLoader, "load_bytes", load_bytes)
+    with main.pool.writer() as connection:
+        recipe_id = create_recipe(
+            connection,
+            NewRecipe(
+                name="Retried image",
+                description="",
+                directions="",
+                ingredients="",
+                source="retried image source",
+                image="https://example.com/retried.jpg",
+            ),
+        )
+
+    def fetched(count: int):
+        for _ in range(100):
+            if len(fetches) >= count and recipe_id not in main.image_queue._queued:
+                break
+            time.sleep(0.05)
+        with main.pool.reader() as connection:
+            return retrieve_recipe(connection, recipe_id)
+
+    try:
+        etag = client.get(f"/recipe/{recipe_id}").headers["etag"]
+        assert fetched(1).image_hash is None
+        # the page comes from the render cache now, the retry must not depend on a render
+        response = client.get(f"/recipe/{recipe_id}")
+        assert response.headers["etag"] == etag
+        assert fetched(2).image_hash
+        assert client.get(f"/recipe/{recipe_id}").headers["etag"] != etag
+    finally:
+        with main.pool.writer() as connection:
+            delete_recipe(connection, recipe_id)
+
+
+def test_api_recipes_by_ingredients():
+    response = client.post(
+        "/new-recipe/edit",
+        data={
+            "name": "Salsify soup",
+            "description": "",
+            "directions": "",
+            "ingredients": "4 salsify roots\n1 l stock",
+        },
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+
+    response = client.get("/api/recipes/by-ingredients", params={"items": "salsify root,stock"})
+    assert response.status_code == 200
+    assert response.json()[0]["name"] == "Salsify soup"
+    assert response.json()[0]["matched"] == 2
+
+
+def test_api_recipes_by_ingredients_invalid():
+    response = client.get("/api/recipes/by-ingredients", params={"items": ","})
+    assert response.status_code == 400
+
+
+def test_recipes_page():
+    first = client.get("/api/recipes", params={"limit": 1}).json()
+    response = client.get("/recipes", params={"cursor": first["next"]})
+    assert response.status_code == 200
+    assert "<li>" in response.text
+
+
+def test_api_import():
+    response = client.post("/api/import", json={"links": ["mock", "mock"], "parallelism": 2})
+    assert response.status_code == 200
+    report = response.json()
+    assert len(report["results"]) == 2
+    assert "duplicate" in [result["status"] for result in report["results"]]
+
+
+def test_api_import_too_many_links(monkeypatch):
+    monkeypatch.setattr(main, "IMPORT_MAX_LINKS", 2)
+    response = client.post("/api/import", json={"links": ["mock", "mock", "mock"]})
+    assert response.status_code == 422
+
+
+def test_routes_do_not_block_event_loop(populate_db):
+    async def run():
+        lags = []
+
+        async def tick():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - started - 0.01)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            ticker = asyncio.create_task(tick())
+            slow_write = main.pool.write(lambda connection: time.sleep(0.3))
+            responses = await asyncio.gather(
+                *[client.get("/api/recipes") for _ in range(20)],
+                *[client.get("/recipe/101") for _ in range(20)],
+                slow_write,
+            )
+            ticker.cancel()
+        return lags, responses[:-1]
+
+    lags, responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert max(lags) < 0.1
+
+
+def test_profile_request(populate_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(main.profile_store, "directory", str(tmp_path))
+    monkeypatch.setattr(main.profile_store, "token", "secret")
+
+    response = client.post("/search", data={"term": "test"}, headers={"X-Profile": "1"})
+    assert "x-profile" not in response.headers
+
+    headers = {"X-Profile-Token": "secret"}
+    response = client.post("/search?profile=1", data={"term": "test"}, headers=headers)
+    name = response.headers.get("x-profile")
+    assert name
+
+    profiles = client.get("/admin/profiles", headers=headers).json()
+    assert [profile["name"] for profile in profiles] == [name]
+    response = client.get(f"/admin/profiles/{name}", headers=headers)
+    assert response.status_code == 200
+    assert client.get("/admin/profiles/missing", headers=headers).status_code == 404
+
+
+def test_profile_admin_requires_token(monkeypatch):
+    monkeypatch.setattr(main.profile_store, "token", "secret")
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Profile-Token": "no"}).status_code == 403
@@ -0,0 +1,46 @@
+from .metrics import Counter, Histogram, instrumented, registry, DB_QUERY_SECONDS
+
+
+def test_counter():
+    counter = Counter("test_counter_total", "A test counter", ("outcome",))
+    registry.remove(counter)
+    counter.inc("success")
+    counter.inc("success", amount=2)
+    assert counter.value("success") == 3
+    assert counter.render() == [
+        "# HELP test_counter_total A test counter",
+        "# TYPE test_counter_total counter",
+        'test_counter_total{outcome="success"} 3',
+    ]
+
+
+def test_histogram():
+    histogram = Histogram("test_seconds", "A test histogram", ("route",), buckets=[0.1, 1])
+    registry.remove(histogram)
+    histogram.observe(0.05, "/")
+    histogram.observe(0.1, "/")
+    histogram.observe(5, "/")
+    assert histogram.count("/") == 3
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{route="/",le="0.1"} 2',
+        'test_seconds_bucket{route="/",le="1"} 2',
+        'test_seconds_bucket{route="/",le="+Inf"} 3',
+        'test_seconds_sum{route="/"} 5.15',
+        'test_seconds_count{route="/"} 3',
+    ]
+
+
+def test_histogram_escapes_labels():
+    histogram = Histogram("test_escape_seconds", "", ("domain",), buckets=[1])
+    registry.remove(histogram)
+    histogram.observe(0.5, 'a"b\\c')
+    assert 'domain="a\\"b\\\\c"' in histogram.render()[2]
+
+
+def test_instrumented():
+    @instrumented
+    def test_query():
+        return 1
+
+    assert test_query() == 1
+    assert DB_QUERY_SECONDS.count("test_query") == 1
@@ -0,0 +1,157 @@
+import os
+import time
+import threading
+import httpx
+import pytest
+
+from .exceptions import LoaderException
+from .loaders import BrowserLoader, Loader, RequestLoader, TieredLoader
+from .pagecache import CachedLoader, PageCache
+from .parsers import ParserFactory, SchemaParser
+
+
+class CountingLoader(Loader):
+    calls = 0
+
+    @staticmethod
+    def load(source: str) -> str:
+        CountingLoader.calls += 1
+        time.sleep(0.05)
+        return f"<html>{source}</html>"
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    CountingLoader.calls = 0
+
+
+def test_pagecache_keys_on_clean_url(tmp_path):
+    loader = CachedLoader(CountingLoader, PageCache(str(tmp_path)))
+    first = loader.load("https://example.com/soup?utm=1")
+    assert loader.load("https://example.com/soup") == first
+    assert CountingLoader.calls == 1
+
+
+def test_pagecache_coalesces_concurrent_loads(tmp_path):
+    loader = CachedLoader(CountingLoader, PageCache(str(tmp_path)))
+    threads = [
+        threading.Thread(target=loader.load, args=["https://example.com/stew"]) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert CountingLoader.calls == 1
+
+
+def test_pagecache_expires(tmp_path):
+    loader = CachedLoader(CountingLoader, PageCache(str(tmp_path), ttl=0))
+    loader.load("https://example.com/pie")
+    loader.load("https://example.com/pie")
+    assert CountingLoader.calls == 2
+
+
+def test_pagecache_evicts_least_recently_used(tmp_path):
+    cache = PageCache(str(tmp_path), max_size=10_000)
+    cache.put("https://example.com/old", os.urandom(4000).hex())
+    cache.put("https://example.com/new", os.urandom(4000).hex())
+    old_path, _ = cache._paths("https://example.com/old")
+    os.utime(old_path, (0, 0))
+    cache.put("https://example.com/newest", os.urandom(4000).hex())
+    assert cache.get("https://example.com/old") is None
+    assert cache.get("https://example.com/new")
+    assert cache.get("https://example.com/newest")
+
+
+def test_pagecache_offline(tmp_path):
+    cache = PageCache(str(tmp_path), ttl=0)
+    cache.put("https://example.com/cached", "<html>cached</html>")
+    offline = CachedLoader(CountingLoader, PageCache(str(tmp_path), offline=True))
+    assert offline.load("https://example.com/cached") == "<html>cached</html>"
+    with pytest.raises(LoaderException):
+        offline.load("https://example.com/missing")
+    assert CountingLoader.calls == 0
+
+
+def test_pagecache_revalidates_with_etag(tmp_path):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text="<html>fresh</html>", headers={"etag": '"v1"'})
+
+    RequestLoader.client = httpx.Client(transport=httpx.MockTransport(handler))
+    try:
+        loader = CachedLoader(RequestLoader, PageCache(str(tmp_path), ttl=0))
+        assert loader.load("https://example.com/page") == "<html>fresh</html>"
+        assert loader.load("https://example.com/page") == "<html>fresh</html>"
+    finally:
+        RequestLoader.client.close()
+        RequestLoader.client = None
+    assert [r.headers.get("if-none-match") for r in requests] == [None, '"v1"']
+
+
+def test_pagecache_skips_error_responses(tmp_path):
+    statuses = [503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(statuses.pop(0), text="<html>page</html>")
+
+    RequestLoader.client = httpx.Client(transport=httpx.MockTransport(handler))
+    try:
+        cache = PageCache(str(tmp_path))
+        loader = CachedLoader(RequestLoader, cache)
+        loader.load("https://example.com/busy")
+        assert cache.get("https://example.com/busy") is None
+        loader.load("https://example.com/busy")
+        cached = cache.get("https://example.com/busy")
+    finally:
+        RequestLoader.client.close()
+        RequestLoader.client = None
+    assert statuses == []
+    assert cached and cached[0].status == 200
+
+
+def test_pagecache_refetches_stored_error(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("https://example.com/error", "<html>error</html>", status=429)
+    loader = CachedLoader(CountingLoader, cache)
+    assert loader.load("https://example.com/error") == "<html>https://example.com/error</html>"
+    assert CountingLoader.calls == 1
+
+
+def test_pagecache_skips_tiered_error_pages(tmp_path, monkeypatch):
+    browser_loads = []
+
+    def browser_load(source: str) -> str:
+        browser_loads.append(source)
+        raise LoaderException(f"{source} answered 403")
+
+    monkeypatch.setattr(BrowserLoader, "load", staticmethod(browser_load))
+    RequestLoader.client = httpx.Client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(403, text="<html></html>"))
+    )
+    cache = PageCache(str(tmp_path))
+    loader = CachedLoader(TieredLoader, cache)
+    try:
+        for _ in range(2):
+            with pytest.raises(LoaderException):
+                loader.load("https://example.com/blocked")
+    finally:
+        RequestLoader.client.close()
+        RequestLoader.client = None
+    # nothing stored, so the second load went all the way to the browser again
+    assert len(browser_loads) == 2
+    assert cache.get("https://example.com/blocked") is None
+
+
+def test_factory_uses_cache(tmp_path):
+    ParserFactory.cache = PageCache(str(tmp_path))
+    try:
+        parser = ParserFactory.get_parser("https://example.com/recipe")
+    finally:
+        ParserFactory.cache = None
+    assert type(parser) == SchemaParser
+    assert isinstance(parser.loader, CachedLoader)
@@ -0,0 +1,65 @@
+import time
+import pytest
+
+from .exceptions import ParserException
+from .loaders import FileLoader
+from .parsepool import ParsePool, parse_in_worker
+from .parsers import BbcgoodfoodParser, ParserFactory, SchemaParser
+
+
+@pytest.fixture(scope="module")
+def parse_pool():
+    pool = ParsePool(workers=1, timeout=30)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def test_parse_pool_matches_thread_parse(parse_pool):
+    data = FileLoader.load("./mocks/bbcgoodfood.html")
+    expected = BbcgoodfoodParser(url="bbcgoodfood", loader=FileLoader).parse_data(data)
+    assert parse_pool.parse("BbcgoodfoodParser", "bbcgoodfood", data) == expected
+
+
+def test_parse_pool_returns_parser_errors(parse_pool):
+    with pytest.raises(ParserException):
+        parse_pool.parse("SchemaParser", "empty", "<html></html>")
+
+
+def test_parse_pool_rejects_large_pages():
+    pool = ParsePool(workers=1, max_size=10)
+    with pytest.raises(ParserException, match="larger than 10 bytes"):
+        pool.parse("SchemaParser", "large", "<html></html>")
+
+
+def test_parser_uses_pool(parse_pool):
+    ParserFactory.pool = parse_pool
+    try:
+        recipe = SchemaParser(url="./mocks/kruoka.html", loader=FileLoader).parse()
+    finally:
+        ParserFactory.pool = None
+    assert recipe.name == "Helppo kalakeitto"
+    assert recipe.source == "./mocks/kruoka.html"
+
+
+def test_parse_in_worker_times_out():
+    data = FileLoader.load("./mocks/bbcgoodfood.html").encode("utf-8")
+    with pytest.raises(ParserException, match="too long"):
+        parse_in_worker("BbcgoodfoodParser", "bbcgoodfood", data * 20, 0.001)
+
+
+def test_parse_pool_reset_stops_hung_worker():
+    pool = ParsePool(workers=1)
+    pool.start()
+    executor = pool._get_executor()
+    processes = list(executor._processes.values())
+    hung = executor.submit(time.sleep, 60)
+    for _ in range(50):
+        if hung.running():
+            break
+        time.sleep(0.02)
+
+    pool._reset(executor)
+    assert not any(process.is_alive() for process in processes)
+    assert pool._get_executor() is not executor
+    pool.stop()
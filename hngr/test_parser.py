@@ -1,4 +1,5 @@
 import json
+import time
 import pytest
 
 from hngr.exceptions import ParserException
@@ -13,8 +14,10 @@ from .parsers import (
     remove_whitespace,
     clean_url,
 )
-from .loaders import FileLoader, TextLoader
+from .loaders import FileLoader, Loader, TextLoader, TieredLoader
+from .metrics import PARSE_SECONDS
 from .schemes import NewRecipe
+from .urls import canonical_url
 
 
 def test_factory_mock():
@@ -40,6 +43,7 @@ def test_factory_kruoka():
 def test_factory_default_parser():
     parser = ParserFactory.get_parser("shouldwecheckforurlhere")
     assert type(parser) == SchemaParser
+    assert parser.loader == TieredLoader
 
 
 def test_delish():
@@ -141,6 +145,15 @@ def test_cleanurl():
     assert clean_url("https://example.com/recipe?a=1&b=2") == "https://example.com/recipe"
 
 
+def test_canonical_url():
+    assert canonical_url("https://example.com/recipe") == "https://example.com/recipe"
+    assert canonical_url("http://www.Example.COM/recipe/") == "https://example.com/recipe"
+    assert canonical_url("https://example.com//recipe?a=1#b") == "https://example.com/recipe"
+    assert canonical_url("https://example.com:443/Recipe") == "https://example.com/Recipe"
+    assert canonical_url("http://example.com:8080/recipe") == "https://example.com:8080/recipe"
+    assert canonical_url("") == ""
+
+
 def test_schema_parser_with_graph():
     data = {
         "@graph": [
@@ -183,3 +196,17 @@ def test_schema_parser_with_dictionary():
     assert recipe.directions == "Instructions"
     assert recipe.ingredients == "Ingredients"
     assert recipe.image == "imageurl"
+
+
+class SlowLoader(Loader):
+
+    @staticmethod
+    def load(source: str) -> str:
+        time.sleep(0.2)
+        return FileLoader.load(source)
+
+
+def test_parse_seconds_excludes_load():
+    before = PARSE_SECONDS._series.get(("KruokaParser",), [0.0])[-1]
+    KruokaParser(url="./mocks/kruoka.html", loader=SlowLoader).parse()
+    assert PARSE_SECONDS._series[("KruokaParser",)][-1] - before < 0.2
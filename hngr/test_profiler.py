@@ -0,0 +1,77 @@
+import os
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiler import Profiler, ProfileStore, current_profiler, profiled
+
+
+def busy_recipe_work(until: float):
+    while time.perf_counter() < until:
+        pass
+
+
+def test_profiler_samples_threads():
+    thread = threading.Thread(target=busy_recipe_work, args=(time.perf_counter() + 0.2,))
+    profiler = Profiler(interval=0.001)
+    profiler.start()
+    thread.start()
+    thread.join()
+    samples = profiler.stop()
+    assert any("busy_recipe_work (test_profiler.py" in stack for stack in samples)
+
+
+def test_profiler_only_given_threads():
+    profiler = Profiler(interval=0.001, thread_ids={threading.get_ident()})
+    profiler.start()
+    thread = threading.Thread(target=busy_recipe_work, args=(time.perf_counter() + 0.1,))
+    thread.start()
+    thread.join()
+    samples = profiler.stop()
+    assert not any("busy_recipe_work" in stack for stack in samples)
+
+
+def test_profiler_follows_profiled_work():
+    profiler = Profiler(interval=0.001, thread_ids={threading.get_ident()})
+    token = current_profiler.set(profiler)
+    profiler.start()
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(profiled(busy_recipe_work), time.perf_counter() + 0.1).result()
+            # the same thread is not sampled once the profiled work is done
+            executor.submit(idle_recipe_work, time.perf_counter() + 0.1).result()
+    finally:
+        current_profiler.reset(token)
+    samples = profiler.stop()
+    assert any("busy_recipe_work" in stack for stack in samples)
+    assert not any("idle_recipe_work" in stack for stack in samples)
+    assert profiler.thread_ids == {threading.get_ident()}
+
+
+def idle_recipe_work(until: float):
+    while time.perf_counter() < until:
+        time.sleep(0.001)
+
+
+def test_profile_store(tmp_path):
+    store = ProfileStore(str(tmp_path), token="secret", max_files=2)
+    for i in range(3):
+        store.save(f"profile-{i}", Counter({"MainThread;main (main.py:1)": i + 1}))
+        os.utime(tmp_path / f"profile-{i}.folded", (i, i))
+    store.save("profile-3", Counter({"MainThread;main (main.py:1)": 4}))
+
+    names = [profile.name for profile in store.list()]
+    assert names == ["profile-3", "profile-2"]
+    path = store.path("profile-3")
+    assert path
+    with open(path) as reader:
+        assert reader.read() == "MainThread;main (main.py:1) 4\n"
+    assert store.path("../profile-3") is None
+
+
+def test_profile_store_authorization():
+    assert ProfileStore("profiles", token="secret").is_authorized("secret")
+    assert not ProfileStore("profiles", token="secret").is_authorized("wrong")
+    assert not ProfileStore("profiles", token="secret").is_authorized(None)
+    assert not ProfileStore("profiles").is_authorized("")
@@ -0,0 +1,43 @@
+from .rendercache import RenderCache
+
+
+def test_render_cache_hits_and_misses():
+    cache = RenderCache()
+    assert cache.get("recipe", 1, 1) is None
+    cache.put("recipe", 1, 1, "<p>recipe</p>")
+    assert cache.get("recipe", 1, 1) == "<p>recipe</p>"
+    assert cache.get("recipe", 1, 2) is None
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 2
+    assert stats.entries == 1
+    assert stats.size == len("<p>recipe</p>")
+
+
+def test_render_cache_evicts_least_recently_used():
+    cache = RenderCache(max_size=10)
+    cache.put("recipe", 1, 1, "a" * 4)
+    cache.put("recipe", 2, 1, "b" * 4)
+    assert cache.get("recipe", 1, 1)
+    cache.put("recipe", 3, 1, "c" * 4)
+    assert cache.get("recipe", 2, 1) is None
+    assert cache.get("recipe", 1, 1)
+    assert cache.get("recipe", 3, 1)
+    assert cache.stats().size == 8
+
+    cache.put("recipe", 4, 1, "d" * 11)
+    assert cache.get("recipe", 4, 1) is None
+    assert cache.stats().entries == 2
+
+
+def test_render_cache_invalidate():
+    cache = RenderCache()
+    cache.put("recipe", 1, 1, "one")
+    cache.put("recipe", 2, 1, "two")
+    cache.put("index", 0, 5, "index")
+    cache.invalidate(1)
+    assert cache.get("recipe", 1, 1) is None
+    assert cache.get("index", 0, 5) is None
+    assert cache.get("recipe", 2, 1) == "two"
+    assert cache.stats().size == 3
@@ -0,0 +1,18 @@
+import re
+from urllib.parse import urlparse, urljoin, urlunparse
+
+
+def clean_url(s: str) -> str:
+    parsed = urlparse(s)
+    return urljoin(s, parsed.path)
+
+
+def canonical_url(s: str) -> str:
+    # identifies a page for duplicate checks, not meant to be fetched
+    parsed = urlparse(s.strip())
+    host = (parsed.hostname or "").removeprefix("www.")
+    if parsed.port and parsed.port not in (80, 443):
+        host += f":{parsed.port}"
+    scheme = "https" if parsed.scheme.lower() == "http" else parsed.scheme.lower()
+    path = re.sub(r"/{2,}", "/", parsed.path).rstrip("/")
+    return urlunparse((scheme, host, path, "", "", ""))